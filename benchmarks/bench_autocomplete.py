@@ -0,0 +1,47 @@
+import os
+import random
+import time
+import tracemalloc
+from django.test import SimpleTestCase
+from shop.autocomplete import PrefixIndex
+
+NAMES = int(os.environ.get('BENCH_NAMES', 100_000))
+LOOKUPS = int(os.environ.get('BENCH_LOOKUPS', 20_000))
+SYLLABLES = ['da', 'hong', 'pao', 'long', 'jing', 'bai', 'mu', 'dan',
+             'té', 'vert', 'noir', 'mat', 'cha', 'puer', 'shu', 'sheng',
+             'oo', 'long', 'ass', 'am', 'dar', 'jee', 'ling', 'yin', 'zhen']
+
+
+def synthetic_entries(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        words = [''.join(rng.choices(SYLLABLES, k=rng.randint(1, 3)))
+                 for _ in range(rng.randint(1, 4))]
+        name = ' '.join(words).title()
+        yield name, f'/{i}/{i}/', 'product', rng.randint(0, 10_000)
+
+
+class AutocompleteBenchmark(SimpleTestCase):
+
+    def test_lookup_latency_and_memory(self):
+        entries = list(synthetic_entries(NAMES))
+        start = time.perf_counter()
+        PrefixIndex(entries)
+        build = time.perf_counter() - start
+        # tracemalloc slows the build down, so memory is a separate pass
+        tracemalloc.start()
+        index = PrefixIndex(entries)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'\nprefix index: {NAMES:,} names, {len(index.keys):,} keys, '
+              f'built in {build:.2f}s, {memory / 2 ** 20:.1f} MiB')
+
+        rng = random.Random(1)
+        names = [name for name, _, _, _ in entries]
+        for length in (1, 2, 3, 4, 6):
+            queries = [rng.choice(names)[:length] for _ in range(LOOKUPS)]
+            start = time.perf_counter()
+            for query in queries:
+                index.lookup(query, 10)
+            elapsed = (time.perf_counter() - start) / LOOKUPS * 1e6
+            print(f'  prefix length {length}: {elapsed:7.1f} us/lookup')
@@ -0,0 +1,63 @@
+import os
+import time
+from unittest import skipUnless
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+from config.pooled_postgresql.base import close_pools
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 500))
+# a running PostgreSQL, e.g. the compose db service:
+#   BENCH_PG_HOST=127.0.0.1 BENCH_PG_PORT=5433
+PG = {
+    'NAME': os.environ.get('BENCH_PG_NAME', 'shop'),
+    'USER': os.environ.get('BENCH_PG_USER', 'shop'),
+    'PASSWORD': os.environ.get('BENCH_PG_PASSWORD', 'shop123'),
+    'HOST': os.environ.get('BENCH_PG_HOST', ''),
+    'PORT': os.environ.get('BENCH_PG_PORT', '5432'),
+}
+
+
+@skipUnless(PG['HOST'], 'set BENCH_PG_HOST to a PostgreSQL server')
+class ConnectionPoolBenchmark(SimpleTestCase):
+
+    def test_per_request_connection_overhead(self):
+        handler = ConnectionHandler({
+            # a handler needs a 'default', it is the unpooled backend
+            'default': {**PG, 'ENGINE': 'django.db.backends.postgresql'},
+            'pooled': {**PG, 'ENGINE': 'config.pooled_postgresql',
+                       'OPTIONS': {'pool': {'max_size': 1}}},
+        })
+
+        def run(alias):
+            # what a request does with CONN_MAX_AGE=0: connect on the
+            # first query, close when request_finished fires
+            wrapper = handler[alias]
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close()
+            return (time.perf_counter() - start) / REQUESTS * 1e6
+
+        def query_only(alias):
+            wrapper = handler[alias]
+            wrapper.ensure_connection()
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            elapsed = (time.perf_counter() - start) / REQUESTS * 1e6
+            wrapper.close()
+            return elapsed
+
+        run('pooled')  # warm the pool
+        query = query_only('default')
+        print(f'\n{REQUESTS} requests of one query to {PG["HOST"]}, '
+              f'us per request:')
+        print(f'  query on an open connection  {query:8.1f}')
+        for label, alias in (('new connection per request', 'default'),
+                             ('pooled', 'pooled')):
+            micros = run(alias)
+            print(f'  {label:28} {micros:8.1f}  '
+                  f'(connection overhead {micros - query:8.1f})')
+        close_pools(PG['NAME'])
@@ -0,0 +1,82 @@
+import os
+import random
+import time
+from decimal import Decimal
+from unittest.mock import Mock
+from django.test import SimpleTestCase
+from cart.cart import Cart, stored_cents
+from shop.money import Money, format_cents
+
+LINES = int(os.environ.get('BENCH_CART_LINES', 1_000))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 200))
+
+
+def decimal_total(cart):
+    # Cart.get_total_price() before integer cents
+    return sum(Decimal(item['price']) * item['quantity']
+               for item in cart.values())
+
+
+def decimal_lines(cart, render=False):
+    # the price work of Cart.__iter__() before integer cents
+    for item in cart.values():
+        item = dict(item)
+        item['price'] = Decimal(item['price'])
+        item['total_price'] = item['price'] * item['quantity']
+        if render:
+            str(item['price']), str(item['total_price'])
+
+
+def money_lines(cart, render=False):
+    # the same in Cart.__iter__() now
+    for item in cart.values():
+        item = dict(item)
+        cents = item['price']
+        if type(cents) is not int:
+            cents = stored_cents(item)
+        item['price_cents'] = cents
+        item['price'] = format_cents(cents)
+        item['total_price'] = format_cents(cents * item['quantity'])
+        if render:
+            str(item['price']), str(item['total_price'])
+
+
+class MoneyBenchmark(SimpleTestCase):
+
+    def test_large_cart_total(self):
+        rng = random.Random(45)
+        prices = [Decimal(rng.randint(1, 999_999)).scaleb(-2)
+                  for _ in range(LINES)]
+        quantities = [rng.randint(1, 10) for _ in range(LINES)]
+        as_strings = {str(i): {'quantity': q, 'price': str(p)}
+                      for i, (p, q) in enumerate(zip(prices, quantities))}
+        as_cents = {str(i): {'quantity': q, 'price': int(p * 100)}
+                    for i, (p, q) in enumerate(zip(prices, quantities))}
+        request = Mock()
+        request.session = {'cart': as_cents}
+        cart = Cart(request)
+        self.assertEqual(cart.get_total_price().to_decimal(),
+                         decimal_total(as_strings))
+
+        def run(func, *args):
+            # best of ten batches, a shared runner is noisy
+            batch = max(ROUNDS // 10, 1)
+            best = float('inf')
+            for _ in range(10):
+                start = time.perf_counter()
+                for _ in range(batch):
+                    func(*args)
+                best = min(best, time.perf_counter() - start)
+            return best / batch * 1e6
+
+        print(f'\ncart of {LINES} lines, us per call:')
+        for label, before, after in (
+                ('get_total_price', (decimal_total, as_strings),
+                 (cart.get_total_price,)),
+                ('line prices', (decimal_lines, as_strings),
+                 (money_lines, as_cents)),
+                ('rendered lines', (decimal_lines, as_strings, True),
+                 (money_lines, as_cents, True))):
+            old, new = run(*before), run(*after)
+            print(f'  {label:16} Decimal {old:8.1f}  cents {new:8.1f}  '
+                  f'({old / new:.1f}x)')
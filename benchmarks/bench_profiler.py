@@ -0,0 +1,29 @@
+import os
+import time
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory
+from profiler.middleware import ProfilerMiddleware
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 200_000))
+
+
+class ProfilerOverheadBenchmark(SimpleTestCase):
+
+    def test_disabled_overhead(self):
+        response = HttpResponse()
+        get_response = lambda request: response
+        middleware = ProfilerMiddleware(get_response)
+        request = RequestFactory().get('/tea/?page=2')
+        request.user = AnonymousUser()
+
+        def run(func):
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                func(request)
+            return (time.perf_counter() - start) / REQUESTS * 1e9
+
+        base = run(get_response)
+        wrapped = run(middleware)
+        print(f'\nprofiler middleware, not profiling: '
+              f'{wrapped - base:.0f} ns/request overhead')
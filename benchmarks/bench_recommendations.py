@@ -0,0 +1,87 @@
+import os
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from recommendations.builder import count_pairs, update_recommendations
+from recommendations.models import PairCount
+from shop.models import Category, Product
+
+ITEMS = int(os.environ.get('BENCH_ITEMS', 2_000_000))
+PRODUCTS = int(os.environ.get('BENCH_PRODUCTS', 5_000))
+DB_ORDERS = int(os.environ.get('BENCH_DB_ORDERS', 5_000))
+DB_PRODUCTS = int(os.environ.get('BENCH_DB_PRODUCTS', 500))
+
+
+def synthetic_rows(items, products, seed=0):
+    rng = random.Random(seed)
+    order_id = 0
+    emitted = 0
+    while emitted < items:
+        order_id += 1
+        size = rng.randint(1, 8)
+        for _ in range(size):
+            yield order_id, rng.randrange(products)
+        emitted += size
+
+
+class CoOccurrenceBenchmark(SimpleTestCase):
+
+    def test_count_pairs(self):
+        rows = list(synthetic_rows(ITEMS, PRODUCTS))
+        start = time.perf_counter()
+        counts = count_pairs(rows)
+        elapsed = time.perf_counter() - start
+        print(f'\ncount_pairs: {len(rows):,} items, '
+              f'{len(counts):,} distinct pairs in {elapsed:.2f}s '
+              f'({len(rows) / elapsed:,.0f} items/s)')
+
+
+class UpdateRecommendationsBenchmark(TestCase):
+    """What the beat task runs: reads, pair merges and top-k writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        cls.product_ids = [product.id for product in
+                           Product.objects.bulk_create([
+                               Product(category=category, name=f'Tea {i}',
+                                       slug=f'tea-{i}', price=Decimal('5'))
+                               for i in range(DB_PRODUCTS)])]
+
+    def create_orders(self, count, seed):
+        rng = random.Random(seed)
+        orders = Order.objects.bulk_create([
+            Order(first_name='A', last_name='B', email='a@example.com',
+                  address='X', postal_code='1', city='C')
+            for _ in range(count)], batch_size=1000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id,
+                      price=Decimal('5'), quantity=1)
+            for order in orders
+            for product_id in rng.sample(self.product_ids,
+                                         rng.randint(1, 8))],
+            batch_size=1000)
+        # past the settle window
+        Order.objects.filter(id__in=[order.id for order in orders]).update(
+            created=timezone.now() - timedelta(hours=1))
+
+    def measure(self, label, orders):
+        start = time.perf_counter()
+        processed = update_recommendations(settle_seconds=0)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(processed, orders)
+        print(f'  {label:12} {orders:>8,} orders in {elapsed:6.2f}s '
+              f'({orders / elapsed:,.0f} orders/s), '
+              f'{PairCount.objects.count():,} pairs')
+
+    def test_update_recommendations(self):
+        print(f'\nupdate_recommendations over {DB_PRODUCTS:,} products:')
+        self.create_orders(DB_ORDERS, seed=0)
+        self.measure('first run', DB_ORDERS)
+        # a beat run after a few minutes of new orders
+        self.create_orders(DB_ORDERS // 20, seed=1)
+        self.measure('incremental', DB_ORDERS // 20)
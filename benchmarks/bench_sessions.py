@@ -0,0 +1,73 @@
+import os
+import time
+from decimal import Decimal
+from importlib import import_module
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, RequestFactory, override_settings
+from shop.models import Category, Product
+from shop.money import Money
+from cart.context_processors import cart
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 2_000))
+ENGINES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.signed_cookies',
+]
+SESSION_CACHES = {
+    'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'bench-sessions'},
+    'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+             'LOCATION': '/tmp/tea-shop/bench-sessions'},
+}
+
+
+class SessionEngineBenchmark(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea', slug='tea')
+        cls.products = [
+            Product.objects.create(category=category,
+                                   name=f'Tea {i}',
+                                   slug=f'tea-{i}',
+                                   price=Decimal('9.90'))
+            for i in range(5)
+        ]
+
+    def measure(self, engine):
+        store_class = import_module(engine).SessionStore
+        store = store_class()
+        store[settings.CART_SESSION_ID] = {
+            str(p.id): {'quantity': 2,
+                        'price': Money.from_decimal(p.price).cents}
+            for p in self.products
+        }
+        store.save()
+        cookie = store.session_key
+        if engine.endswith('signed_cookies'):
+            cookie = store._get_session_key()
+        request = RequestFactory().get('/')
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            request.session = store_class(cookie)
+            context = cart(request)
+            len(context['cart'])
+            context['cart'].get_total_price()
+        return (time.perf_counter() - start) / REQUESTS * 1e6
+
+    def test_cart_context_processor(self):
+        print(f'\ncart context processor, {REQUESTS} requests')
+        for cache_name, cache in SESSION_CACHES.items():
+            with override_settings(CACHES=dict(settings.CACHES,
+                                               sessions=cache)):
+                for engine in ENGINES:
+                    if 'cache' not in engine and cache_name != 'locmem':
+                        continue
+                    label = engine.rsplit('.', 1)[1]
+                    if 'cache' in engine:
+                        label = f'{label} ({cache_name})'
+                    print(f'  {label:<24} {self.measure(engine):8.1f} us/request')
+                caches['sessions'].clear()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import time
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.views.static import serve
+from config.static import StaticFilesMiddleware
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 5_000))
+FILES = ('css/base.css', 'img/no_image.png')
+
+
+class StaticFilesBenchmark(SimpleTestCase):
+
+    def test_bytes_and_latency(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with override_settings(
+                STATIC_ROOT=static_root,
+                STATICFILES_DIRS=[settings.BASE_DIR / 'shop' / 'static'],
+                STATICFILES_FINDERS=['django.contrib.staticfiles.finders.'
+                                     'FileSystemFinder'],
+                STATICFILES_STORAGE='config.static.'
+                                    'CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            middleware = StaticFilesMiddleware(lambda r: HttpResponse())
+            names = [staticfiles_storage.stored_name(name) for name in FILES]
+        factory = RequestFactory()
+
+        def run(handler, name, accept):
+            request = factory.get(settings.STATIC_URL + name,
+                                  HTTP_ACCEPT_ENCODING=accept)
+            size = 0
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                response = handler(request)
+                size = sum(map(len, response.streaming_content))
+                response.close()
+            return size, (time.perf_counter() - start) / REQUESTS * 1e6
+
+        # what the DEBUG static() route and runserver do
+        def plain(request):
+            return serve(request, request.path[len(settings.STATIC_URL):],
+                         document_root=static_root)
+
+        print()
+        for name in names:
+            for label, handler, accept in (
+                    ('django.views.static.serve', plain, 'gzip, br'),
+                    ('middleware, identity', middleware, ''),
+                    ('middleware, gzip', middleware, 'gzip'),
+                    ('middleware, br', middleware, 'gzip, br')):
+                size, micros = run(handler, name, accept)
+                print(f'{name:28} {label:26} {size:6d} bytes '
+                      f'{micros:6.1f} us/request')
@@ -0,0 +1,62 @@
+import logging
+import os
+import time
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from config import tracing
+
+SPANS = int(os.environ.get('BENCH_SPANS', 200_000))
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 20_000))
+
+
+class NullExporter:
+
+    def export(self, span):
+        pass
+
+
+def per_call(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e9
+
+
+def record_span():
+    with tracing.span('sql', alias='default', sql='SELECT 1'):
+        pass
+
+
+class TracingOverheadBenchmark(SimpleTestCase):
+
+    def test_span_overhead(self):
+        base = per_call(lambda: None, SPANS)
+        outside = per_call(record_span, SPANS) - base
+        print(f'\nspan outside of a trace: {outside:.0f} ns')
+        # LogExporter pays for the JSON encoding, not for the output
+        spans_logger = logging.getLogger('tea_shop.spans')
+        handlers, level = spans_logger.handlers, spans_logger.level
+        spans_logger.handlers = [logging.NullHandler()]
+        spans_logger.setLevel(logging.INFO)
+        try:
+            for path in ('benchmarks.bench_tracing.NullExporter',
+                         'config.tracing.LogExporter'):
+                with override_settings(TRACING_EXPORTER=path), \
+                        tracing.Span('bench', 'request'):
+                    inside = per_call(record_span, SPANS) - base
+                print(f'span with {path.rsplit(".", 1)[1]}: {inside:.0f} ns')
+        finally:
+            spans_logger.handlers, spans_logger.level = handlers, level
+
+    @override_settings(TRACING_EXPORTER='benchmarks.bench_tracing.NullExporter')
+    def test_middleware_overhead(self):
+        response = HttpResponse()
+        get_response = lambda request: response
+        request = RequestFactory().get('/tea/')
+        base = per_call(lambda: get_response(request), REQUESTS)
+        for enabled in (False, True):
+            middleware = tracing.TracingMiddleware(get_response)
+            with override_settings(TRACING_ENABLED=enabled):
+                wrapped = per_call(lambda: middleware(request), REQUESTS)
+            print(f'tracing middleware, enabled={enabled}: '
+                  f'{wrapped - base:.0f} ns/request overhead')
@@ -1,30 +1,65 @@
-from decimal import Decimal
 from django.conf import settings
 from shop.models import Product
+from shop.money import Money, format_cents
+
+
+def stored_cents(item):
+    # prices are kept as integer cents; carts saved before that hold
+    # the str() of a Decimal
+    price = item['price']
+    return price if type(price) is int else Money.parse(price).cents
+
 
 class Cart:
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # the cart is only stored in the session once something is added,
+        # so visitors who just browse don't get a session row
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
 
 
     def add(self, product, quantity=1, override_quantity=False):
         product_id = str(product.id)
         if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0,
-                                     'price': str(product.price)}
+            self.cart[product_id] = {
+                'quantity': 0,
+                'price': Money.from_decimal(product.price).cents}
         if override_quantity:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
+        self.session[settings.CART_SESSION_ID] = self.cart
         self.save()
 
     def save(self):
         self.session.modified = True
 
+    def update(self, quantities, products):
+        # quantities maps product ids to new quantities, 0 drops the line;
+        # products holds the Product rows that are still for sale
+        for product_id, quantity in quantities.items():
+            key = str(product_id)
+            if quantity <= 0 or product_id not in products:
+                self.cart.pop(key, None)
+            elif key in self.cart:
+                self.cart[key]['quantity'] = quantity
+            else:
+                price = Money.from_decimal(products[product_id].price)
+                self.cart[key] = {'quantity': quantity,
+                                  'price': price.cents}
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self.save()
+
+    def line(self, product_id):
+        item = self.cart.get(str(product_id))
+        if item is None:
+            return None
+        cents = stored_cents(item)
+        return {'product_id': product_id,
+                'quantity': item['quantity'],
+                'price': format_cents(cents),
+                'total_price': format_cents(cents * item['quantity'])}
+
     def remove(self, product):
         product_id = str(product.id)
         if product_id in self.cart:
@@ -35,12 +70,19 @@ class Cart:
     def __iter__(self):
         product_ids = self.cart.keys()
         products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
+        # copies of the lines, the session keeps its cents
+        cart = {key: dict(item) for key, item in self.cart.items()}
         for product in products:
             cart[str(product.id)]['product'] = product
+        # lines are rendered, so prices come formatted; the cents are
+        # kept for checkout and a Money is only built for the total
         for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
+            cents = item['price']
+            if type(cents) is not int:
+                cents = stored_cents(item)
+            item['price_cents'] = cents
+            item['price'] = format_cents(cents)
+            item['total_price'] = format_cents(cents * item['quantity'])
             yield item
 
 
@@ -48,9 +90,10 @@ class Cart:
         return sum(item['quantity'] for item in self.cart.values())
 
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity']
-                   for item in self.cart.values())
+        # plain int sums, one Money at the end
+        return Money(sum(stored_cents(item) * item['quantity']
+                         for item in self.cart.values()))
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
+        self.session.pop(settings.CART_SESSION_ID, None)
         self.save()
\ No newline at end of file
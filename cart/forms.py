@@ -9,4 +9,22 @@ class CartAddProductForm(forms.Form):
     )
     override = forms.BooleanField(required=False,
                                   initial=False,
-                                  widget=forms.HiddenInput)
\ No newline at end of file
+                                  widget=forms.HiddenInput)
+
+
+def parse_quantities(data):
+    # reads quantity_<product id> fields of the batch update form
+    quantities = {}
+    max_quantity = PRODUCT_QUANTITY_CHOICES[-1][0]
+    for key, value in data.items():
+        if not key.startswith('quantity_'):
+            continue
+        try:
+            product_id = int(key[len('quantity_'):])
+            quantity = int(value)
+        except ValueError:
+            return None
+        if not 0 <= quantity <= max_quantity:
+            return None
+        quantities[product_id] = quantity
+    return quantities
@@ -0,0 +1,21 @@
+from celery import shared_task
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+@shared_task
+def purge_expired_sessions(batch_size=None, max_batches=None):
+    # small batches keep every DELETE short instead of locking the
+    # whole session table the way clearsessions does
+    batch_size = batch_size or settings.SESSION_PURGE_BATCH_SIZE
+    max_batches = max_batches or settings.SESSION_PURGE_MAX_BATCHES
+    now = timezone.now()
+    purged = 0
+    for _ in range(max_batches):
+        keys = list(Session.objects.filter(expire_date__lt=now)
+                    .values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            break
+        Session.objects.filter(session_key__in=keys).delete()
+        purged += len(keys)
+    return purged
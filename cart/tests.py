@@ -1,10 +1,16 @@
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import Mock
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
 from django.test import TestCase
 from django.conf import settings
+from django.utils import timezone
 from shop.models import Product, Category
+from shop.money import Money
 from .cart import Cart
 from .forms import CartAddProductForm
+from .tasks import purge_expired_sessions
 
 
 class CartTests(TestCase):
@@ -33,6 +39,13 @@ class CartTests(TestCase):
         """Инициализация корзины"""
         self.assertEqual(self.cart.cart, {})
 
+    def test_empty_cart_not_stored_in_session(self):
+        """Пустая корзина не записывается в сессию"""
+        self.assertNotIn(settings.CART_SESSION_ID, self.mock_session)
+        self.cart.save = Mock()
+        self.cart.add(self.product)
+        self.assertIn(settings.CART_SESSION_ID, self.mock_session)
+
     def test_cart_initialization_with_existing_session(self):
         """Инициализация корзины с существующей сессией"""
         mock_session = {'cart': {str(self.product.id): {'quantity': 2, 'price': '100.00'}}}
@@ -50,7 +63,7 @@ class CartTests(TestCase):
         product_id = str(self.product.id)
         self.assertIn(product_id, self.cart.cart)
         self.assertEqual(self.cart.cart[product_id]['quantity'], 2)
-        self.assertEqual(self.cart.cart[product_id]['price'], '100.00')
+        self.assertEqual(self.cart.cart[product_id]['price'], 10000)
         self.cart.save.assert_called_once()
 
     def test_add_product_with_override(self):
@@ -88,7 +101,7 @@ class CartTests(TestCase):
         self.cart.add(self.product, quantity=3)
         total = self.cart.get_total_price()
 
-        self.assertEqual(total, Decimal('300.00'))
+        self.assertEqual(total, Money.parse('300.00'))
 
     def test_cart_length(self):
         """Количество товаров в корзине"""
@@ -123,13 +136,26 @@ class CartTests(TestCase):
             item = items[0]
             self.assertEqual(item['product'], self.product)
             self.assertEqual(item['quantity'], 2)
-            self.assertEqual(item['price'], Decimal('100.00'))
-            self.assertEqual(item['total_price'], Decimal('200.00'))
+            self.assertEqual(item['price'], '100.00')
+            self.assertEqual(item['total_price'], '200.00')
+            self.assertEqual(item['price_cents'], 10000)
+
+    def test_session_prices_saved_as_strings(self):
+        """Корзины со строковыми ценами из старых сессий читаются"""
+        self.mock_session['cart'] = {
+            str(self.product.id): {'quantity': 3, 'price': '33.35'}}
+        cart = Cart(self.mock_request)
+        self.assertEqual(str(cart.get_total_price()), '100.05')
+        [item] = list(cart)
+        self.assertEqual(item['total_price'], '100.05')
+        # iterating leaves the stored line alone
+        self.assertEqual(self.mock_session['cart'][str(self.product.id)]
+                         ['price'], '33.35')
 
     def test_get_total_price_empty(self):
         """Общая сумма пустой корзины"""
         total = self.cart.get_total_price()
-        self.assertEqual(total, Decimal('0.00'))
+        self.assertEqual(total, Money())
 
 
 class CartFormTests(TestCase):
@@ -159,3 +185,25 @@ class CartFormTests(TestCase):
         self.assertEqual(len(choices), 10)
         for i in range(1, 11):
             self.assertIn((i, str(i)), choices)
+
+
+
+class SessionPurgeTests(TestCase):
+    """Тесты очистки истекших сессий"""
+
+    def create_session(self, expire_date):
+        store = SessionStore()
+        store.create()
+        Session.objects.filter(session_key=store.session_key).update(
+            expire_date=expire_date)
+
+    def test_purge_in_batches(self):
+        """Удаляются только истекшие сессии, пачками"""
+        past = timezone.now() - timedelta(days=1)
+        for _ in range(5):
+            self.create_session(past)
+        self.create_session(timezone.now() + timedelta(days=1))
+
+        self.assertEqual(purge_expired_sessions(batch_size=2, max_batches=2), 4)
+        self.assertEqual(purge_expired_sessions(batch_size=2), 1)
+        self.assertEqual(Session.objects.count(), 1)
@@ -1,7 +1,10 @@
 from decimal import Decimal
-from django.test import TestCase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from shop.models import Product, Category
+from config.throttling import TokenBucket, THROTTLED_REQUESTS
 
 
 class CartViewTests(TestCase):
@@ -39,6 +42,26 @@ class CartViewTests(TestCase):
         self.assertIn(product_id, cart_data)
         self.assertEqual(cart_data[product_id]['quantity'], 2)
 
+    def test_browsing_does_not_create_session(self):
+        """Просмотр каталога не создает сессию"""
+        self.client.get(reverse('shop:product_list'))
+        self.client.get(reverse('cart:cart_detail'))
+        self.assertFalse(Session.objects.exists())
+
+    def test_cart_badge(self):
+        """Фрагмент с количеством товаров в корзине"""
+        response = self.client.get(reverse('cart:cart_badge'))
+        self.assertContains(response, 'Your cart is empty.')
+        self.assertIn('csrftoken', response.cookies)
+
+        self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '2', 'override': False}
+        )
+        response = self.client.get(reverse('cart:cart_badge'))
+        self.assertContains(response, '2 items')
+        self.assertContains(response, '$200.00')
+
     def test_cart_detail_get(self):
         """GET запрос на просмотр корзины"""
         response = self.client.get(reverse('cart:cart_detail'))
@@ -93,3 +116,177 @@ class CartViewTests(TestCase):
             reverse('cart:cart_remove', args=[999])
         )
         self.assertEqual(response.status_code, 404)
+
+
+class CartJsonViewTests(TestCase):
+    """Тесты JSON-эндпоинтов корзины и пакетного изменения"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Test Product',
+            slug='test-product',
+            price=Decimal('100.00'),
+            available=True
+        )
+
+    def test_cart_add_json(self):
+        """JSON-добавление возвращает строку, количество и сумму"""
+        response = self.client.post(
+            reverse('cart:cart_add_json', args=[self.product.id]),
+            data={'quantity': '2', 'override': False}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'line': {'product_id': self.product.id,
+                     'quantity': 2,
+                     'price': '100.00',
+                     'total_price': '200.00'},
+            'count': 2,
+            'total': '200.00',
+        })
+
+    def test_cart_add_json_invalid(self):
+        """JSON-добавление с невалидной формой"""
+        response = self.client.post(
+            reverse('cart:cart_add_json', args=[self.product.id]),
+            data={'quantity': '15'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json()['errors'])
+
+    def test_cart_remove_json(self):
+        """JSON-удаление без запроса товара"""
+        self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '2', 'override': False}
+        )
+        response = self.client.post(
+            reverse('cart:cart_remove_json', args=[self.product.id]))
+        self.assertEqual(response.json(),
+                         {'line': None, 'count': 0, 'total': '0.00'})
+
+    def test_empty_cart_total_json(self):
+        """Сумма пустой корзины с двумя знаками после запятой"""
+        response = self.client.post(
+            reverse('cart:cart_update'),
+            data={f'quantity_{self.product.id}': '0'},
+            HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.json(),
+                         {'lines': [None], 'count': 0, 'total': '0.00'})
+
+    def test_cart_update_batch_json(self):
+        """Пакетное изменение количеств одним запросом"""
+        other = Product.objects.create(
+            category=self.category,
+            name='Other Product',
+            slug='other-product',
+            price=Decimal('5.50'),
+            available=True
+        )
+        self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '2', 'override': False}
+        )
+        response = self.client.post(
+            reverse('cart:cart_update'),
+            data={f'quantity_{self.product.id}': '0',
+                  f'quantity_{other.id}': '3'},
+            HTTP_ACCEPT='application/json'
+        )
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['total'], '16.50')
+        self.assertEqual(data['lines'][0], None)
+        self.assertEqual(data['lines'][1]['total_price'], '16.50')
+
+    def test_cart_update_form_fallback(self):
+        """Пакетное изменение обычной формой"""
+        self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '2', 'override': False}
+        )
+        response = self.client.post(
+            reverse('cart:cart_update'),
+            data={f'quantity_{self.product.id}': '5'}
+        )
+        self.assertRedirects(response, reverse('cart:cart_detail'))
+        cart_data = self.client.session['cart']
+        self.assertEqual(cart_data[str(self.product.id)]['quantity'], 5)
+
+    def test_cart_update_invalid_quantity(self):
+        """Недопустимое количество в пакетном изменении"""
+        response = self.client.post(
+            reverse('cart:cart_update'),
+            data={f'quantity_{self.product.id}': '50'},
+            HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(THROTTLE_ENABLED=True,
+                   THROTTLE_RATES={'cart': {'capacity': 3, 'rate': 0.01}})
+class CartThrottleTests(TestCase):
+    """Тесты ограничения частоты запросов к корзине"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Test Product',
+            slug='test-product',
+            price=Decimal('100.00'),
+            available=True
+        )
+
+    def test_cart_add_throttled(self):
+        """Превышение лимита возвращает 429 с Retry-After"""
+        url = reverse('cart:cart_add', args=[self.product.id])
+        data = {'quantity': '1', 'override': False}
+        before = THROTTLED_REQUESTS.labels('cart')._value.get()
+        for _ in range(3):
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(THROTTLED_REQUESTS.labels('cart')._value.get(),
+                         before + 1)
+        self.assertEqual(self.client.session['cart'][str(self.product.id)]
+                         ['quantity'], 3)
+
+    def test_new_session_shares_limit(self):
+        """Новая сессия не дает нового лимита"""
+        url = reverse('cart:cart_add', args=[self.product.id])
+        data = {'quantity': '1', 'override': False}
+        for _ in range(3):
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+            self.client.cookies.clear()
+        self.assertEqual(self.client.post(url, data).status_code, 429)
+
+    def test_bucket_refills(self):
+        """Корзина токенов пополняется со временем"""
+        bucket = TokenBucket('test', capacity=2, rate=1.0)
+        self.assertEqual(bucket.consume('ip', now=100.0), 0)
+        self.assertEqual(bucket.consume('ip', now=100.1), 0)
+        self.assertGreater(bucket.consume('ip', now=100.2), 0)
+        self.assertEqual(bucket.consume('ip', now=103.5), 0)
+
+    def test_client_above_rate_served_at_rate(self):
+        """Клиент, повторяющий чаще лимита, проходит с частотой rate"""
+        bucket = TokenBucket('test', capacity=10, rate=1.0)
+        # a minute of 4 requests a second; the previous period drains
+        # linearly, which refills a little slower than rate
+        allowed = sum(bucket.consume('ip', now=100.0 + i / 4) == 0
+                      for i in range(240))
+        self.assertGreaterEqual(allowed, 0.8 * 60)
+        self.assertLessEqual(allowed, 60 + 10)
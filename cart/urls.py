@@ -5,7 +5,13 @@ app_name = 'cart'
 
 urlpatterns = [
     path('', views.cart_detail, name='cart_detail'),
+    path('badge/', views.cart_badge, name='cart_badge'),
     path('add/<int:product_id>/', views.cart_add,  name='cart_add'),
     path('remove/<int:product_id>/', views.cart_remove,
          name='cart_remove'),
+    path('update/', views.cart_update, name='cart_update'),
+    path('api/add/<int:product_id>/', views.cart_add_json,
+         name='cart_add_json'),
+    path('api/remove/<int:product_id>/', views.cart_remove_json,
+         name='cart_remove_json'),
 ]
\ No newline at end of file
@@ -1,10 +1,26 @@
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_POST
+from config.throttling import throttle
+from shop import counters
 from shop.models import Product
 from .cart import Cart
-from .forms import CartAddProductForm
+from .forms import CartAddProductForm, parse_quantities
+
+
+def wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def cart_state(cart, **extra):
+    return JsonResponse({**extra,
+                         'count': len(cart),
+                         'total': str(cart.get_total_price())})
 
 @require_POST
+@throttle('cart')
 def cart_add(request, product_id):
     cart = Cart(request)
     product = get_object_or_404(Product, id=product_id)
@@ -14,21 +30,66 @@ def cart_add(request, product_id):
         cart.add(product=product,
                  quantity=cd['quantity'],
                  override_quantity=cd['override'])
+        counters.record_cart_add(product.id)
     return redirect('cart:cart_detail')
 
 
 @require_POST
+@throttle('cart')
 def cart_remove(request, product_id):
     cart = Cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     return redirect('cart:cart_detail')
 
+@require_POST
+@throttle('cart')
+def cart_add_json(request, product_id):
+    cart = Cart(request)
+    product = get_object_or_404(Product, id=product_id)
+    form = CartAddProductForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    cd = form.cleaned_data
+    cart.add(product=product,
+             quantity=cd['quantity'],
+             override_quantity=cd['override'])
+    counters.record_cart_add(product.id)
+    return cart_state(cart, line=cart.line(product_id))
+
+
+@require_POST
+@throttle('cart')
+def cart_remove_json(request, product_id):
+    cart = Cart(request)
+    cart.update({product_id: 0}, {})
+    return cart_state(cart, line=None)
+
+
+@require_POST
+@throttle('cart')
+def cart_update(request):
+    cart = Cart(request)
+    quantities = parse_quantities(request.POST)
+    if quantities is None:
+        if wants_json(request):
+            return JsonResponse({'errors': 'Invalid quantities'}, status=400)
+        return redirect('cart:cart_detail')
+    products = Product.objects.filter(id__in=quantities,
+                                      available=True).in_bulk()
+    cart.update(quantities, products)
+    if wants_json(request):
+        return cart_state(cart, lines=[cart.line(product_id)
+                                       for product_id in quantities])
+    return redirect('cart:cart_detail')
+
+
 def cart_detail(request):
     cart = Cart(request)
-    for item in cart:
-        item['update_quantity_form'] = CartAddProductForm(initial={
-            'quantity': item['quantity'],
-            'override': True
-        })
-    return render(request, 'cart/detail.html', {'cart': cart})
\ No newline at end of file
+    return render(request, 'cart/detail.html', {'cart': cart})
+
+
+@never_cache
+@ensure_csrf_cookie
+def cart_badge(request):
+    return render(request, 'cart/badge.html', {'cart': Cart(request)})
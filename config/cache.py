@@ -0,0 +1,160 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from prometheus_client import Counter
+
+CACHE_HITS = Counter('tea_shop_cache_hits_total',
+                     'Tiered cache reads answered without computing',
+                     ['cache', 'tier'])
+CACHE_MISSES = Counter('tea_shop_cache_misses_total',
+                       'Tiered cache reads that found no value',
+                       ['cache'])
+CACHE_RECOMPUTES = Counter('tea_shop_cache_recomputes_total',
+                           'Values computed by tiered caches',
+                           ['cache', 'reason'])
+
+
+class LocalLRU:
+    """A bounded, thread-safe LRU whose entries expire."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[1] <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, expires):
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache:
+    """
+    A per-process LRU in front of a Django cache, for values every
+    worker would otherwise compute at the same moment.
+
+    Shared entries carry their expiry and how long they took to compute,
+    and are refreshed early with a probability that grows towards the
+    expiry (XFetch), so a hot key is usually recomputed before it
+    expires. Only the worker holding the key's lock computes it; the
+    others keep serving the old value, or wait for the new one when
+    there is none. Entries outlive their expiry by stale_timeout for
+    that purpose. Locks are taken with add() on the
+    TIERED_CACHE_LOCK_ALIAS cache whatever cache holds the values, as
+    file based caches don't add() atomically.
+
+    Values are shared between the threads of a process and must not be
+    mutated by callers.
+    """
+
+    def __init__(self, name, timeout, alias='default', stale_timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+        self.stale_timeout = timeout if stale_timeout is None \
+            else stale_timeout
+        self.local = LocalLRU(settings.TIERED_CACHE_LOCAL_SIZE)
+
+    def shared_key(self, key):
+        return f'tiered:{self.name}:{key}'
+
+    def get_or_compute(self, key, compute):
+        now = time.time()
+        entry = self.local.get(key, now)
+        if entry is not None:
+            CACHE_HITS.labels(self.name, 'local').inc()
+            return entry[0]
+        entry = caches[self.alias].get(self.shared_key(key))
+        if entry is None:
+            CACHE_MISSES.labels(self.name).inc()
+            return self._fill(key, compute, None, 'miss')
+        value, expires, delta = entry
+        if expires <= now:
+            return self._fill(key, compute, entry, 'expired')
+        # -log(u) is exponentially distributed, so the chance of an early
+        # refresh rises steeply in the last few compute durations
+        early = delta * settings.TIERED_CACHE_BETA \
+            * -math.log(1.0 - random.random())
+        if now + early >= expires:
+            return self._fill(key, compute, entry, 'early')
+        CACHE_HITS.labels(self.name, 'shared').inc()
+        self._keep_local(key, entry, now)
+        return value
+
+    def delete(self, key):
+        # the local tiers of other processes keep the value for up to
+        # TIERED_CACHE_LOCAL_SECONDS; versioned keys avoid that
+        caches[self.alias].delete(self.shared_key(key))
+        self.local.delete(key)
+
+    def _keep_local(self, key, entry, now):
+        self.local.set(key, entry,
+                       min(now + settings.TIERED_CACHE_LOCAL_SECONDS,
+                           entry[1]))
+
+    def _fill(self, key, compute, stale, reason):
+        cache = caches[self.alias]
+        locks = caches[settings.TIERED_CACHE_LOCK_ALIAS]
+        shared_key = self.shared_key(key)
+        lock_key = f'{shared_key}:lock'
+        deadline = time.monotonic() + settings.TIERED_CACHE_LOCK_SECONDS
+        while True:
+            token = '%016x' % random.getrandbits(64)
+            if locks.add(lock_key, token,
+                         timeout=settings.TIERED_CACHE_LOCK_SECONDS):
+                try:
+                    return self._compute(key, compute, reason)
+                finally:
+                    if locks.get(lock_key) == token:
+                        locks.delete(lock_key)
+            if stale is not None:
+                # another worker is refreshing it
+                CACHE_HITS.labels(self.name, 'stale').inc()
+                return stale[0]
+            if time.monotonic() >= deadline:
+                # the lock holder is stuck, better a duplicate computation
+                # than a failed request
+                return self._compute(key, compute, 'timeout')
+            time.sleep(settings.TIERED_CACHE_POLL_SECONDS)
+            entry = cache.get(shared_key)
+            if entry is not None:
+                CACHE_HITS.labels(self.name, 'shared').inc()
+                self._keep_local(key, entry, time.time())
+                return entry[0]
+
+    def _compute(self, key, compute, reason):
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+        entry = (value, time.time() + self.timeout, delta)
+        caches[self.alias].set(self.shared_key(key), entry,
+                               timeout=self.timeout + self.stale_timeout)
+        self._keep_local(key, entry, time.time())
+        CACHE_RECOMPUTES.labels(self.name, reason).inc()
+        return value
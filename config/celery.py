@@ -4,4 +4,7 @@ from celery import Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# connects the signals that carry trace ids through task headers
+from . import tracing  # noqa: E402,F401
\ No newline at end of file
@@ -0,0 +1,65 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+pinned = ContextVar('pinned', default=False)
+# None outside a request: Celery tasks, commands and beat do not pin
+# themselves to the primary for good with their first write
+wrote = ContextVar('wrote', default=None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of DATABASE_REPLICA_APPS models to a random replica and
+    everything else to the primary. Reads go to the primary too while
+    the client is pinned after a write, or inside a transaction.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas
+                or model._meta.app_label not in settings.DATABASE_REPLICA_APPS
+                or pinned.get() or wrote.get()
+                or connections['default'].in_atomic_block):
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # DatabaseCache entries are not the client's data
+        if (wrote.get() is not None
+                and model._meta.app_label != 'django_cache'):
+            wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaPinMiddleware:
+    # must come before SessionMiddleware so session saves count as writes
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_PIN_COOKIE
+        try:
+            pinned_until = float(request.COOKIES.get(cookie, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned_token = pinned.set(pinned_until > time.time())
+        wrote_token = wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if wrote.get():
+                seconds = settings.REPLICA_PIN_SECONDS
+                response.set_cookie(cookie, str(time.time() + seconds),
+                                    max_age=seconds, httponly=True,
+                                    samesite='Lax')
+        finally:
+            pinned.reset(pinned_token)
+            wrote.reset(wrote_token)
+        return response
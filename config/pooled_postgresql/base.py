@@ -0,0 +1,122 @@
+import os
+import threading
+from functools import partial
+
+import psycopg2.extras
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+from .pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+# one pool per process and connection parameters, shared by the
+# per-thread DatabaseWrappers of an alias; keyed by (database, params)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def close_pools(database=None, inherited=False):
+    """
+    Closes the idle connections of every pool, or of one database's;
+    with inherited, only of pools still holding a parent's connections.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items()
+                 if (database is None or key[0] == database)
+                 and (not inherited or pool.pid != pid)]
+        for key, _ in pools:
+            del _pools[key]
+    for _, pool in pools:
+        pool.close()
+
+
+def connect(conn_params, options):
+    # base.DatabaseWrapper.get_new_connection without the wrapper state
+    connection = Database.connect(**conn_params)
+    isolation_level = options.get('isolation_level')
+    if (isolation_level is not None
+            and isolation_level != connection.isolation_level):
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(
+        conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the test database in use
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The postgresql backend with connections from a per-process pool.
+    Django still opens and closes a connection per request (or keeps it
+    for CONN_MAX_AGE), but opening takes an idle pooled connection and
+    closing returns it, so the TCP and auth handshake happen once per
+    pooled connection instead of once per request.
+
+    Configured by OPTIONS['pool'], a dict of ConnectionPool arguments
+    (min_size, max_size, timeout, max_idle, max_lifetime, check_after),
+    the same key Django 5.1's psycopg 3 pool uses.
+    """
+
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_pool(self, conn_params):
+        key = (conn_params.get('database'), repr(sorted(conn_params.items())))
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = self.settings_dict['OPTIONS']
+                pool = _pools[key] = ConnectionPool(
+                    self.alias, partial(connect, conn_params, options),
+                    **options.get('pool', {}))
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        try:
+            connection = pool.getconn()
+        except PoolTimeout as exc:
+            # surfaces as django.db.OperationalError
+            raise Database.OperationalError(str(exc)) from exc
+        self._pool = pool
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.putconn(self.connection)
+
+    def close_pool(self):
+        # Celery's prefork workers call this whenever they close the
+        # connections, before and after every task unless
+        # CELERY_DB_REUSE_MAX is set; the process's own pool is kept for
+        # the next task, only one that came through fork() is dropped
+        close_pools(self.get_connection_params().get('database'),
+                    inherited=True)
+
+
+def _after_fork():
+    # another thread may have held a lock at the fork; the pools move
+    # the parent's connections aside and start empty
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool.lock = threading.Condition()
+        pool.size()
+
+
+os.register_at_fork(after_in_child=_after_fork)
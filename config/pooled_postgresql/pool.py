@@ -0,0 +1,204 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Counter
+
+POOL_CONNECTIONS = Counter('tea_shop_db_pool_connections_total',
+                           'Connections opened by database pools',
+                           ['pool'])
+POOL_DISCARDS = Counter('tea_shop_db_pool_discards_total',
+                        'Pooled connections closed instead of reused',
+                        ['pool', 'reason'])
+POOL_TIMEOUTS = Counter('tea_shop_db_pool_timeouts_total',
+                        'Checkouts that found the pool full until timeout',
+                        ['pool'])
+
+# connections inherited through fork(); closing one would end the
+# parent's session on the shared socket, and so would garbage
+# collecting it, so they are kept until the process exits
+_inherited = []
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of DB-API connections for one process.
+
+    Checkout reuses the most recently returned connection, pings it
+    first when it sat idle for longer than check_after seconds, and
+    opens a new one while fewer than max_size are open; beyond that it
+    waits up to timeout seconds. Returned connections are rolled back
+    if they are mid-transaction, and closed once older than
+    max_lifetime. Idle ones are closed after max_idle seconds, except
+    for the last min_size.
+
+    A pool used after fork() starts empty in the child and leaves the
+    parent's connections alone. After close() connections given back
+    are closed.
+    """
+
+    def __init__(self, name, connect, min_size=0, max_size=10, timeout=5.0,
+                 max_idle=600.0, max_lifetime=3600.0, check_after=30.0):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid pool size {min_size}..{max_size}')
+        self.name = name
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.lock = threading.Condition()
+        self.closed = False
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # (connection, expires, last used), most recently used last
+        self.idle = deque()
+        # id(connection) -> (connection, expires)
+        self.used = {}
+        self.opening = 0
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            _inherited.extend(conn for conn, *_ in self.idle)
+            _inherited.extend(conn for conn, _ in self.used.values())
+            self._reset()
+
+    def size(self):
+        with self.lock:
+            self._check_fork()
+            return len(self.idle) + len(self.used) + self.opening
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, last_used = self._reserve(deadline)
+            if conn is None:
+                return self._open()
+            # the ping happens outside the lock
+            if (time.monotonic() - last_used < self.check_after
+                    or self._ping(conn)):
+                return conn
+            with self.lock:
+                self.used.pop(id(conn), None)
+                self.lock.notify()
+            self._discard(conn, 'failed_check')
+
+    def _reserve(self, deadline):
+        # an idle connection and when it was last used, or (None, None)
+        # with a slot reserved for a new one
+        with self.lock:
+            self._check_fork()
+            while True:
+                if self.idle:
+                    conn, expires, last_used = self.idle.pop()
+                    self.used[id(conn)] = (conn, expires)
+                    return conn, last_used
+                if len(self.used) + self.opening < self.max_size:
+                    self.opening += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    POOL_TIMEOUTS.labels(self.name).inc()
+                    raise PoolTimeout(
+                        f'No connection in pool {self.name!r} within '
+                        f'{self.timeout}s, all {self.max_size} in use')
+                self.lock.wait(remaining)
+
+    def _open(self):
+        try:
+            conn = self.connect()
+        except BaseException:
+            with self.lock:
+                self.opening -= 1
+                self.lock.notify()
+            raise
+        POOL_CONNECTIONS.labels(self.name).inc()
+        # spread the expiries, connections opened together do not all
+        # reconnect at the same moment
+        expires = time.monotonic() \
+            + self.max_lifetime * random.uniform(0.9, 1.0)
+        with self.lock:
+            self.opening -= 1
+            self.used[id(conn)] = (conn, expires)
+        return conn
+
+    def putconn(self, conn):
+        with self.lock:
+            self._check_fork()
+            entry = self.used.pop(id(conn), None)
+        if entry is None:
+            # from before a fork, or from another pool
+            _inherited.append(conn)
+            return
+        reason = None
+        if self.closed:
+            reason = 'pool_closed'
+        elif self._is_closed(conn):
+            reason = 'closed'
+        elif time.monotonic() >= entry[1]:
+            reason = 'lifetime'
+        elif not self._reset_connection(conn):
+            reason = 'reset_failed'
+        with self.lock:
+            if reason is None:
+                self.idle.append((conn, entry[1], time.monotonic()))
+            self._expire_idle()
+            self.lock.notify()
+        if reason is not None:
+            self._discard(conn, reason)
+
+    def close(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self._check_fork()
+                return
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+            self.lock.notify_all()
+        for conn, *_ in idle:
+            self._discard(conn, 'pool_closed')
+
+    def _expire_idle(self):
+        # called with the lock held; the oldest idle connections are first
+        now = time.monotonic()
+        while (len(self.idle) + len(self.used) > self.min_size
+               and self.idle and now - self.idle[0][2] >= self.max_idle):
+            self._discard(self.idle.popleft()[0], 'idle')
+
+    def _discard(self, conn, reason):
+        POOL_DISCARDS.labels(self.name, reason).inc()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_closed(self, conn):
+        return bool(getattr(conn, 'closed', False))
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not getattr(conn, 'autocommit', True):
+                conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _reset_connection(self, conn):
+        # a connection goes back without an open transaction
+        try:
+            conn.rollback()
+        except Exception:
+            return False
+        return True
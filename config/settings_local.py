@@ -0,0 +1,23 @@
+# The shop on a single SQLite file, without PostgreSQL or a broker, e.g.
+# as a target for the load generator:
+#   python manage.py migrate --settings=config.settings_local
+#   python manage.py createcachetable --settings=config.settings_local
+#   python manage.py loaddata mysite_data.json -e sessions -e admin.logentry \
+#       -e auth.permission -e contenttypes --settings=config.settings_local
+#   python manage.py runserver --settings=config.settings_local
+#   python manage.py loadtest --url http://127.0.0.1:8000 \
+#       --settings=config.settings_local
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'local.sqlite3',
+        # writers queue for the lock instead of failing at once
+        'OPTIONS': {'timeout': 20},
+    },
+}
+DATABASE_REPLICAS = []
+# the load generator's virtual users all share one IP, and one bucket
+THROTTLE_ENABLED = False
@@ -0,0 +1,19 @@
+# Primary and replica as two SQLite files, for exercising the database
+# router locally:
+#   python manage.py test config --settings=config.settings_replica
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'primary.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_primary.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+    },
+}
+DATABASE_REPLICAS = ['replica']
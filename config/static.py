@@ -0,0 +1,159 @@
+import gzip
+import mimetypes
+import os
+import re
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.http import FileResponse, HttpResponseNotModified
+
+# encodings in order of preference, with the suffix of their files
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = {'.css', '.js', '.svg', '.txt', '.xml', '.json', '.html',
+                '.map', '.ico'}
+# a variant has to save at least this much to be worth a request header
+MIN_SAVING = 0.05
+
+_accepts = re.compile(r'\b(br|gzip)\b')
+
+
+def compress(path):
+    """
+    Writes path.br and path.gz next to path, unless the file does not
+    compress. Returns the encodings written.
+    """
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br':
+            body = brotli.compress(data, quality=11)
+        else:
+            # mtime=0 keeps rebuilds of an unchanged file byte for byte equal
+            body = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(body) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(body)
+            written.append(encoding)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also precompresses every collected file to
+    brotli and gzip, so collectstatic is the whole asset build.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                names.update(filter(None, (name, hashed_name)))
+        if not dry_run:
+            for name in sorted(names):
+                compress(self.path(name))
+
+
+class Asset:
+    __slots__ = ('content_type', 'cache_control', 'variants')
+
+    def __init__(self, content_type, cache_control, variants):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        # encoding -> (path, etag), '' for the file itself
+        self.variants = variants
+
+    def response(self, request):
+        encoding = ''
+        if len(self.variants) > 1:
+            accepted = set(_accepts.findall(
+                request.headers.get('Accept-Encoding', '')))
+            encoding = next((name for name, _ in ENCODINGS
+                             if name in accepted and name in self.variants),
+                            '')
+        path, etag = self.variants[encoding]
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type=self.content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = self.cache_control
+        if len(self.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+def collect_assets(root, hashed_names, exclude=()):
+    """Indexes the files under STATIC_ROOT by their name relative to it."""
+    immutable = (f'public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, '
+                 'immutable')
+    mutable = f'public, max-age={settings.STATIC_MAX_AGE}'
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    assets = {}
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.endswith(suffixes):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if name in exclude:
+                continue
+            variants = {'': (path, _etag(path, ''))}
+            for encoding, suffix in ENCODINGS:
+                if os.path.exists(path + suffix):
+                    variants[encoding] = (path + suffix,
+                                          _etag(path + suffix, encoding))
+            content_type = (mimetypes.guess_type(filename)[0]
+                            or 'application/octet-stream')
+            assets[name] = Asset(
+                content_type,
+                immutable if name in hashed_names else mutable, variants)
+    return assets
+
+
+def _etag(path, encoding):
+    stat = os.stat(path)
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}{suffix}"'
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected static files from the worker, picking the
+    precompressed variant the client accepts. Names with a content hash
+    are cached by browsers for good, others for STATIC_MAX_AGE.
+
+    STATIC_ROOT is indexed once when the worker starts, so a request
+    costs a dict lookup and an open(); with a file_wrapper (gunicorn,
+    uwsgi) the body goes out with sendfile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.assets = {}
+        if settings.STATIC_ROOT and os.path.isdir(settings.STATIC_ROOT):
+            hashed_names = set(getattr(staticfiles_storage, 'hashed_files',
+                                       {}).values())
+            manifest = getattr(staticfiles_storage, 'manifest_name', None)
+            self.assets = collect_assets(settings.STATIC_ROOT, hashed_names,
+                                         exclude={manifest})
+
+    def __call__(self, request):
+        if (self.assets and request.method in ('GET', 'HEAD')
+                and request.path_info.startswith(self.prefix)):
+            asset = self.assets.get(request.path_info[len(self.prefix):])
+            if asset is not None:
+                return asset.response(request)
+        return self.get_response(request)
@@ -0,0 +1,50 @@
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class ExplainMixin:
+    """
+    Assertions on query plans, so a query change that stops using its
+    index fails a test instead of turning into a sequential scan.
+    """
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            self._prefer_indexes()
+            return queryset.explain()
+
+    def explain_sql(self, sql):
+        with transaction.atomic():
+            self._prefer_indexes()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'{connection.ops.explain_query_prefix()} {sql}')
+                return '\n'.join(' '.join(map(str, row))
+                                 for row in cursor.fetchall())
+
+    def _prefer_indexes(self):
+        if connection.vendor == 'postgresql':
+            # tiny test tables are cheaper to scan, make the planner
+            # show the index it would use on real data
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan,
+                      f'{index_name} not used, plan:\n{plan}')
+        return plan
+
+    def assertQueriesUseIndex(self, index_name, run, *args, **kwargs):
+        """
+        Calls run(*args, **kwargs), e.g. a view through the test client,
+        and checks that one of the SELECTs it made uses the index.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = run(*args, **kwargs)
+        plans = [self.explain_sql(query['sql']) for query in queries
+                 if query['sql'].startswith('SELECT')]
+        self.assertTrue(any(index_name in plan for plan in plans),
+                        f'{index_name} not used, plans:\n'
+                        + '\n\n'.join(plans))
+        return result
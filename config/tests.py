@@ -0,0 +1,710 @@
+import contextvars
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+import brotli
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils.module_loading import autodiscover_modules
+from prometheus_client import REGISTRY
+from shop.models import Category, Product
+from orders import outbox
+from orders.models import Order
+from celery import Celery
+from celery.concurrency.prefork import TaskPool
+from celery.fixups.django import DjangoWorkerFixup
+from . import tracing
+from .cache import LocalLRU, TieredCache
+from .celery import app as celery_app
+from .worker import worker_argv
+from .db_router import PrimaryReplicaRouter, pinned, wrote
+from .pooled_postgresql import base as pooled_base, pool as db_pool
+from .pooled_postgresql.base import close_pools
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Тесты маршрутизации чтения на реплику"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.tokens = [pinned.set(False), wrote.set(False)]
+
+    def tearDown(self):
+        pinned.reset(self.tokens[0])
+        wrote.reset(self.tokens[1])
+
+    def test_catalog_reads_go_to_replica(self):
+        """Чтение каталога идет на реплику"""
+        self.assertEqual(self.router.db_for_read(Product), 'replica')
+
+    def test_orders_stay_on_primary(self):
+        """Заказы читаются и пишутся в основную базу"""
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    def test_reads_after_write_stick_to_primary(self):
+        """После записи чтение идет в основную базу"""
+        self.router.db_for_write(Order)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_pinned_client_reads_primary(self):
+        """Закрепленный клиент читает из основной базы"""
+        pinned.set(True)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_cache_writes_do_not_pin(self):
+        """Записи DatabaseCache не закрепляют клиента"""
+        entry = DatabaseCache('cache_table', {}).cache_model_class
+        self.router.db_for_write(entry)
+        self.assertEqual(self.router.db_for_read(Product), 'replica')
+
+    def test_write_outside_request_does_not_pin(self):
+        """Запись вне запроса (задача, команда) не закрепляет поток"""
+        def task():
+            self.router.db_for_write(Order)
+            return self.router.db_for_read(Product)
+        # a fresh context, as in a Celery worker thread
+        self.assertEqual(contextvars.Context().run(task), 'replica')
+
+
+@skipUnless('replica' in settings.DATABASES,
+            'run with --settings=config.settings_replica')
+class ReplicaIntegrationTests(TransactionTestCase):
+    """Основная база и реплика в двух файлах SQLite"""
+    databases = '__all__'
+
+    def setUp(self):
+        # a product that has reached the replica but not the primary
+        # lets the test see which database served a read
+        category = Category.objects.using('replica').create(
+            name='Tea', slug='tea')
+        self.replica_only = Product.objects.using('replica').create(
+            category=category, name='Puer', slug='puer',
+            price=Decimal('10.00'))
+        primary_category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(
+            category=primary_category, name='Sencha', slug='sencha',
+            price=Decimal('10.00'))
+
+    def test_read_your_writes(self):
+        """После записи клиент видит основную базу"""
+        url = reverse('shop:product_detail',
+                      args=[self.replica_only.id, self.replica_only.slug])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '1', 'override': False})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class MetricsViewTests(TestCase):
+    """Тесты доступа к /metrics/"""
+
+    def test_internal_network(self):
+        """Сборщик из внутренней сети получает метрики"""
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'tea_shop_', response.content)
+
+    def test_external_client_forbidden(self):
+        """Внешний клиент без прав сотрудника получает 403"""
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+    def test_staff(self):
+        """Сотрудник видит метрики откуда угодно"""
+        self.client.force_login(User.objects.create_user(
+            'staff', password='x', is_staff=True))
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 200)
+
+
+class TracingTests(TestCase):
+    """Тесты трассировки запросов"""
+
+    def setUp(self):
+        self.spans = tracing.get_exporter().spans
+        self.spans.clear()
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(category=category,
+                                              name='Sencha', slug='sencha',
+                                              price=Decimal('10.00'))
+
+    def trace(self, trace_id):
+        return {s['name']: s for s in self.spans
+                if s['trace_id'] == trace_id}
+
+    def test_request_id_generated_and_echoed(self):
+        """Запрос получает идентификатор, он возвращается в заголовке"""
+        response = self.client.get(reverse('shop:product_list'))
+        trace_id = response['X-Request-ID']
+        self.assertEqual(len(trace_id), 32)
+        self.assertEqual(self.trace(trace_id)['request']['status'], 200)
+
+    def test_request_id_taken_from_header(self):
+        """Идентификатор клиента принимается, некорректный заменяется"""
+        response = self.client.get(reverse('shop:product_list'),
+                                   HTTP_X_REQUEST_ID='abc-123')
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+        response = self.client.get(reverse('shop:product_list'),
+                                   HTTP_X_REQUEST_ID='bad id\n')
+        self.assertNotEqual(response['X-Request-ID'], 'bad id\n')
+
+    def test_view_sql_and_template_spans(self):
+        """Фазы представления, SQL и шаблона записываются как спаны"""
+        self.client.get(reverse('shop:product_list'),
+                        HTTP_X_REQUEST_ID='req-1')
+        spans = [s for s in self.spans if s['trace_id'] == 'req-1']
+        by_id = {s['span_id']: s for s in spans}
+        names = {s['name'] for s in spans}
+        self.assertTrue({'request', 'view', 'sql', 'template'} <= names)
+        view = next(s for s in spans if s['name'] == 'view')
+        self.assertEqual(view['view'], 'shop:product_list')
+        self.assertEqual(by_id[view['parent_id']]['name'], 'request')
+        for child in spans:
+            if child['name'] in ('sql', 'template'):
+                self.assertIn(child['parent_id'], by_id)
+
+    def test_task_joins_request_trace(self):
+        """Задача из outbox продолжает трассу оформившего заказ запроса"""
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]),
+                         data={'quantity': '1', 'override': False})
+        self.client.post(reverse('orders:order_create'), data={
+            'first_name': 'John', 'last_name': 'Doe',
+            'email': 'john@example.com', 'address': '123 Main St',
+            'postal_code': '12345', 'city': 'New York',
+        }, HTTP_X_REQUEST_ID='checkout-1')
+        with patch('orders.invoices.render_invoice'):
+            outbox.relay()
+        tasks = {s['task']: s for s in self.spans
+                 if s['trace_id'] == 'checkout-1' and s['name'] == 'task'}
+        self.assertEqual(tasks['orders.tasks.order_created']['state'],
+                         'SUCCESS')
+        self.assertIn('orders.tasks.generate_invoice', tasks)
+
+    def test_publish_injects_headers(self):
+        """Идентификатор трассы передается в заголовках задачи"""
+        headers = {}
+        tracing.inject_trace_headers(headers=headers)
+        self.assertEqual(headers, {})
+        with tracing.Span('t-1', 'request') as root:
+            tracing.inject_trace_headers(headers=headers)
+        self.assertEqual(headers, {'trace_id': 't-1',
+                                   'trace_parent': root.span_id})
+
+    def test_log_records_carry_trace_id(self):
+        """Записи журнала содержат идентификатор трассы"""
+        record = logging.makeLogRecord({})
+        with tracing.Span('t-2', 'request'):
+            tracing.TraceFilter().filter(record)
+        self.assertEqual(record.trace_id, 't-2')
+        tracing.TraceFilter().filter(record)
+        self.assertEqual(record.trace_id, '-')
+
+    def test_span_is_noop_outside_trace(self):
+        """Вне трассы спаны не записываются"""
+        with tracing.span('sql'):
+            pass
+        self.assertEqual(len(self.spans), 0)
+
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+class CeleryRoutingTests(SimpleTestCase):
+    """Тесты маршрутизации задач по очередям"""
+
+    def setUp(self):
+        # the project's configuration, publishing to an in-memory broker;
+        # without fixups, as the Django one of a second app recurses into
+        # the first on worker_init
+        self.app = Celery('routing-test', fixups=[])
+        self.app.config_from_object('django.conf:settings',
+                                    namespace='CELERY')
+        self.connection = self.app.connection_for_write('memory://')
+
+    def tearDown(self):
+        self.connection.release()
+        self.app.close()
+
+    def send(self, name, args=()):
+        self.app.send_task(name, args, producer=self.connection.Producer())
+
+    def receive(self, queue):
+        return self.connection.default_channel.basic_get(queue, no_ack=True)
+
+    def test_every_task_is_routed(self):
+        """У каждой задачи проекта есть очередь"""
+        autodiscover_modules('tasks')
+        tasks = {name for name in celery_app.tasks
+                 if not name.startswith('celery.')}
+        self.assertEqual(tasks - set(settings.CELERY_TASK_ROUTES), set())
+
+    def test_tasks_land_in_their_queues(self):
+        """Задачи попадают в свою очередь с приоритетом"""
+        for name, route in settings.CELERY_TASK_ROUTES.items():
+            self.send(name, [1])
+            message = self.receive(route['queue'])
+            self.assertIsNotNone(message, name)
+            self.assertEqual(message.headers['task'], name)
+            self.assertEqual(message.properties['priority'],
+                             route['priority'])
+
+    def test_transactional_not_behind_batch(self):
+        """Бэклог пакетных задач не задерживает подтверждения заказов"""
+        for _ in range(100):
+            self.send('reports.tasks.update_sales_rollups')
+        self.send('orders.tasks.order_created', [1])
+        message = self.receive('transactional')
+        self.assertEqual(message.headers['task'],
+                         'orders.tasks.order_created')
+
+    def test_ack_policy_per_workload(self):
+        """acks_late задается классом нагрузки"""
+        autodiscover_modules('tasks')
+        self.assertTrue(celery_app.tasks['orders.tasks.order_created']
+                        .acks_late)
+        self.assertTrue(celery_app.tasks[
+            'reports.tasks.update_sales_rollups'].acks_late)
+        self.assertFalse(celery_app.tasks['orders.tasks.purge_outbox']
+                         .acks_late)
+
+    def test_worker_profiles(self):
+        """Профиль воркера слушает только свою очередь"""
+        argv = worker_argv('batch')
+        self.assertEqual(argv[argv.index('--queues') + 1], 'batch')
+        self.assertEqual(argv[argv.index('--prefetch-multiplier') + 1], '1')
+        with self.assertRaises(SystemExit):
+            worker_argv('default')
+
+
+class StaticFilesTests(SimpleTestCase):
+    """Тесты раздачи статики"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        # only the shop's own files, the admin's take seconds to compress
+        static = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STATICFILES_DIRS=[settings.BASE_DIR / 'shop' / 'static'],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.'
+                                 'FileSystemFinder'],
+            STATICFILES_STORAGE='config.static.'
+                                'CompressedManifestStaticFilesStorage')
+        static.enable()
+        cls.addClassCleanup(static.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.css = staticfiles_storage.stored_name('css/base.css')
+
+    def get(self, name, **headers):
+        response = self.client.get(settings.STATIC_URL + name, **headers)
+        if response.status_code == 200:
+            self.addCleanup(response.close)
+        return response
+
+    def test_collectstatic_precompresses(self):
+        """collectstatic хеширует имена и сжимает текстовые файлы"""
+        self.assertNotEqual(self.css, 'css/base.css')
+        for suffix in ('.br', '.gz'):
+            self.assertTrue(os.path.exists(
+                os.path.join(self.static_root, self.css + suffix)))
+        png = staticfiles_storage.stored_name('img/no_image.png')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.static_root, png + '.gz')))
+
+    def test_serves_preferred_encoding(self):
+        """Отдается лучший вариант из принимаемых клиентом"""
+        with open(os.path.join(self.static_root, self.css), 'rb') as f:
+            original = f.read()
+        cases = (('gzip, deflate, br', 'br', brotli.decompress),
+                 ('gzip', 'gzip', gzip.decompress),
+                 ('', None, bytes))
+        for accept, encoding, decode in cases:
+            response = self.get(self.css, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get('Content-Encoding'), encoding)
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(decode(b''.join(response.streaming_content)),
+                             original)
+
+    def test_hashed_names_are_immutable(self):
+        """Файлы с хешем кешируются навсегда, без хеша — ненадолго"""
+        response = self.get(self.css)
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.get('css/base.css')
+        self.assertEqual(response['Cache-Control'],
+                         f'public, max-age={settings.STATIC_MAX_AGE}')
+
+    def test_not_modified(self):
+        """Совпавший ETag дает 304"""
+        etag = self.get(self.css, HTTP_ACCEPT_ENCODING='br')['ETag']
+        response = self.get(self.css, HTTP_ACCEPT_ENCODING='br',
+                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # the gzip variant has its own tag
+        response = self.get(self.css, HTTP_ACCEPT_ENCODING='gzip',
+                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_files_fall_through(self):
+        """Неизвестные и служебные файлы не отдаются"""
+        self.assertEqual(self.get('css/missing.css').status_code, 404)
+        self.assertEqual(self.get('staticfiles.json').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+    def test_templates_link_hashed_names(self):
+        """Шаблоны ссылаются на хешированные имена"""
+        self.assertEqual(staticfiles_storage.url('css/base.css'),
+                         settings.STATIC_URL + self.css)
+
+    def test_media_served_without_debug(self):
+        """Загруженные файлы отдаются и при DEBUG=False"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with open(os.path.join(media_root, 'tea.txt'), 'w') as f:
+            f.write('sencha')
+        with override_settings(MEDIA_ROOT=media_root, DEBUG=False):
+            response = self.client.get(settings.MEDIA_URL + 'tea.txt')
+            self.assertEqual(b''.join(response.streaming_content),
+                             b'sencha')
+
+
+class TieredCacheTests(SimpleTestCase):
+    """Тесты двухуровневого кеша"""
+
+    THREADS = 20
+
+    def setUp(self):
+        caches['default'].clear()
+        caches[settings.TIERED_CACHE_LOCK_ALIAS].clear()
+        self.cache = TieredCache(f'test-{self._testMethodName}', timeout=60)
+        self.computed = 0
+        self.lock = threading.Lock()
+
+    def compute(self, value='new', seconds=0.2):
+        with self.lock:
+            self.computed += 1
+        time.sleep(seconds)
+        return value
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(
+            name, {'cache': self.cache.name, **labels}) or 0
+
+    def run_threads(self, key):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(self.cache.get_or_compute(key, self.compute))
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_tiers(self):
+        """Повторное чтение идет из локального, затем из общего кеша"""
+        self.assertEqual(self.cache.get_or_compute('k', self.compute), 'new')
+        self.assertEqual(self.cache.get_or_compute('k', self.compute), 'new')
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get_or_compute('k', self.compute), 'new')
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(self.sample('tea_shop_cache_misses_total'), 1)
+        self.assertEqual(self.sample('tea_shop_cache_recomputes_total',
+                                     reason='miss'), 1)
+        self.assertEqual(self.sample('tea_shop_cache_hits_total',
+                                     tier='local'), 1)
+        self.assertEqual(self.sample('tea_shop_cache_hits_total',
+                                     tier='shared'), 1)
+
+    def test_concurrent_miss_computed_once(self):
+        """Отсутствующий ключ вычисляется один раз, остальные ждут"""
+        results = self.run_threads('k')
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(results, ['new'] * self.THREADS)
+
+    def test_concurrent_expired_key_computed_once(self):
+        """Истекший ключ пересчитывается один раз, остальным - старое"""
+        caches['default'].set(self.cache.shared_key('k'),
+                              ('old', time.time() - 1, 0.01))
+        results = self.run_threads('k')
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(set(results), {'old', 'new'})
+        self.assertEqual(self.sample('tea_shop_cache_recomputes_total',
+                                     reason='expired'), 1)
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get_or_compute('k', self.compute), 'new')
+
+    def test_early_refresh(self):
+        """Дорогой в вычислении ключ обновляется до истечения"""
+        key = self.cache.shared_key('k')
+        caches['default'].set(key, ('old', time.time() + 1, 0.0))
+        self.assertEqual(self.cache.get_or_compute('k', self.compute), 'old')
+        self.cache.local.clear()
+        caches['default'].set(key, ('old', time.time() + 1, 10.0))
+        # the draw that refreshes earliest, so it is certain
+        with patch('config.cache.random.random', return_value=1 - 1e-9):
+            self.assertEqual(self.cache.get_or_compute('k', self.compute),
+                             'new')
+        self.assertEqual(self.sample('tea_shop_cache_recomputes_total',
+                                     reason='early'), 1)
+
+    def test_lock_in_lock_cache(self):
+        """Блокировка берется в кеше с атомарным add()"""
+        cache = TieredCache('test-lock', timeout=60, alias='catalog')
+        lock_key = f'{cache.shared_key("k")}:lock'
+        held = []
+
+        def compute():
+            held.append((caches[settings.TIERED_CACHE_LOCK_ALIAS]
+                         .get(lock_key) is not None,
+                         caches['catalog'].get(lock_key)))
+            return 'new'
+        self.assertEqual(cache.get_or_compute('k', compute), 'new')
+        self.assertEqual(held, [(True, None)])
+        self.assertIsNone(
+            caches[settings.TIERED_CACHE_LOCK_ALIAS].get(lock_key))
+
+    def test_local_tier_is_bounded(self):
+        """Локальный кеш вытесняет давно не читанные ключи"""
+        lru = LocalLRU(2)
+        now = time.time()
+        for key in 'abc':
+            lru.set(key, key, now + 60)
+            lru.get('a', now)
+        self.assertEqual(list(lru.entries), ['c', 'a'])
+        self.assertIsNone(lru.get('a', now + 61))
+
+
+class FakeConnection:
+    """Соединение DB-API без сервера"""
+
+    isolation_level = None
+    server_version = 150000
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.pings = 0
+        self.rollbacks = 0
+        self.fail_ping = False
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                connection.pings += 1
+                if connection.fail_ping:
+                    connection.closed = 2
+                    raise OSError('server closed the connection')
+
+            def close(self):
+                pass
+        return Cursor()
+
+    def rollback(self):
+        if self.closed:
+            raise OSError('connection already closed')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+    def set_client_encoding(self, encoding):
+        pass
+
+    def get_parameter_status(self, name):
+        return 'UTC'
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Тесты пула соединений с базой"""
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def make_pool(self, **options):
+        return db_pool.ConnectionPool(f'test-{self._testMethodName}',
+                                      self.connect, **options)
+
+    def test_connection_reused(self):
+        """Возвращенное соединение выдается снова без нового подключения"""
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(first.pings, 0)
+        self.assertEqual(first.rollbacks, 1)
+
+    def test_full_pool_waits_then_times_out(self):
+        """Сверх max_size ждут освобождения, затем ошибка"""
+        pool = self.make_pool(max_size=1, timeout=0.5)
+        first = pool.getconn()
+        threading.Timer(0.05, pool.putconn, [first]).start()
+        self.assertIs(pool.getconn(), first)
+        pool.timeout = 0.05
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.getconn()
+        self.assertEqual(len(self.opened), 1)
+
+    def test_idle_connection_checked(self):
+        """Долго простоявшее соединение проверяется, мертвое заменяется"""
+        pool = self.make_pool(check_after=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(first.pings, 1)
+        pool.putconn(first)
+        first.fail_ping = True
+        second = pool.getconn()
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.size(), 1)
+
+    def test_broken_and_old_connections_discarded(self):
+        """Сломанные и отжившие свое соединения закрываются"""
+        pool = self.make_pool(max_lifetime=60)
+        broken = pool.getconn()
+        broken.closed = 2
+        pool.putconn(broken)
+        old = pool.getconn()
+        self.assertIsNot(old, broken)
+        with patch.object(db_pool.time, 'monotonic',
+                          return_value=time.monotonic() + 61):
+            pool.putconn(old)
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.size(), 0)
+
+    def test_idle_connections_expire_above_min_size(self):
+        """Простаивающие соединения закрываются, кроме min_size"""
+        pool = self.make_pool(min_size=1, max_idle=60)
+        connections = [pool.getconn() for _ in range(3)]
+        for connection in connections:
+            pool.putconn(connection)
+        with patch.object(db_pool.time, 'monotonic',
+                          return_value=time.monotonic() + 61):
+            pool.putconn(pool.getconn())
+        self.assertEqual(pool.size(), 1)
+        self.assertEqual(sum(1 for c in connections if c.closed), 2)
+
+    def test_child_after_fork_leaves_parent_connections(self):
+        """После fork пул открывает свои соединения и не трогает чужие"""
+        pool = self.make_pool()
+        idle, used = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+        with patch.object(db_pool.os, 'getpid', return_value=-1):
+            fresh = pool.getconn()
+            self.assertNotIn(fresh, (idle, used))
+            pool.putconn(used)
+            pool.close()
+        self.assertFalse(idle.closed or used.closed)
+        self.assertIn(idle, db_pool._inherited)
+        self.assertIn(used, db_pool._inherited)
+
+    def test_closed_pool_closes_returned(self):
+        """Закрытый пул закрывает и возвращаемые соединения"""
+        pool = self.make_pool()
+        idle, used = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+        pool.close()
+        pool.putconn(used)
+        self.assertTrue(idle.closed and used.closed)
+
+    def test_backend_takes_connections_from_pool(self):
+        """Django открывает и закрывает соединение, пул его переиспользует"""
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'config.pooled_postgresql',
+            'NAME': f'pool_{self._testMethodName}',
+            'OPTIONS': {'pool': {'max_size': 1, 'timeout': 0.05}},
+        }})
+        wrapper = handler['default']
+        self.assertNotIn('pool', wrapper.get_connection_params())
+        with patch('config.pooled_postgresql.base.connect',
+                   side_effect=lambda *args: self.connect()):
+            for _ in range(3):
+                wrapper.ensure_connection()
+                wrapper.close()
+            self.assertEqual(len(self.opened), 1)
+            other = ConnectionHandler(handler.settings)['default']
+            wrapper.ensure_connection()
+            with self.assertRaises(OperationalError):
+                other.ensure_connection()
+            wrapper.close()
+            close_pools(f'pool_{self._testMethodName}')
+        self.assertTrue(self.opened[0].closed)
+
+    def test_celery_task_hooks_keep_pool(self):
+        """Celery закрывает соединение вокруг задач, пул остается"""
+        name = f'pool_{self._testMethodName}'
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'config.pooled_postgresql', 'NAME': name,
+            'OPTIONS': {'pool': {'max_size': 1}},
+        }})
+        fixup = DjangoWorkerFixup(celery_app, Mock(pool_cls=TaskPool))
+        self.assertIsNone(fixup.db_reuse_max)
+        fixup._db = Mock(connections=handler)
+        fixup._settings = Mock(DATABASES=handler.settings)
+        task = Mock(request=Mock(is_eager=False))
+        self.addCleanup(close_pools, name)
+        with patch('config.pooled_postgresql.base.connect',
+                   side_effect=lambda *args: self.connect()):
+            for _ in range(3):
+                fixup.on_task_prerun(task)
+                handler['default'].ensure_connection()
+                fixup.on_task_postrun(task)
+        self.assertEqual(len(self.opened), 1)
+        self.assertFalse(self.opened[0].closed)
+        # in a forked child the parent's pool is dropped, its
+        # connections left alone
+        [pool] = [pool for key, pool in pooled_base._pools.items()
+                  if key[0] == name]
+        pool.pid = None
+        fixup.on_task_prerun(task)
+        self.assertNotIn(pool, pooled_base._pools.values())
+        self.assertFalse(self.opened[0].closed)
+        self.assertIn(self.opened[0], db_pool._inherited)
+
@@ -0,0 +1,86 @@
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_REQUESTS = Counter('tea_shop_throttled_requests_total',
+                             'Requests rejected by the rate limiter',
+                             ['scope'])
+
+
+class TokenBucket:
+    """
+    Token bucket kept in the Django cache with atomic increments only.
+    The limit holds across processes only if the THROTTLE_CACHE_ALIAS
+    cache is shared and its incr() atomic, like Redis; with LocMemCache
+    every process has its own buckets.
+
+    Tokens taken are counted per refill period. The count of the previous
+    period drains linearly over the current one, which gives the bucket
+    its continuous refill without a read-modify-write cycle.
+    """
+
+    def __init__(self, scope, capacity, rate):
+        self.scope = scope
+        self.capacity = capacity
+        self.rate = rate
+        self.period = capacity / rate
+
+    def consume(self, ident, now=None):
+        # returns 0 when a token was available, else seconds to wait
+        now = time.time() if now is None else now
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        window, progress = divmod(now / self.period, 1)
+        key = f'throttle:{self.scope}:{ident}:{int(window)}'
+        cache.add(key, 0, timeout=math.ceil(self.period * 2))
+        try:
+            taken = cache.incr(key)
+        except ValueError:
+            # evicted between add and incr, let the request through
+            return 0
+        previous = cache.get(f'throttle:{self.scope}:{ident}:{int(window) - 1}', 0)
+        level = previous * (1 - progress) + taken
+        if level <= self.capacity:
+            return 0
+        # a rejected request takes no token, so a client retrying faster
+        # than rate still gets rate requests through
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+        return max(1, math.ceil((level - self.capacity) / self.rate))
+
+
+def client_ident(request):
+    # not the session, a client could drop or rotate its cookie to get
+    # a fresh bucket
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def throttle(scope, methods=('POST',)):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            config = settings.THROTTLE_RATES.get(scope)
+            if (settings.THROTTLE_ENABLED and config
+                    and request.method in methods):
+                bucket = TokenBucket(scope, **config)
+                wait = bucket.consume(client_ident(request))
+                if wait:
+                    THROTTLED_REQUESTS.labels(scope).inc()
+                    logger.warning('Throttled %s request from %s',
+                                   scope, client_ident(request))
+                    response = HttpResponse('Too many requests',
+                                            status=429)
+                    response['Retry-After'] = str(wait)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
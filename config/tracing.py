@@ -0,0 +1,234 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('tea_shop.spans')
+
+REQUEST_HEADER = 'X-Request-ID'
+# celery message headers, set on publish and read back by the worker
+TRACE_HEADER = 'trace_id'
+PARENT_HEADER = 'trace_parent'
+
+_valid_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_current = ContextVar('tracing_span', default=None)
+_noop = nullcontext()
+_exporter = None
+
+
+class Span:
+    """
+    A timed phase of a trace. Entering a span makes it the parent of
+    spans started inside it; leaving it hands it to the exporter.
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attrs',
+                 'start', '_started', '_token')
+
+    def __init__(self, trace_id, name, parent_id=None, **attrs):
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        get_exporter().export({
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': (time.perf_counter() - self._started) * 1000,
+            **self.attrs,
+        })
+
+
+def new_trace_id():
+    # correlation only, so no need for the urandom call of uuid4
+    return '%032x' % random.getrandbits(128)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def span(name, **attrs):
+    # a no-op outside of a trace, so library code can always call it
+    parent = _current.get()
+    if parent is None:
+        return _noop
+    return Span(parent.trace_id, name, parent.span_id, **attrs)
+
+
+class LogExporter:
+    """Writes every span as one JSON line to the tea_shop.spans logger."""
+
+    def export(self, span):
+        logger.info(json.dumps(span, default=str))
+
+
+class MemoryExporter:
+    """Keeps the latest spans in memory, for tests and the shell."""
+
+    def __init__(self, maxlen=1000):
+        self.spans = deque(maxlen=maxlen)
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        _exporter = import_string(settings.TRACING_EXPORTER)()
+    return _exporter
+
+
+@receiver(setting_changed)
+def reset_exporter(setting, **kwargs):
+    global _exporter
+    if setting == 'TRACING_EXPORTER':
+        _exporter = None
+
+
+class TraceFilter(logging.Filter):
+    """Adds the current trace id to log records as %(trace_id)s."""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id() or '-'
+        return True
+
+
+def trace_sql(execute, sql, params, many, context):
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    with span('sql', alias=context['connection'].alias, sql=sql[:200]):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_sql_tracing(connection, **kwargs):
+    # once per connection instead of an execute_wrapper() per request;
+    # the signal fires again on reconnects, hence the check
+    if trace_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_sql)
+
+
+class TracingMiddleware:
+    """
+    Starts a trace for every request, taking its id from the
+    X-Request-ID header when the client sends a usable one, and records
+    the view, its SQL queries and the templates it renders as spans.
+    The id is echoed back in the response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+        trace_id = request.headers.get(REQUEST_HEADER, '')
+        if not _valid_id.match(trace_id):
+            trace_id = new_trace_id()
+        request.trace_id = trace_id
+        with Span(trace_id, 'request', method=request.method,
+                  path=request.path) as root:
+            try:
+                response = self.get_response(request)
+            finally:
+                view = getattr(request, '_trace_view', None)
+                if view is not None:
+                    view.__exit__(None, None, None)
+            root.attrs['status'] = response.status_code
+        response[REQUEST_HEADER] = trace_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = span('view', view=request.resolver_match.view_name)
+        if view is not _noop:
+            request._trace_view = view.__enter__()
+
+
+class TracedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with span('template', template=self.origin.template_name):
+            return super().render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, recording each render as a span."""
+
+    def from_string(self, template_code):
+        return TracedTemplate(super().from_string(template_code).template,
+                              self)
+
+    def get_template(self, template_name):
+        return TracedTemplate(super().get_template(template_name).template,
+                              self)
+
+
+# task id -> span of the tasks this worker is running
+_task_spans = {}
+
+
+@before_task_publish.connect
+def inject_trace_headers(headers=None, **kwargs):
+    parent = _current.get()
+    if parent is not None and headers is not None:
+        headers.setdefault(TRACE_HEADER, parent.trace_id)
+        headers.setdefault(PARENT_HEADER, parent.span_id)
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    if not settings.TRACING_ENABLED:
+        return
+    headers = task.request.headers or {}
+    trace_id = headers.get(TRACE_HEADER)
+    parent_id = headers.get(PARENT_HEADER)
+    if not trace_id:
+        # eager tasks run inside the caller's trace
+        parent = _current.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id = new_trace_id()
+    _task_spans[task_id] = Span(trace_id, 'task', parent_id,
+                                task=task.name, task_id=task_id).__enter__()
+
+
+@task_postrun.connect
+def finish_task_span(task_id=None, state=None, **kwargs):
+    task_span = _task_spans.pop(task_id, None)
+    if task_span is not None:
+        task_span.attrs['state'] = state
+        task_span.__exit__(None, None, None)
@@ -1,15 +1,23 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiler/', include('profiler.urls', namespace='profiler')),
     path('cart/', include('cart.urls', namespace='cart')),
     path('orders/', include('orders.urls', namespace='orders')),
+    path('payments/', include('payments.urls', namespace='payments')),
     path('', include('shop.urls', namespace='shop')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+if settings.SERVE_MEDIA:
+    # static() only adds the route with DEBUG on
+    media_prefix = re.escape(settings.MEDIA_URL.lstrip('/'))
+    urlpatterns += [
+        re_path(rf'^{media_prefix}(?P<path>.*)$', views.media),
+    ]
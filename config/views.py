@@ -0,0 +1,27 @@
+import ipaddress
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views.static import serve
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+
+def from_internal_network(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics(request):
+    # scraped from inside the network, staff can also open it in a browser
+    if not (request.user.is_staff or from_internal_network(request)):
+        raise PermissionDenied
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
+def media(request, path):
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,32 @@
+"""
+Starts a Celery worker with the profile of one workload class from
+settings.TASK_WORKLOADS, consuming only that class's queue:
+
+    python -m config.worker transactional [extra celery worker options]
+"""
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def worker_argv(queue):
+    from django.conf import settings
+    try:
+        profile = settings.TASK_WORKLOADS[queue]
+    except KeyError:
+        raise SystemExit(f'Unknown queue {queue!r}, expected one of '
+                         f'{", ".join(settings.TASK_WORKLOADS)}')
+    return ['worker',
+            '--queues', queue,
+            '--hostname', f'{queue}@%h',
+            '--concurrency', str(profile['concurrency']),
+            '--prefetch-multiplier', str(profile['prefetch_multiplier']),
+            '--loglevel', 'info']
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    from config.celery import app
+    app.worker_main(worker_argv(sys.argv[1]) + sys.argv[2:])
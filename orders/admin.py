@@ -1,14 +1,69 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils.html import format_html
+from .history import normalize_email
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+class EmailSearchMixin:
+    # an exact match on the normalized email uses the email index, the
+    # admin's own search would compare case-insensitively and scan
+    def get_search_results(self, request, queryset, search_term):
+        if '@' in search_term:
+            return queryset.filter(email=normalize_email(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ['product']
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(EmailSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'first_name', 'last_name', 'email',
                     'address', 'postal_code', 'city', 'paid',
-                    'created', 'updated']
+                    'created', 'updated', 'invoice']
     list_filter = ['paid', 'created', 'updated']
+    search_fields = ['=id']
     inlines = [OrderItemInline]
+
+    @admin.display(description='Invoice')
+    def invoice(self, obj):
+        url = reverse('orders:order_invoice', args=[obj.id])
+        return format_html('<a href="{}">View</a>', url)
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # archived orders keep their ids, so old links keep working
+        if (object_id.isdigit()
+                and not Order.objects.filter(id=object_id).exists()
+                and ArchivedOrder.objects.filter(id=object_id).exists()):
+            return redirect(reverse('admin:orders_archivedorder_change',
+                                    args=[object_id]))
+        return super().change_view(request, object_id, form_url,
+                                   extra_context)
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    raw_id_fields = ['product']
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(EmailSearchMixin, admin.ModelAdmin):
+    list_display = ['id', 'first_name', 'last_name', 'email',
+                    'city', 'paid', 'created', 'archived']
+    list_filter = ['created', 'archived']
+    search_fields = ['=id', 'email']
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
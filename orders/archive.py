@@ -0,0 +1,111 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, ArchivedOrder
+
+ORDER_FIELDS = ['id', 'first_name', 'last_name', 'email', 'address',
+                'postal_code', 'city', 'created', 'updated', 'paid']
+ITEM_FIELDS = ['id', 'order_id', 'product_id', 'price', 'quantity']
+ARCHIVE_VERSION_KEY = 'order_archive_version'
+
+
+def get_archive_version():
+    # archived orders only change when orders are moved, so reads of the
+    # archive are cached under this version; it lives in the shared cache
+    # because the Celery worker that moves orders bumps it for web
+    version = caches[settings.SHARED_CACHE_ALIAS].get(ARCHIVE_VERSION_KEY)
+    if version is None:
+        version = bump_archive_version()
+    return version
+
+
+def bump_archive_version():
+    version = time.time_ns()
+    caches[settings.SHARED_CACHE_ALIAS].set(ARCHIVE_VERSION_KEY, version,
+                                            timeout=None)
+    return version
+
+
+def _move_batch(order_model, item_model, target_order, target_item,
+                order_ids):
+    rows = list(order_model.objects.filter(id__in=order_ids)
+                .values(*ORDER_FIELDS))
+    items = [target_item(**values) for values in
+             item_model.objects.filter(order_id__in=order_ids)
+             .values(*ITEM_FIELDS)]
+    # ignore_conflicts makes a batch that was copied but not deleted
+    # before a crash safe to run again
+    target_order.objects.bulk_create([target_order(**values)
+                                      for values in rows],
+                                     ignore_conflicts=True)
+    target_item.objects.bulk_create(items, ignore_conflicts=True)
+    if target_order is Order:
+        # auto_now fields are overwritten on insert, put the originals back
+        Order.objects.bulk_update([Order(**values) for values in rows],
+                                  ['created', 'updated'])
+    item_model.objects.filter(order_id__in=order_ids).delete()
+    order_model.objects.filter(id__in=order_ids).delete()
+
+
+def _move(queryset, target, batch_size, max_batches):
+    order_model = queryset.model
+    item_model = order_model.items.rel.related_model
+    target_item = target.items.rel.related_model
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            order_ids = list(queryset.order_by('id')
+                             .values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                break
+            _move_batch(order_model, item_model, target, target_item,
+                        order_ids)
+        moved += len(order_ids)
+        batches += 1
+    if moved:
+        bump_archive_version()
+    return moved
+
+
+def archive_orders(older_than_days=None, batch_size=None, max_batches=None):
+    if older_than_days is None:
+        older_than_days = settings.ORDERS_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    queryset = Order.objects.filter(paid=True, created__lt=cutoff)
+    return _move(queryset, ArchivedOrder,
+                 batch_size or settings.ORDERS_ARCHIVE_BATCH_SIZE,
+                 max_batches)
+
+
+def restore_orders(order_ids=None, batch_size=None, max_batches=None):
+    queryset = ArchivedOrder.objects.all()
+    if order_ids is not None:
+        queryset = queryset.filter(id__in=order_ids)
+    return _move(queryset, Order,
+                 batch_size or settings.ORDERS_ARCHIVE_BATCH_SIZE,
+                 max_batches)
+
+
+def get_order(order_id, include_archive=False):
+    try:
+        return Order.objects.get(id=order_id)
+    except Order.DoesNotExist:
+        if not include_archive:
+            raise
+    try:
+        return ArchivedOrder.objects.get(id=order_id)
+    except ArchivedOrder.DoesNotExist:
+        raise Order.DoesNotExist(f'Order {order_id} does not exist')
+
+
+def all_orders(include_archive=False):
+    orders = Order.objects.values(*ORDER_FIELDS).order_by()
+    if include_archive:
+        orders = orders.union(
+            ArchivedOrder.objects.values(*ORDER_FIELDS).order_by(),
+            all=True)
+    return orders.order_by('-created')
@@ -0,0 +1,122 @@
+import logging
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+from prometheus_client import Counter
+from shop.models import Product
+from shop.money import Money
+from . import outbox
+from .models import Order, OrderItem, QueuedCheckout
+
+logger = logging.getLogger(__name__)
+
+CHECKOUTS = Counter('tea_shop_queued_checkouts_total',
+                    'Checkouts through the admission queue, by outcome',
+                    ['outcome'])
+
+
+def is_full():
+    # counted on the partial index of pending checkouts, which stays
+    # no bigger than the limit
+    return QueuedCheckout.objects.filter(
+        status=QueuedCheckout.PENDING
+    ).count() >= settings.CHECKOUT_QUEUE_MAX_PENDING
+
+
+def submit(form, cart):
+    """
+    Queues a checkout of the cart with the validated OrderCreateForm.
+    Prices are the cart's, as in a synchronous checkout.
+    """
+    # read before the transaction, which then starts with its write;
+    # SQLite fails a transaction that reads and then has to wait to write
+    lines = [[item['product'].id, item['price_cents'], item['quantity']]
+             for item in cart]
+    with transaction.atomic():
+        checkout = QueuedCheckout.objects.create(
+            customer=form.cleaned_data, lines=lines)
+        outbox.enqueue('orders.tasks.process_checkouts')
+    CHECKOUTS.labels('queued').inc()
+    return checkout
+
+
+def process(batch_size=None):
+    """
+    Turns pending checkouts into orders, a batch per transaction, and
+    returns how many were handled. Concurrent workers take disjoint
+    batches. An OperationalError, like a lock timeout, rolls the batch
+    back for the next run instead of failing its checkouts.
+    """
+    batch_size = batch_size or settings.CHECKOUT_QUEUE_BATCH_SIZE
+    handled = 0
+    while True:
+        with transaction.atomic():
+            batch = list(QueuedCheckout.objects
+                         .filter(status=QueuedCheckout.PENDING)
+                         .select_for_update(skip_locked=True)
+                         .order_by('id')[:batch_size])
+            if not batch:
+                return handled
+            try:
+                with transaction.atomic():
+                    _create_orders(batch)
+            except OperationalError:
+                raise
+            except Exception:
+                # find the checkout that fails, the others go through
+                logger.exception('Checkout batch failed, retrying one by '
+                                 'one')
+                for checkout in batch:
+                    _create_alone(checkout)
+            QueuedCheckout.objects.bulk_update(
+                batch, ['status', 'order', 'error', 'processed'])
+        handled += len(batch)
+        if len(batch) < batch_size:
+            return handled
+
+
+def _create_alone(checkout):
+    try:
+        with transaction.atomic():
+            _create_orders([checkout])
+    except OperationalError:
+        raise
+    except Exception as exc:
+        logger.exception('Could not create the order of %s', checkout)
+        checkout.status = QueuedCheckout.FAILED
+        checkout.error = str(exc)[:250]
+        checkout.processed = timezone.now()
+        CHECKOUTS.labels('failed').inc()
+
+
+def _create_orders(checkouts):
+    # lines of products deleted since are dropped, as the cart drops them
+    products = set(Product.objects.filter(
+        id__in={line[0] for checkout in checkouts
+                for line in checkout.lines}
+    ).values_list('id', flat=True))
+    orders = Order.objects.bulk_create(
+        [Order(**checkout.customer) for checkout in checkouts])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=product_id,
+                  price=Money(cents).to_decimal(), quantity=quantity)
+        for order, checkout in zip(orders, checkouts)
+        for product_id, cents, quantity in checkout.lines
+        if product_id in products])
+    outbox.enqueue_many(
+        (task, [order.id]) for order in orders
+        for task in ('orders.tasks.order_created',
+                     'orders.tasks.generate_invoice'))
+    now = timezone.now()
+    for order, checkout in zip(orders, checkouts):
+        checkout.status = QueuedCheckout.DONE
+        checkout.order = order
+        checkout.processed = now
+    CHECKOUTS.labels('created').inc(len(checkouts))
+
+
+def status(token):
+    """(status, order id) of a queued checkout, or None."""
+    return (QueuedCheckout.objects.filter(token=token)
+            .values_list('status', 'order_id').first())
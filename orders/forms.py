@@ -1,8 +1,19 @@
 from django import forms
+from .history import normalize_email
 from .models import Order
 
 class OrderCreateForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = ['first_name', 'last_name', 'email', 'address',
-                  'postal_code', 'city']
\ No newline at end of file
+                  'postal_code', 'city']
+
+    def clean_email(self):
+        return normalize_email(self.cleaned_data['email'])
+
+
+class OrderHistoryForm(forms.Form):
+    email = forms.EmailField()
+
+    def clean_email(self):
+        return normalize_email(self.cleaned_data['email'])
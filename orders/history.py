@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import (Count, DecimalField, ExpressionWrapper, F, Q,
+                              Sum, Value)
+from django.db.models.functions import Coalesce
+from config.cache import TieredCache
+from .archive import get_archive_version
+from .models import ArchivedOrder
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+LINK_SALT = 'orders.history'
+
+archive_cache = TieredCache('order_archive',
+                            settings.ORDERS_ARCHIVE_CACHE_SECONDS,
+                            alias=settings.SHARED_CACHE_ALIAS)
+
+
+def normalize_email(email):
+    # orders are saved with lowercased emails, so lookups stay an
+    # equality on the index instead of a case-insensitive scan
+    return email.strip().lower()
+
+
+def encode_cursor(order):
+    micros = (order.created - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{order.id}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, order_id = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(micros)), int(order_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def history_queryset(model, email, cursor=None):
+    """
+    Orders of a customer, newest first, each annotated with its total
+    and item count. Keyset pagination on (created, id) keeps every page
+    one range scan of the (email, -created, -id) index, however deep.
+    """
+    money = DecimalField(max_digits=12, decimal_places=2)
+    cost = ExpressionWrapper(F('items__price') * F('items__quantity'),
+                             output_field=money)
+    orders = (model.objects
+              .filter(email=normalize_email(email))
+              .annotate(total=Coalesce(Sum(cost), Value(Decimal('0.00')),
+                                       output_field=money),
+                        item_count=Count('items'))
+              .order_by('-created', '-id'))
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        created, order_id = after
+        orders = orders.filter(Q(created__lt=created)
+                               | Q(created=created, id__lt=order_id))
+    return orders
+
+
+def order_history(model, email, cursor=None, limit=None):
+    """Returns a page of orders and the cursor of the next page or None."""
+    limit = limit or settings.ORDERS_HISTORY_PAGE_SIZE
+    page = list(history_queryset(model, email, cursor)[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def archived_order_history(email, cursor=None, limit=None):
+    """order_history() of the archive, cached until orders are moved."""
+    email = normalize_email(email)
+    digest = hashlib.sha1(email.encode()).hexdigest()
+    key = f'{get_archive_version()}:{digest}:{cursor or ""}:{limit or ""}'
+    return archive_cache.get_or_compute(
+        key, lambda: order_history(ArchivedOrder, email, cursor, limit))
+
+
+def make_link_token(email):
+    return signing.dumps(normalize_email(email), salt=LINK_SALT)
+
+
+def read_link_token(token):
+    """Returns the email of a valid, unexpired token, else None."""
+    try:
+        return signing.loads(token, salt=LINK_SALT,
+                             max_age=settings.ORDERS_HISTORY_LINK_SECONDS)
+    except signing.BadSignature:
+        return None
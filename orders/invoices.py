@@ -0,0 +1,101 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from shop.money import Money
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+INVOICE_DIR = 'invoices'
+
+
+def invoice_name(order):
+    # keyed by updated, so any change to the order makes a new invoice
+    stamp = int(order.updated.timestamp() * 1_000_000)
+    return f'{INVOICE_DIR}/{order.id}/{stamp}.html'
+
+
+def load_order(order_id):
+    # archived orders keep their invoices downloadable
+    for model, item_model in ((Order, OrderItem),
+                              (ArchivedOrder, ArchivedOrderItem)):
+        items = Prefetch('items',
+                         queryset=item_model.objects.select_related('product'))
+        order = model.objects.prefetch_related(items).filter(
+            id=order_id).first()
+        if order is not None:
+            return order
+    raise Order.DoesNotExist(f'Order {order_id} does not exist')
+
+
+def render_invoice(order_id, force=False):
+    order = load_order(order_id)
+    name = invoice_name(order)
+    if force or not default_storage.exists(name):
+        items = list(order.items.all())
+        html = render_to_string('orders/order/invoice.html', {
+            'order': order,
+            'items': items,
+            'total': sum((item.get_cost() for item in items), Money()),
+        })
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(html.encode()))
+    _delete_stale(order.id, name)
+    return name
+
+
+def _delete_stale(order_id, current):
+    directory = f'{INVOICE_DIR}/{order_id}'
+    _, files = default_storage.listdir(directory)
+    for filename in files:
+        if f'{directory}/{filename}' != current:
+            default_storage.delete(f'{directory}/{filename}')
+
+
+def current_invoice(order):
+    """Returns the stored invoice of the order, or None when it is stale."""
+    name = invoice_name(order)
+    return name if default_storage.exists(name) else None
+
+
+def request_invoice(order):
+    # one task per invoice version while it is pending, however often
+    # and from whichever web process the download is retried
+    from .tasks import generate_invoice
+    if caches[settings.SHARED_CACHE_ALIAS].add(
+            f'invoice-pending:{invoice_name(order)}', True,
+            timeout=settings.ORDERS_INVOICE_PENDING_SECONDS):
+        generate_invoice.delay(order.id)
+
+
+def _render_chunk(order_ids, force):
+    for order_id in order_ids:
+        render_invoice(order_id, force)
+    return len(order_ids)
+
+
+def regenerate_invoices(order_ids, workers=None, chunk_size=100,
+                        force=False):
+    """
+    Renders the invoices of the given orders on a pool of worker
+    processes. With workers=0 everything runs in this process.
+    """
+    order_ids = list(order_ids)
+    chunks = [order_ids[i:i + chunk_size]
+              for i in range(0, len(order_ids), chunk_size)]
+    if workers == 0:
+        return sum(_render_chunk(chunk, force) for chunk in chunks)
+    # forked children must not share the parent's database connections,
+    # with none open they each connect on first use
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork')
+                             ) as pool:
+        return sum(pool.map(_render_chunk, chunks,
+                            [force] * len(chunks)))
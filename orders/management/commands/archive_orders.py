@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move old paid orders into the archive tables in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        moved = archive_orders(older_than_days=options['older_than_days'],
+                               batch_size=options['batch_size'],
+                               max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} orders'))
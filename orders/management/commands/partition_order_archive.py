@@ -0,0 +1,66 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Min
+from orders.models import Order, ArchivedOrder
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = ('Convert the order archive into a PostgreSQL table range '
+            'partitioned by month and create the missing monthly partitions')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Native partitioning needs PostgreSQL')
+        table = ArchivedOrder._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_partitioned_table p '
+                           'JOIN pg_class c ON c.oid = p.partrelid '
+                           'WHERE c.relname = %s', [table])
+            convert = cursor.fetchone() is None
+            if convert:
+                cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+                cursor.execute(
+                    f'CREATE TABLE {table} '
+                    f'(LIKE {table}_old INCLUDING DEFAULTS, '
+                    f'PRIMARY KEY (id, created)) '
+                    f'PARTITION BY RANGE (created)')
+                cursor.execute(f'CREATE TABLE {table}_default '
+                               f'PARTITION OF {table} DEFAULT')
+
+            # archived rows come from the hot table, so its oldest order
+            # bounds every month the archive can ever receive
+            source = f'{table}_old' if convert else table
+            cursor.execute(f'SELECT MIN(created) FROM {source}')
+            candidates = [cursor.fetchone()[0],
+                          Order.objects.aggregate(m=Min('created'))['m']]
+            first = min(filter(None, candidates), default=None) or date.today()
+
+            created = 0
+            month = date(first.year, first.month, 1)
+            while month <= date.today():
+                name = f'{table}_y{month.year}m{month.month:02d}'
+                cursor.execute('SELECT to_regclass(%s)', [name])
+                if not cursor.fetchone()[0]:
+                    cursor.execute(
+                        f'CREATE TABLE {name} PARTITION OF {table} '
+                        f'FOR VALUES FROM (%s) TO (%s)',
+                        [month, next_month(month)])
+                    created += 1
+                month = next_month(month)
+
+            if convert:
+                cursor.execute(f'INSERT INTO {table} '
+                               f'SELECT * FROM {table}_old')
+                cursor.execute(f'DROP TABLE {table}_old')
+                # the model's indexes went with the old table
+                with connection.schema_editor() as editor:
+                    for index in ArchivedOrder._meta.indexes:
+                        editor.add_index(ArchivedOrder, index)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} monthly partitions'))
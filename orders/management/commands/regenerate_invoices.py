@@ -0,0 +1,31 @@
+from datetime import date, datetime, time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.invoices import regenerate_invoices
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Render order invoices again on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            default=None,
+                            help='Only orders updated from this date (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes, 0 renders in this process')
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument('--force', action='store_true',
+                            help='Also render invoices that are up to date')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.order_by('id')
+        if options['since']:
+            orders = orders.filter(updated__gte=timezone.make_aware(
+                datetime.combine(options['since'], time.min)))
+        rendered = regenerate_invoices(orders.values_list('id', flat=True),
+                                       workers=options['workers'],
+                                       chunk_size=options['chunk_size'],
+                                       force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Invoices of {rendered} orders are up to date'))
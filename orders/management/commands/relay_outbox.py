@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from orders import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish pending outbox events to the Celery broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new events')
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to sleep when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            published = outbox.relay(batch_size=options['batch_size'])
+            if published:
+                self.stdout.write(f'Published {published} events')
+            if not options['loop']:
+                break
+            if not published:
+                time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.archive import restore_orders
+
+
+class Command(BaseCommand):
+    help = 'Move archived orders back into the hot order tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_ids', nargs='*', type=int)
+        parser.add_argument('--all', action='store_true',
+                            help='Restore the whole archive')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if not options['order_ids'] and not options['all']:
+            raise CommandError('Pass order ids or --all')
+        restored = restore_orders(order_ids=options['order_ids'] or None,
+                                  batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Restored {restored} orders'))
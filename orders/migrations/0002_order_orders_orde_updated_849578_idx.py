@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated'], name='orders_orde_updated_849578_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+        ('orders', '0002_order_orders_orde_updated_849578_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('email', models.EmailField(max_length=254)),
+                ('address', models.CharField(max_length=250)),
+                ('postal_code', models.CharField(max_length=20)),
+                ('city', models.CharField(max_length=100)),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('paid', models.BooleanField(default=False)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.archivedorder')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_order_items', to='shop.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['-created'], name='orders_arch_created_1e2304_idx'),
+        ),
+    ]
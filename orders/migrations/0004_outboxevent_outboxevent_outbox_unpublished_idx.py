@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_archivedorder_archivedorderitem_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200)),
+                ('args', models.JSONField(default=list)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('published', models.DateTimeField(blank=True, null=True)),
+                ('consumed', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('published__isnull', True)), fields=['id'], name='outbox_unpublished_idx'),
+        ),
+    ]
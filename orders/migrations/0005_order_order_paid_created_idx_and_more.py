@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_outboxevent_outboxevent_outbox_unpublished_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('paid', True)), fields=['-created'], name='order_paid_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('paid', False)), fields=['-created'], name='order_unpaid_created_idx'),
+        ),
+    ]
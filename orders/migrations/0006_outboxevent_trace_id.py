@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_order_paid_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='trace_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_outboxevent_trace_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['email', '-created', '-id'], name='archive_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email', '-created', '-id'], name='order_email_created_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_email_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('customer', models.JSONField()),
+                ('lines', models.JSONField(default=list)),
+                ('error', models.CharField(blank=True, max_length=250)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('processed', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.order')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queuedcheckout',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='checkout_pending_idx'),
+        ),
+    ]
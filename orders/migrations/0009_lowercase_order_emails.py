@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Lower, Trim
+
+
+def lowercase_emails(apps, schema_editor):
+    # orders saved before emails were normalized, so the history link
+    # and the staff lookup find them with an equality on the index
+    for name in ('Order', 'ArchivedOrder'):
+        model = apps.get_model('orders', name)
+        normalized = Lower(Trim(F('email')))
+        model.objects.annotate(normalized=normalized).exclude(
+            email=F('normalized')).update(email=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_queued_checkout'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
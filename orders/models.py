@@ -1,5 +1,7 @@
+import uuid
 from django.db import models
 from shop.models import Product
+from shop.money import Money
 
 class Order(models.Model):
     first_name = models.CharField(max_length=50)
@@ -15,14 +17,25 @@ class Order(models.Model):
     class Meta:
         ordering = ['-created']
         indexes = [
-            models.Index(fields=['-created'])
+            models.Index(fields=['-created']),
+            models.Index(fields=['updated']),
+            # admin changelist filtered by paid, one partial index per value
+            models.Index(fields=['-created'],
+                         condition=models.Q(paid=True),
+                         name='order_paid_created_idx'),
+            models.Index(fields=['-created'],
+                         condition=models.Q(paid=False),
+                         name='order_unpaid_created_idx'),
+            # order history, keyset paginated on (created, id)
+            models.Index(fields=['email', '-created', '-id'],
+                         name='order_email_created_idx'),
         ]
 
     def __str__(self):
         return f'Order {self.id}'
 
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return sum((item.get_cost() for item in self.items.all()), Money())
 
 
 class OrderItem(models.Model):
@@ -39,4 +52,111 @@ class OrderItem(models.Model):
         return str(self.id)
 
     def get_cost(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return Money.from_decimal(self.price) * self.quantity
+
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    first_name = models.CharField(max_length=50)
+    last_name = models.CharField(max_length=50)
+    email = models.EmailField()
+    address = models.CharField(max_length=250)
+    postal_code = models.CharField(max_length=20)
+    city = models.CharField(max_length=100)
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+    paid = models.BooleanField(default=False)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['-created']),
+            models.Index(fields=['email', '-created', '-id'],
+                         name='archive_email_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Order {self.id}'
+
+    def get_total_cost(self):
+        return sum((item.get_cost() for item in self.items.all()), Money())
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    # no FK constraint so the archive can be range partitioned on PostgreSQL
+    order = models.ForeignKey(ArchivedOrder,
+                              related_name='items',
+                              on_delete=models.CASCADE,
+                              db_constraint=False)
+    product = models.ForeignKey(Product,
+                                related_name='archived_order_items',
+                                on_delete=models.CASCADE)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return str(self.id)
+
+    def get_cost(self):
+        return Money.from_decimal(self.price) * self.quantity
+
+
+
+class OutboxEvent(models.Model):
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    created = models.DateTimeField(auto_now_add=True)
+    published = models.DateTimeField(null=True, blank=True)
+    consumed = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    trace_id = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'],
+                         condition=models.Q(published__isnull=True),
+                         name='outbox_unpublished_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task}{tuple(self.args)}'
+
+
+class QueuedCheckout(models.Model):
+    """
+    A validated checkout waiting for orders.checkout_queue.process to
+    turn it into an Order, with the customer details and a snapshot of
+    the cart as (product id, price in cents, quantity) lines.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=PENDING)
+    customer = models.JSONField()
+    lines = models.JSONField(default=list)
+    order = models.ForeignKey(Order,
+                              related_name='+',
+                              null=True, blank=True,
+                              on_delete=models.SET_NULL)
+    error = models.CharField(max_length=250, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'],
+                         condition=models.Q(status='pending'),
+                         name='checkout_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'Checkout {self.token}'
+
@@ -0,0 +1,115 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from celery import current_app
+from kombu.utils.imports import symbol_by_name
+from prometheus_client import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from config import tracing
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+UNCONSUMED_PURGED = Counter('tea_shop_outbox_unconsumed_purged_total',
+                            'Outbox events published but never consumed, '
+                            'deleted by purge()',
+                            ['task'])
+
+
+def enqueue(task, *args):
+    # must be called inside the transaction that writes the data the
+    # task reads, so the event is committed together with it
+    return OutboxEvent.objects.create(
+        task=task, args=list(args),
+        trace_id=tracing.current_trace_id() or '')
+
+
+def enqueue_many(events):
+    # (task, args) pairs, one INSERT for all of them
+    trace_id = tracing.current_trace_id() or ''
+    return OutboxEvent.objects.bulk_create(
+        [OutboxEvent(task=task, args=list(args), trace_id=trace_id)
+         for task, args in events])
+
+
+def task_id(event_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'outbox:{event_id}'))
+
+
+def publish(event):
+    options = {'task_id': task_id(event.id),
+               'kwargs': {'event_id': event.id}}
+    if event.trace_id:
+        # the task joins the trace of the request that enqueued it
+        options['headers'] = {tracing.TRACE_HEADER: event.trace_id}
+    try:
+        task = symbol_by_name(event.task)
+    except (ImportError, AttributeError):
+        # not importable here, the worker may still know it by name
+        current_app.send_task(event.task, event.args, **options)
+    else:
+        task.apply_async(event.args, **options)
+
+
+def relay(batch_size=None):
+    # delivery is at least once: a crash between publishing and the
+    # commit below publishes the batch again, consumers use claim()
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(OutboxEvent.objects
+                      .filter(published__isnull=True)
+                      .select_for_update(skip_locked=True)
+                      [:batch_size])
+        published = []
+        for event in events:
+            event.attempts += 1
+            try:
+                publish(event)
+            except Exception:
+                logger.exception('Could not publish outbox event %s',
+                                 event.id)
+                break
+            event.published = timezone.now()
+            published.append(event)
+        OutboxEvent.objects.bulk_update(events, ['attempts', 'published'])
+    return len(published)
+
+
+def claim(event_id):
+    # consumers call this inside their transaction; only the first
+    # delivery of an event gets True
+    if event_id is None:
+        return True
+    return bool(OutboxEvent.objects.filter(id=event_id,
+                                           consumed__isnull=True)
+                .update(consumed=timezone.now()))
+
+
+def purge(older_than_days=None, unconsumed_days=None):
+    """
+    Deletes events consumed more than older_than_days ago, and events
+    published more than unconsumed_days ago that no task ever consumed
+    (the task failed or the message was lost). The latter are counted
+    and logged, they are tasks that did not run.
+    """
+    if older_than_days is None:
+        older_than_days = settings.OUTBOX_RETENTION_DAYS
+    if unconsumed_days is None:
+        unconsumed_days = settings.OUTBOX_UNCONSUMED_RETENTION_DAYS
+    now = timezone.now()
+    deleted, _ = OutboxEvent.objects.filter(
+        consumed__lt=now - timedelta(days=older_than_days)).delete()
+    lost = OutboxEvent.objects.filter(
+        consumed__isnull=True,
+        published__lt=now - timedelta(days=unconsumed_days))
+    for task, count in lost.values_list('task').annotate(
+            count=Count('id')).order_by():
+        logger.warning('Purging %d outbox events of %s that were never '
+                       'consumed', count, task)
+        UNCONSUMED_PURGED.labels(task).inc(count)
+    unconsumed, _ = lost.delete()
+    return deleted + unconsumed
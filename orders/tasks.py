@@ -1,16 +1,62 @@
 from celery import shared_task
 from django.core.mail import send_mail
+from django.db import transaction
 from .models import Order
+from . import archive, checkout_queue, invoices, outbox
 
 @shared_task
-def order_created(order_id):
-    order = Order.objects.get(id=order_id)
-    subject = f'Order with number {order.id}'
-    message = f'Dear {order.first_name},\n\n' \
-              f'You have successfully placed an order.' \
-              f'Your order ID is {order.id}.'
-    mail_sent = send_mail(subject,
-                          message,
-                          'admin@myshop.com',
-                          [order.email])
-    return mail_sent
\ No newline at end of file
+def order_created(order_id, event_id=None):
+    with transaction.atomic():
+        if not outbox.claim(event_id):
+            return False
+        order = Order.objects.get(id=order_id)
+        subject = f'Order with number {order.id}'
+        message = f'Dear {order.first_name},\n\n' \
+                  f'You have successfully placed an order.' \
+                  f'Your order ID is {order.id}.'
+        mail_sent = send_mail(subject,
+                              message,
+                              'admin@myshop.com',
+                              [order.email])
+    return mail_sent
+
+
+@shared_task
+def send_history_link(email, url):
+    message = f'Follow this link to see your orders:\n\n{url}\n\n' \
+              f'If you did not ask for it, you can ignore this email.'
+    return send_mail('Your order history',
+                     message,
+                     'admin@myshop.com',
+                     [email])
+
+
+@shared_task
+def generate_invoice(order_id, event_id=None):
+    with transaction.atomic():
+        if not outbox.claim(event_id):
+            return None
+        return invoices.render_invoice(order_id)
+
+
+@shared_task
+def archive_old_orders():
+    return archive.archive_orders()
+
+
+@shared_task
+def relay_outbox():
+    return outbox.relay()
+
+
+@shared_task
+def purge_outbox():
+    return outbox.purge()
+
+
+@shared_task
+def process_checkouts(event_id=None):
+    # every queued checkout publishes one, an idle run costs one query;
+    # any run drains the whole queue, so the event is only consumed
+    outbox.claim(event_id)
+    return checkout_queue.process()
@@ -1,8 +1,28 @@
+import shutil
+import tempfile
+from datetime import timedelta
 from decimal import Decimal
-from django.test import TestCase
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from config.testing import ExplainMixin
+from django.utils import timezone
 from shop.models import Product, Category
-from .models import Order, OrderItem
+from shop.money import Money
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
 from .forms import OrderCreateForm
+from .archive import archive_orders, restore_orders, get_order, all_orders
+from .models import OutboxEvent
+from . import archive, history, invoices, outbox
 
 
 class OrderModelTests(TestCase):
@@ -70,8 +90,7 @@ class OrderModelTests(TestCase):
             quantity=3
         )
 
-        expected_cost = Decimal('150.00') * 3
-        self.assertEqual(order_item.get_cost(), expected_cost)
+        self.assertEqual(order_item.get_cost(), Money.parse('450.00'))
 
     def test_order_total_cost(self):
         """Подсчет общей стоимости заказа"""
@@ -96,12 +115,11 @@ class OrderModelTests(TestCase):
             quantity=1
         )
 
-        expected_total = (Decimal('100.00') * 2) + Decimal('200.00')
-        self.assertEqual(self.order.get_total_cost(), expected_total)
+        self.assertEqual(self.order.get_total_cost(), Money.parse('400.00'))
 
     def test_order_total_cost_empty(self):
         """Общая стоимость пустого заказа"""
-        self.assertEqual(self.order.get_total_cost(), Decimal('0.00'))
+        self.assertEqual(self.order.get_total_cost(), Money())
 
     def test_order_ordering(self):
         """Проверка сортировки заказов"""
@@ -199,3 +217,422 @@ class OrderFormTests(TestCase):
         ]
 
         self.assertEqual(list(form.fields.keys()), expected_fields)
+
+
+
+class OrderArchiveTests(TestCase):
+    """Тесты переноса старых заказов в архив"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Test Product',
+            slug='test-product',
+            price=Decimal('100.00'),
+            available=True
+        )
+        self.old = timezone.now() - timedelta(days=400)
+
+    def create_order(self, paid=True, created=None):
+        order = Order.objects.create(
+            first_name='John',
+            last_name='Doe',
+            email='john@example.com',
+            address='123 Main St',
+            postal_code='12345',
+            city='New York',
+            paid=paid
+        )
+        OrderItem.objects.create(order=order,
+                                 product=self.product,
+                                 price=Decimal('100.00'),
+                                 quantity=2)
+        if created:
+            Order.objects.filter(id=order.id).update(created=created)
+        return order
+
+    def test_archive_moves_only_old_paid_orders(self):
+        """В архив уходят только старые оплаченные заказы"""
+        old_paid = self.create_order(created=self.old)
+        old_unpaid = self.create_order(paid=False, created=self.old)
+        recent = self.create_order()
+
+        self.assertEqual(archive_orders(older_than_days=365), 1)
+        self.assertEqual(
+            set(Order.objects.values_list('id', flat=True)),
+            {old_unpaid.id, recent.id}
+        )
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(archived.id, old_paid.id)
+        self.assertEqual(archived.created, self.old)
+        self.assertEqual(archived.get_total_cost(), Money.parse('200.00'))
+        self.assertFalse(OrderItem.objects.filter(order_id=old_paid.id)
+                         .exists())
+
+    def test_archive_in_resumable_batches(self):
+        """Перенос пачками можно прервать и продолжить"""
+        for _ in range(5):
+            self.create_order(created=self.old)
+
+        moved = archive_orders(older_than_days=365, batch_size=2,
+                               max_batches=1)
+        self.assertEqual(moved, 2)
+        self.assertEqual(Order.objects.count(), 3)
+
+        self.assertEqual(archive_orders(older_than_days=365, batch_size=2), 3)
+        self.assertEqual(ArchivedOrder.objects.count(), 5)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 5)
+
+    def test_archive_batch_already_copied(self):
+        """Повтор пачки, скопированной до сбоя, не создает дубликатов"""
+        order = self.create_order(created=self.old)
+        ArchivedOrder.objects.create(id=order.id,
+                                     first_name=order.first_name,
+                                     last_name=order.last_name,
+                                     email=order.email,
+                                     address=order.address,
+                                     postal_code=order.postal_code,
+                                     city=order.city,
+                                     created=self.old,
+                                     updated=order.updated,
+                                     paid=True)
+
+        self.assertEqual(archive_orders(older_than_days=365), 1)
+        self.assertEqual(ArchivedOrder.objects.count(), 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_restore_keeps_ids_and_timestamps(self):
+        """Восстановление из архива"""
+        order = self.create_order(created=self.old)
+        archive_orders(older_than_days=365)
+
+        self.assertEqual(restore_orders([order.id]), 1)
+        restored = Order.objects.get(id=order.id)
+        self.assertEqual(restored.created, self.old)
+        self.assertEqual(restored.items.count(), 1)
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+    def test_lookup_with_archive(self):
+        """Поиск заказа в горячих и архивных данных"""
+        archived = self.create_order(created=self.old)
+        hot = self.create_order()
+        archive_orders(older_than_days=365)
+
+        with self.assertRaises(Order.DoesNotExist):
+            get_order(archived.id)
+        self.assertIsInstance(get_order(archived.id, include_archive=True),
+                              ArchivedOrder)
+        self.assertEqual(
+            [o['id'] for o in all_orders(include_archive=True)],
+            [hot.id, archived.id]
+        )
+        self.assertEqual(len(all_orders()), 1)
+
+
+
+class OutboxTests(TestCase):
+    """Тесты outbox для публикации задач Celery"""
+
+    def setUp(self):
+        self.order = Order.objects.create(
+            first_name='John',
+            last_name='Doe',
+            email='john@example.com',
+            address='123 Main St',
+            postal_code='12345',
+            city='New York'
+        )
+
+    def test_relay_publishes_and_consumer_runs(self):
+        """Событие публикуется и обрабатывается"""
+        event = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        self.assertEqual(outbox.relay(), 1)
+
+        event.refresh_from_db()
+        self.assertIsNotNone(event.published)
+        self.assertIsNotNone(event.consumed)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(outbox.relay(), 0)
+
+    def test_duplicate_delivery_is_ignored(self):
+        """Повторная доставка события не отправляет письмо дважды"""
+        event = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        outbox.publish(event)
+        outbox.publish(event)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_broker_failure_keeps_event_pending(self):
+        """При недоступном брокере событие остается в очереди"""
+        event = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        with patch('orders.outbox.publish', side_effect=ConnectionError):
+            self.assertEqual(outbox.relay(), 0)
+
+        event.refresh_from_db()
+        self.assertIsNone(event.published)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(outbox.relay(), 1)
+
+    def test_purge_consumed_events(self):
+        """Удаление старых обработанных событий"""
+        event = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        OutboxEvent.objects.filter(id=event.id).update(
+            consumed=timezone.now() - timedelta(days=30))
+        outbox.enqueue('orders.tasks.order_created', self.order.id)
+        self.assertEqual(outbox.purge(older_than_days=7), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_purge_unconsumed_events(self):
+        """Опубликованные, но не обработанные события удаляются позже"""
+        lost = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        recent = outbox.enqueue('orders.tasks.order_created', self.order.id)
+        OutboxEvent.objects.filter(id=lost.id).update(
+            published=timezone.now() - timedelta(days=40))
+        OutboxEvent.objects.filter(id=recent.id).update(
+            published=timezone.now() - timedelta(days=10))
+        before = outbox.UNCONSUMED_PURGED.labels(
+            'orders.tasks.order_created')._value.get()
+        self.assertEqual(outbox.purge(older_than_days=7,
+                                      unconsumed_days=30), 1)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id',
+                                                              flat=True)),
+                         [recent.id])
+        self.assertEqual(outbox.UNCONSUMED_PURGED.labels(
+            'orders.tasks.order_created')._value.get(), before + 1)
+
+
+
+class OrderIndexTests(ExplainMixin, TestCase):
+    """Проверка использования индексов запросами заказов"""
+
+    def test_paid_filter_uses_index(self):
+        """Фильтр админки по оплате"""
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'x'))
+        url = reverse('admin:orders_order_changelist')
+        for paid, index in (('1', 'order_paid_created_idx'),
+                            ('0', 'order_unpaid_created_idx')):
+            response = self.assertQueriesUseIndex(
+                index, self.client.get, url, {'paid__exact': paid})
+            self.assertEqual(response.status_code, 200)
+
+
+
+class InvoiceTests(TestCase):
+    """Тесты рендеринга счетов"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(category=category,
+                                              name='Sencha', slug='sencha',
+                                              price=Decimal('12.50'))
+        self.order = Order.objects.create(first_name='John',
+                                          last_name='Doe',
+                                          email='john@example.com',
+                                          address='123 Main St',
+                                          postal_code='12345',
+                                          city='New York')
+        OrderItem.objects.create(order=self.order, product=self.product,
+                                 price=Decimal('12.50'), quantity=3)
+
+    def read(self, name):
+        with default_storage.open(name) as f:
+            return f.read().decode()
+
+    def test_render_keyed_by_order_and_updated(self):
+        """Счет хранится под id и временем изменения заказа"""
+        name = invoices.render_invoice(self.order.id)
+        self.assertEqual(name, invoices.invoice_name(self.order))
+        self.assertTrue(name.startswith(f'invoices/{self.order.id}/'))
+        self.assertIn('$37.50', self.read(name))
+        self.assertEqual(invoices.current_invoice(self.order), name)
+
+    def test_up_to_date_invoice_not_rendered_again(self):
+        """Актуальный счет не рендерится повторно"""
+        invoices.render_invoice(self.order.id)
+        with patch('orders.invoices.render_to_string') as render:
+            invoices.render_invoice(self.order.id)
+        render.assert_not_called()
+
+    def test_changed_order_replaces_invoice(self):
+        """Изменение заказа делает счет устаревшим, старый файл удаляется"""
+        old = invoices.render_invoice(self.order.id)
+        self.order.paid = True
+        self.order.save()
+        self.assertIsNone(invoices.current_invoice(self.order))
+        new = invoices.render_invoice(self.order.id)
+        self.assertNotEqual(old, new)
+        self.assertFalse(default_storage.exists(old))
+        self.assertIn('Paid', self.read(new))
+
+    def test_archived_order_invoice(self):
+        """Счет архивного заказа"""
+        Order.objects.filter(id=self.order.id).update(
+            paid=True, created=timezone.now() - timedelta(days=400))
+        archive_orders()
+        name = invoices.render_invoice(self.order.id)
+        self.assertIn('$37.50', self.read(name))
+
+    def test_task_claims_outbox_event(self):
+        """Задача обрабатывает событие outbox один раз"""
+        event = outbox.enqueue('orders.tasks.generate_invoice',
+                               self.order.id)
+        outbox.relay()
+        event.refresh_from_db()
+        self.assertIsNotNone(event.consumed)
+        self.assertIsNotNone(invoices.current_invoice(self.order))
+
+    def test_regenerate_command(self):
+        """Команда перегенерации счетов"""
+        invoices.render_invoice(self.order.id)
+        with patch('orders.invoices.render_to_string',
+                   return_value='<html></html>') as render:
+            call_command('regenerate_invoices', workers=0, stdout=StringIO())
+            render.assert_not_called()
+            call_command('regenerate_invoices', workers=0, force=True,
+                         stdout=StringIO())
+        render.assert_called_once()
+
+
+
+class OrderHistoryTests(ExplainMixin, TestCase):
+    """Тесты истории заказов покупателя"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(category=category,
+                                              name='Sencha', slug='sencha',
+                                              price=Decimal('10.00'))
+        self.orders = [self.create_order('john@example.com', quantity)
+                       for quantity in range(1, 6)]
+        self.create_order('jane@example.com', 1)
+
+    def create_order(self, email, quantity):
+        order = Order.objects.create(first_name='John', last_name='Doe',
+                                     email=email, address='123 Main St',
+                                     postal_code='12345', city='New York')
+        OrderItem.objects.create(order=order, product=self.product,
+                                 price=Decimal('10.00'), quantity=quantity)
+        OrderItem.objects.create(order=order, product=self.product,
+                                 price=Decimal('0.50'), quantity=2)
+        return order
+
+    def test_totals_in_one_query(self):
+        """Суммы и количество позиций одним запросом"""
+        with self.assertNumQueries(1):
+            orders, next_cursor = history.order_history(
+                Order, 'john@example.com', limit=10)
+        self.assertIsNone(next_cursor)
+        self.assertEqual([o.id for o in orders],
+                         [o.id for o in reversed(self.orders)])
+        self.assertEqual(orders[0].total, Decimal('51.00'))
+        self.assertEqual(orders[0].item_count, 2)
+
+    def test_keyset_pages(self):
+        """Постраничный обход по ключу без пропусков и повторов"""
+        # equal timestamps are ordered by id
+        Order.objects.filter(id__in=[o.id for o in self.orders[1:3]]).update(
+            created=self.orders[1].created)
+        seen, cursor = [], None
+        while True:
+            orders, cursor = history.order_history(
+                Order, 'john@example.com', cursor, limit=2)
+            seen += [o.id for o in orders]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [o.id for o in self.orders])
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_email_normalized(self):
+        """Email приводится к нижнему регистру"""
+        form = OrderCreateForm(data={
+            'first_name': 'John', 'last_name': 'Doe',
+            'email': ' John@Example.COM ', 'address': '123 Main St',
+            'postal_code': '12345', 'city': 'New York'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['email'], 'john@example.com')
+        orders, _ = history.order_history(Order, 'JOHN@example.com')
+        self.assertEqual(len(orders), 5)
+
+    def test_existing_emails_lowercased(self):
+        """Миграция приводит email старых заказов к нижнему регистру"""
+        migration = import_module(
+            'orders.migrations.0009_lowercase_order_emails')
+        Order.objects.filter(id=self.orders[0].id).update(
+            email=' John@Example.COM')
+        ArchivedOrder.objects.create(
+            id=999, first_name='John', last_name='Doe',
+            email='JOHN@example.com', address='123 Main St',
+            postal_code='12345', city='New York',
+            created=timezone.now(), updated=timezone.now())
+        migration.lowercase_emails(apps, None)
+        orders, _ = history.order_history(Order, 'john@example.com')
+        self.assertEqual(len(orders), 5)
+        self.assertEqual(ArchivedOrder.objects.get().email,
+                         'john@example.com')
+
+    def test_uses_email_index(self):
+        """История и поиск по архиву читаются по индексу email"""
+        token = history.make_link_token('john@example.com')
+        self.client.get(reverse('orders:order_history_login', args=[token]))
+        cursor = history.encode_cursor(self.orders[2])
+        response = self.assertQueriesUseIndex(
+            'order_email_created_idx', self.client.get,
+            reverse('orders:order_history'), {'after': cursor})
+        self.assertEqual(len(response.context['orders']), 2)
+
+        Order.objects.update(paid=True)
+        archive_orders(older_than_days=0)
+        self.client.force_login(User.objects.create_user(
+            'staff', password='x', is_staff=True))
+        response = self.assertQueriesUseIndex(
+            'archive_email_created_idx', self.client.get,
+            reverse('orders:order_lookup'),
+            {'email': 'john@example.com', 'archive': '1'})
+        self.assertEqual(len(response.context['orders']), 5)
+
+    def test_archive_lookup_cached_until_orders_move(self):
+        """Поиск по архиву кешируется до переноса заказов"""
+        Order.objects.update(paid=True)
+        archive_orders(older_than_days=0)
+        orders, _ = history.archived_order_history('john@example.com')
+        self.assertEqual(len(orders), 5)
+        with self.assertNumQueries(0):
+            orders, _ = history.archived_order_history('John@example.com')
+        self.assertEqual(orders[0].total, Decimal('51.00'))
+        restore_orders([self.orders[0].id])
+        orders, _ = history.archived_order_history('john@example.com')
+        self.assertEqual(len(orders), 4)
+
+    def test_archive_version_shared(self):
+        """Версия архива общая для веб-процессов и Celery"""
+        shared = caches[settings.SHARED_CACHE_ALIAS]
+        version = archive.get_archive_version()
+        self.assertEqual(shared.get(archive.ARCHIVE_VERSION_KEY), version)
+        Order.objects.update(paid=True)
+        archive_orders(older_than_days=0)
+        self.assertNotEqual(shared.get(archive.ARCHIVE_VERSION_KEY), version)
+        self.assertEqual(history.archive_cache.alias,
+                         settings.SHARED_CACHE_ALIAS)
+
+    def test_link_token(self):
+        """Подписанная ссылка с ограниченным сроком"""
+        token = history.make_link_token('John@Example.com')
+        self.assertEqual(history.read_link_token(token), 'john@example.com')
+        self.assertIsNone(history.read_link_token(token + 'x'))
+        with self.settings(ORDERS_HISTORY_LINK_SECONDS=-1):
+            self.assertIsNone(history.read_link_token(token))
+
+    def test_bad_cursor_starts_over(self):
+        """Некорректный курсор игнорируется"""
+        orders, _ = history.order_history(Order, 'john@example.com',
+                                          'garbage', limit=10)
+        self.assertEqual(len(orders), 5)
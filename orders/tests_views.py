@@ -1,8 +1,17 @@
+import shutil
+import tempfile
 from decimal import Decimal
-from django.test import TestCase
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core import mail
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import OperationalError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from shop.models import Product, Category
-from orders.models import Order, OrderItem
+from orders.models import Order, OrderItem, OutboxEvent, QueuedCheckout
+from orders import checkout_queue, invoices, outbox
 
 
 class OrderViewTests(TestCase):
@@ -61,6 +70,12 @@ class OrderViewTests(TestCase):
         self.assertEqual(item.quantity, 2)
         self.assertEqual(item.price, Decimal('100.00'))
 
+        event = OutboxEvent.objects.get(task='orders.tasks.order_created')
+        self.assertEqual(event.args, [order.id])
+        self.assertIsNone(event.published)
+        self.assertTrue(OutboxEvent.objects.filter(
+            task='orders.tasks.generate_invoice', args=[order.id]).exists())
+
     def test_order_create_invalid_form(self):
         """POST запрос с невалидными данными"""
         self.client.post(
@@ -108,3 +123,298 @@ class OrderViewTests(TestCase):
         self.assertEqual(order.first_name, 'Jane')
 
         self.assertEqual(order.items.count(), 0)
+
+
+    @override_settings(THROTTLE_ENABLED=True,
+                       THROTTLE_RATES={'checkout': {'capacity': 1,
+                                                    'rate': 0.01}})
+    def test_order_create_throttled(self):
+        """Повторное оформление заказа сверх лимита"""
+        cache.clear()
+        url = reverse('orders:order_create')
+        self.assertEqual(self.client.post(url, {}).status_code, 200)
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+
+class InvoiceViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        caches[settings.SHARED_CACHE_ALIAS].clear()
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(category=category,
+                                              name='Sencha', slug='sencha',
+                                              price=Decimal('12.50'))
+
+    def place_order(self):
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]),
+                         data={'quantity': '2', 'override': False})
+        self.client.post(reverse('orders:order_create'), data={
+            'first_name': 'John', 'last_name': 'Doe',
+            'email': 'john@example.com', 'address': '123 Main St',
+            'postal_code': '12345', 'city': 'New York',
+        })
+        return Order.objects.get()
+
+    def test_invoice_rendered_after_checkout(self):
+        """Счет готов после обработки outbox"""
+        order = self.place_order()
+        outbox.relay()
+        response = self.client.get(reverse('orders:order_invoice',
+                                           args=[order.id]))
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn(f'Invoice no. {order.id}', content)
+        self.assertIn('$25.00', content)
+
+    def test_pending_invoice_returns_202(self):
+        """Пока счет не готов, возвращается 202"""
+        order = self.place_order()
+        url = reverse('orders:order_invoice', args=[order.id])
+        with patch('orders.tasks.generate_invoice.delay') as delay:
+            response = self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('Retry-After', response)
+        delay.assert_called_once_with(order.id)
+
+    def test_pending_guard_shared_between_processes(self):
+        """Повтор из другого веб-процесса не ставит задачу снова"""
+        order = self.place_order()
+        url = reverse('orders:order_invoice', args=[order.id])
+        with patch('orders.tasks.generate_invoice.delay') as delay:
+            self.client.get(url)
+            # what another process would not see
+            cache.clear()
+            self.client.get(url)
+        delay.assert_called_once_with(order.id)
+        self.assertTrue(caches[settings.SHARED_CACHE_ALIAS].get(
+            f'invoice-pending:{invoices.invoice_name(order)}'))
+
+    def test_changed_order_gets_new_invoice(self):
+        """После изменения заказа счет рендерится заново"""
+        order = self.place_order()
+        outbox.relay()
+        url = reverse('orders:order_invoice', args=[order.id])
+        order.paid = True
+        order.save()
+        with patch('orders.tasks.generate_invoice.delay') as delay:
+            self.assertEqual(self.client.get(url).status_code, 202)
+        delay.assert_called_once_with(order.id)
+
+    def test_invoice_of_other_session_hidden(self):
+        """Чужой счет недоступен, сотруднику доступен"""
+        order = self.place_order()
+        outbox.relay()
+        url = reverse('orders:order_invoice', args=[order.id])
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        staff = User.objects.create_user('staff', password='pass',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+
+class OrderHistoryViewTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Tea', slug='tea')
+        product = Product.objects.create(category=category, name='Sencha',
+                                         slug='sencha',
+                                         price=Decimal('10.00'))
+        self.order = Order.objects.create(first_name='John',
+                                          last_name='Doe',
+                                          email='john@example.com',
+                                          address='123 Main St',
+                                          postal_code='12345',
+                                          city='New York')
+        OrderItem.objects.create(order=self.order, product=product,
+                                 price=Decimal('10.00'), quantity=3)
+
+    def test_magic_link_flow(self):
+        """Ссылка из письма открывает историю заказов"""
+        response = self.client.post(reverse('orders:order_history_request'),
+                                    {'email': 'John@Example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['john@example.com'])
+        link = next(line for line in mail.outbox[0].body.splitlines()
+                    if line.startswith('http'))
+        response = self.client.get(link)
+        self.assertRedirects(response, reverse('orders:order_history'))
+        response = self.client.get(reverse('orders:order_history'))
+        self.assertEqual(list(response.context['orders']), [self.order])
+        self.assertContains(response, '$30.00')
+        invoice = reverse('orders:order_invoice', args=[self.order.id])
+        with patch('orders.tasks.generate_invoice.delay'):
+            self.assertEqual(self.client.get(invoice).status_code, 202)
+
+    def test_history_needs_link(self):
+        """Без подтвержденной ссылки история недоступна"""
+        response = self.client.get(reverse('orders:order_history'))
+        self.assertRedirects(response,
+                             reverse('orders:order_history_request'))
+        response = self.client.get(reverse('orders:order_history_login',
+                                           args=['forged']))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.context['expired'])
+
+    def test_staff_lookup(self):
+        """Поиск заказов сотрудником"""
+        url = reverse('orders:order_lookup')
+        response = self.client.get(url, {'email': 'john@example.com'})
+        self.assertEqual(response.status_code, 302)
+        staff = User.objects.create_user('staff', password='pass',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, {'email': 'JOHN@example.com'})
+        self.assertEqual(list(response.context['orders']), [self.order])
+        response = self.client.get(url, {'email': 'john@example.com',
+                                         'archive': '1'})
+        self.assertEqual(list(response.context['orders']), [])
+
+
+@override_settings(CHECKOUT_QUEUE_ENABLED=True)
+class QueuedCheckoutViewTests(TestCase):
+    """Тесты оформления заказа через очередь"""
+
+    customer = {'first_name': 'John', 'last_name': 'Doe',
+                'email': 'john@example.com', 'address': '123 Main St',
+                'postal_code': '12345', 'city': 'New York'}
+
+    def setUp(self):
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.sencha = Product.objects.create(category=category,
+                                             name='Sencha', slug='sencha',
+                                             price=Decimal('12.50'))
+        self.oolong = Product.objects.create(category=category,
+                                             name='Oolong', slug='oolong',
+                                             price=Decimal('8.00'))
+
+    def checkout(self, client=None, **customer):
+        client = client or self.client
+        client.post(reverse('cart:cart_add', args=[self.sencha.id]),
+                    data={'quantity': '2', 'override': False})
+        client.post(reverse('cart:cart_add', args=[self.oolong.id]),
+                    data={'quantity': '1', 'override': False})
+        return client.post(reverse('orders:order_create'),
+                           data={**self.customer, **customer})
+
+    def test_checkout_queued_then_processed(self):
+        """Заказ создается воркером, страница ожидания опрашивает статус"""
+        response = self.checkout()
+        checkout = QueuedCheckout.objects.get()
+        page = reverse('orders:order_checkout', args=[checkout.token])
+        self.assertRedirects(response, page)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(checkout.lines, [[self.sencha.id, 1250, 2],
+                                          [self.oolong.id, 800, 1]])
+        status = reverse('orders:order_checkout_status',
+                         args=[checkout.token])
+        self.assertEqual(self.client.get(status).json(),
+                         {'status': 'pending', 'order': None})
+        self.assertContains(self.client.get(page), status)
+        # kept until the order exists
+        self.assertEqual(len(self.client.session['cart']), 2)
+        # the outbox publishes the worker task, eager in tests
+        outbox.relay()
+        self.assertFalse(OutboxEvent.objects.filter(
+            task='orders.tasks.process_checkouts',
+            consumed__isnull=True).exists())
+        order = Order.objects.get()
+        self.assertEqual(order.get_total_cost().to_decimal(),
+                         Decimal('33.00'))
+        self.assertEqual(self.client.get(status).json(),
+                         {'status': 'done', 'order': order.id})
+        response = self.client.get(page)
+        self.assertContains(response, str(order.id))
+        self.assertIn(order.id, self.client.session['orders'])
+        self.assertFalse(self.client.session.get('cart'))
+
+    def test_status_needs_no_session(self):
+        """Статус отвечает одним запросом к базе"""
+        self.checkout()
+        token = QueuedCheckout.objects.get().token
+        self.client.cookies.clear()
+        url = reverse('orders:order_checkout_status', args=[token])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertIn('no-cache', response['Cache-Control'])
+        missing = reverse('orders:order_checkout_status',
+                          args=['00000000-0000-0000-0000-000000000000'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_batch_creates_all_orders(self):
+        """Воркер создает заказы пачкой"""
+        for i in range(5):
+            self.checkout(self.client_class(), first_name=f'Buyer {i}')
+        self.assertEqual(checkout_queue.process(batch_size=2), 5)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(OrderItem.objects.count(), 10)
+        self.assertFalse(QueuedCheckout.objects.exclude(
+            status=QueuedCheckout.DONE).exists())
+        self.assertEqual(OutboxEvent.objects.filter(
+            task='orders.tasks.order_created').count(), 5)
+        self.assertEqual(checkout_queue.process(), 0)
+
+    def test_failed_checkout_does_not_block_batch(self):
+        """Сбойный заказ не мешает остальным в пачке"""
+        self.checkout()
+        broken = self.client_class()
+        self.checkout(broken, first_name='Broken')
+        original = checkout_queue._create_orders
+
+        def create_orders(checkouts):
+            if any(c.customer['first_name'] == 'Broken' for c in checkouts):
+                raise ValueError('broken checkout')
+            original(checkouts)
+        with patch.object(checkout_queue, '_create_orders', create_orders), \
+                self.assertLogs('orders.checkout_queue', 'ERROR'):
+            checkout_queue.process()
+        self.assertEqual(Order.objects.get().first_name, 'John')
+        failed = QueuedCheckout.objects.get(status=QueuedCheckout.FAILED)
+        self.assertEqual(failed.error, 'broken checkout')
+        response = broken.get(reverse('orders:order_checkout',
+                                      args=[failed.token]))
+        self.assertContains(response, 'Something went wrong')
+        # the customer can place it again
+        self.assertEqual(len(broken.session['cart']), 2)
+
+    def test_locked_database_keeps_checkouts_pending(self):
+        """Блокировка базы откатывает пачку, заказы ждут следующего запуска"""
+        self.checkout()
+        locked = OperationalError('database is locked')
+        with patch.object(checkout_queue, '_create_orders',
+                          side_effect=locked), \
+                self.assertRaises(OperationalError):
+            checkout_queue.process()
+        self.assertEqual(QueuedCheckout.objects.get().status,
+                         QueuedCheckout.PENDING)
+        self.assertEqual(checkout_queue.process(), 1)
+        self.assertTrue(Order.objects.exists())
+
+    @override_settings(CHECKOUT_QUEUE_MAX_PENDING=1,
+                       CHECKOUT_QUEUE_RETRY_AFTER=7)
+    def test_full_queue_returns_503(self):
+        """Полная очередь отвечает 503 с Retry-After и сохраняет корзину"""
+        self.checkout(self.client_class())
+        response = self.checkout()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(len(self.client.session['cart']), 2)
+        self.assertEqual(QueuedCheckout.objects.count(), 1)
+        checkout_queue.process()
+        response = self.client.post(reverse('orders:order_create'),
+                                    data=self.customer)
+        self.assertEqual(response.status_code, 302)
+
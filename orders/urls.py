@@ -4,5 +4,17 @@ from . import views
 app_name = 'orders'
 
 urlpatterns = [
-    path('create/', views.order_create, name='order_create')
+    path('create/', views.order_create, name='order_create'),
+    path('checkout/<uuid:token>/', views.order_checkout,
+         name='order_checkout'),
+    path('checkout/<uuid:token>/status/', views.order_checkout_status,
+         name='order_checkout_status'),
+    path('<int:order_id>/invoice/', views.order_invoice,
+         name='order_invoice'),
+    path('history/', views.order_history_request,
+         name='order_history_request'),
+    path('history/orders/', views.order_history, name='order_history'),
+    path('history/login/<str:token>/', views.order_history_login,
+         name='order_history_login'),
+    path('lookup/', views.order_lookup, name='order_lookup'),
 ]
\ No newline at end of file
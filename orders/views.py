@@ -1,22 +1,41 @@
-from django.shortcuts import render
-from .models import OrderItem
-from .forms import OrderCreateForm
-from .tasks import order_created
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
+from .models import Order, OrderItem, QueuedCheckout
+from .forms import OrderCreateForm, OrderHistoryForm
+from .tasks import send_history_link
+from . import checkout_queue, history, invoices, outbox
 from cart.cart import Cart
+from config.throttling import throttle
+from shop.money import Money
 
+@throttle('checkout')
 def order_create(request):
     cart = Cart(request)
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
-            order = form.save()
-            for item in cart:
-                OrderItem.objects.create(order=order,
-                                         product=item['product'],
-                                         price=item['price'],
-                                         quantity=item['quantity'])
+            if settings.CHECKOUT_QUEUE_ENABLED:
+                return queue_checkout(request, cart, form)
+            with transaction.atomic():
+                order = form.save()
+                for item in cart:
+                    price = Money(item['price_cents']).to_decimal()
+                    OrderItem.objects.create(order=order,
+                                             product=item['product'],
+                                             price=price,
+                                             quantity=item['quantity'])
+                outbox.enqueue('orders.tasks.order_created', order.id)
+                outbox.enqueue('orders.tasks.generate_invoice', order.id)
             cart.clear()
-            order_created.delay(order.id)
+            # lets this session download the invoice
+            request.session['orders'] = [
+                *request.session.get('orders', []), order.id]
             return render(request,
                           'orders/order/created.html',
                           {'order': order})
@@ -25,3 +44,141 @@ def order_create(request):
     return render(request,
                   'orders/order/create.html',
                   {'cart': cart, 'form': form})
+
+
+def queue_checkout(request, cart, form):
+    if checkout_queue.is_full():
+        # the cart stays, the customer places the order again later
+        retry_after = settings.CHECKOUT_QUEUE_RETRY_AFTER
+        response = render(request,
+                          'orders/order/create.html',
+                          {'cart': cart, 'form': form, 'busy': True,
+                           'retry_after': retry_after},
+                          status=503)
+        response['Retry-After'] = str(retry_after)
+        return response
+    checkout = checkout_queue.submit(form, cart)
+    # the cart is kept until the order exists, a failed checkout leaves
+    # it to be placed again; this session downloads the invoice then
+    request.session['checkouts'] = [
+        *request.session.get('checkouts', []), str(checkout.token)]
+    return redirect('orders:order_checkout', checkout.token)
+
+
+def order_checkout(request, token):
+    found = checkout_queue.status(token)
+    if found is None:
+        raise Http404
+    status, order_id = found
+    if status != QueuedCheckout.DONE:
+        return render(request,
+                      'orders/order/processing.html',
+                      {'token': token,
+                       'failed': status == QueuedCheckout.FAILED,
+                       'poll_seconds': settings.CHECKOUT_QUEUE_POLL_SECONDS})
+    checkouts = request.session.get('checkouts', [])
+    if str(token) in checkouts:
+        Cart(request).clear()
+        request.session['checkouts'] = [t for t in checkouts
+                                        if t != str(token)]
+        request.session['orders'] = [
+            *request.session.get('orders', []), order_id]
+    return render(request,
+                  'orders/order/created.html',
+                  {'order': Order(id=order_id)})
+
+
+@never_cache
+def order_checkout_status(request, token):
+    # polled by the processing page; no session, one indexed lookup
+    found = checkout_queue.status(token)
+    if found is None:
+        return JsonResponse({'status': None}, status=404)
+    status, order_id = found
+    return JsonResponse({'status': status, 'order': order_id})
+
+
+def order_invoice(request, order_id):
+    try:
+        order = invoices.load_order(order_id)
+    except Order.DoesNotExist:
+        raise Http404
+    if not (request.user.is_staff
+            or order_id in request.session.get('orders', [])
+            or order.email == request.session.get('history_email')):
+        raise Http404
+    name = invoices.current_invoice(order)
+    if name is None:
+        invoices.request_invoice(order)
+        response = HttpResponse('The invoice is being prepared.',
+                                status=202)
+        response['Retry-After'] = '2'
+        return response
+    return FileResponse(default_storage.open(name),
+                        content_type='text/html; charset=utf-8',
+                        filename=f'invoice-{order.id}.html')
+
+
+@throttle('history')
+def order_history_request(request):
+    if request.method == 'POST':
+        form = OrderHistoryForm(request.POST)
+        if form.is_valid():
+            email = form.cleaned_data['email']
+            token = history.make_link_token(email)
+            url = request.build_absolute_uri(
+                reverse('orders:order_history_login', args=[token]))
+            # the same answer whether or not the email has orders
+            send_history_link.delay(email, url)
+            return render(request,
+                          'orders/order/history_sent.html',
+                          {'email': email})
+    else:
+        form = OrderHistoryForm()
+    return render(request,
+                  'orders/order/history_request.html',
+                  {'form': form})
+
+
+def order_history_login(request, token):
+    email = history.read_link_token(token)
+    if email is None:
+        return render(request,
+                      'orders/order/history_request.html',
+                      {'form': OrderHistoryForm(), 'expired': True},
+                      status=400)
+    request.session.cycle_key()
+    request.session['history_email'] = email
+    return redirect('orders:order_history')
+
+
+def order_history(request):
+    email = request.session.get('history_email')
+    if email is None:
+        return redirect('orders:order_history_request')
+    orders, next_cursor = history.order_history(Order, email,
+                                                request.GET.get('after'))
+    return render(request,
+                  'orders/order/history.html',
+                  {'email': email,
+                   'orders': orders,
+                   'next_cursor': next_cursor})
+
+
+@staff_member_required
+def order_lookup(request):
+    email = request.GET.get('email', '').strip()
+    archive = bool(request.GET.get('archive'))
+    orders, next_cursor = [], None
+    if email and archive:
+        orders, next_cursor = history.archived_order_history(
+            email, request.GET.get('after'))
+    elif email:
+        orders, next_cursor = history.order_history(
+            Order, email, request.GET.get('after'))
+    return render(request,
+                  'orders/order/lookup.html',
+                  {'email': email,
+                   'archive': archive,
+                   'orders': orders,
+                   'next_cursor': next_cursor})
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import PaymentEvent
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'order_id', 'amount', 'received',
+                    'processed', 'outcome']
+    list_filter = ['type', 'outcome']
+    search_fields = ['=event_id', '=order_id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,119 @@
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import reverse
+from orders.models import Order
+from payments import ingest
+from payments.models import PaymentEvent
+from payments.views import webhook
+
+
+class Command(BaseCommand):
+    help = ('Local stand-in payment gateway: fire signed callbacks, with '
+            'duplicates and retries, at the webhook and apply them, '
+            'reporting the throughput of both steps')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--callbacks', type=int, default=5000)
+        parser.add_argument('--duplicates', type=float, default=0.1,
+                            help='Share of events delivered twice at once')
+        parser.add_argument('--retries', type=float, default=0.1,
+                            help='Share of events delivered again at the end')
+        parser.add_argument('--failures', type=float, default=0.05,
+                            help='Share of payment.failed events')
+        parser.add_argument('--create-orders', type=int, default=0,
+                            help='Create this many unpaid orders to pay first')
+        parser.add_argument('--url', default=None,
+                            help='Post over HTTP to this webhook URL instead '
+                                 'of calling the view in this process')
+        parser.add_argument('--no-apply', action='store_true')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['create_orders']:
+            Order.objects.bulk_create(
+                Order(first_name='Fake', last_name='Gateway',
+                      email=f'fake-{i}@example.com', address='-',
+                      postal_code='-', city='-')
+                for i in range(options['create_orders']))
+        order_ids = list(Order.objects.filter(paid=False)
+                         .values_list('id', flat=True)
+                         [:options['callbacks']])
+        if not order_ids:
+            raise CommandError('No unpaid orders, use --create-orders')
+        totals = ingest.order_totals(order_ids)
+
+        events = []
+        for i in range(options['callbacks']):
+            order_id = order_ids[i % len(order_ids)]
+            failed = rng.random() < options['failures']
+            events.append({
+                'id': f'evt_{uuid.uuid4().hex}',
+                'type': (PaymentEvent.FAILED if failed
+                         else PaymentEvent.SUCCEEDED),
+                'order_id': order_id,
+                'amount': str(totals[order_id]),
+            })
+        deliveries = []
+        for event in events:
+            deliveries.append(event)
+            if rng.random() < options['duplicates']:
+                deliveries.append(event)
+        deliveries += [event for event in events
+                       if rng.random() < options['retries']]
+
+        send = self.http_sender(options['url']) if options['url'] \
+            else self.local_sender()
+        statuses = Counter()
+        start = time.perf_counter()
+        for event in deliveries:
+            statuses[send(json.dumps(event).encode())] += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Delivered {len(deliveries)} callbacks for {len(events)} '
+            f'events in {elapsed:.2f}s ({len(deliveries) / elapsed:.0f}/s), '
+            f'statuses {dict(statuses)}')
+
+        if options['no_apply'] or options['url']:
+            return
+        start = time.perf_counter()
+        applied = ingest.apply_pending(max_batches=len(deliveries))
+        elapsed = time.perf_counter() - start
+        outcomes = Counter(PaymentEvent.objects
+                           .filter(event_id__in=[e['id'] for e in events])
+                           .values_list('outcome', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f'Applied {applied} events in {elapsed:.2f}s '
+            f'({applied / max(elapsed, 1e-9):.0f}/s), '
+            f'outcomes {dict(outcomes)}'))
+
+    @staticmethod
+    def local_sender():
+        factory = RequestFactory()
+        path = reverse('payments:webhook')
+
+        def send(body):
+            request = factory.post(
+                path, body, content_type='application/json',
+                **{'HTTP_' + ingest.SIGNATURE_HEADER.upper().replace('-', '_'):
+                   ingest.sign(body)})
+            return webhook(request).status_code
+        return send
+
+    @staticmethod
+    def http_sender(url):
+        import requests
+        session = requests.Session()
+
+        def send(body):
+            return session.post(url, data=body, headers={
+                'Content-Type': 'application/json',
+                ingest.SIGNATURE_HEADER: ingest.sign(body),
+            }).status_code
+        return send
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('type', models.CharField(choices=[('payment.succeeded', 'Succeeded'), ('payment.failed', 'Failed')], max_length=30)),
+                ('order_id', models.BigIntegerField()),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('processed', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, choices=[('applied', 'Applied'), ('ignored', 'Ignored'), ('unknown_order', 'Unknown order'), ('amount_mismatch', 'Amount mismatch')], max_length=20)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paymentevent',
+            index=models.Index(condition=models.Q(('processed__isnull', True)), fields=['id'], name='payment_unprocessed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentevent',
+            index=models.Index(fields=['processed'], name='payments_pa_process_759853_idx'),
+        ),
+    ]
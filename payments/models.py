@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class PaymentEvent(models.Model):
+    SUCCEEDED = 'payment.succeeded'
+    FAILED = 'payment.failed'
+    TYPE_CHOICES = [(SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    APPLIED = 'applied'
+    IGNORED = 'ignored'
+    UNKNOWN_ORDER = 'unknown_order'
+    AMOUNT_MISMATCH = 'amount_mismatch'
+    OUTCOME_CHOICES = [(APPLIED, 'Applied'),
+                       (IGNORED, 'Ignored'),
+                       (UNKNOWN_ORDER, 'Unknown order'),
+                       (AMOUNT_MISMATCH, 'Amount mismatch')]
+
+    # the gateway's id; retried and duplicated callbacks share it
+    event_id = models.CharField(max_length=100, unique=True)
+    type = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    # not a foreign key, a callback is recorded before it is checked
+    order_id = models.BigIntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2,
+                                 null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    received = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES,
+                               blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'],
+                         condition=models.Q(processed__isnull=True),
+                         name='payment_unprocessed_idx'),
+            models.Index(fields=['processed']),
+        ]
+
+    def __str__(self):
+        return self.event_id
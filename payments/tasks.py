@@ -0,0 +1,12 @@
+from celery import shared_task
+from . import ingest
+
+
+@shared_task
+def apply_payments():
+    return ingest.apply_pending()
+
+
+@shared_task
+def purge_payment_events():
+    return ingest.purge()
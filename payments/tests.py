@@ -0,0 +1,148 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from shop.models import Category, Product
+from orders.models import Order, OrderItem
+from . import ingest
+from .models import PaymentEvent
+
+
+class PaymentTestMixin:
+
+    def create_order(self, quantity=2):
+        order = Order.objects.create(first_name='John', last_name='Doe',
+                                     email='john@example.com',
+                                     address='123 Main St',
+                                     postal_code='12345', city='New York')
+        OrderItem.objects.create(order=order, product=self.product,
+                                 price=Decimal('10.00'), quantity=quantity)
+        return order
+
+    def callback(self, event_id, order, type=PaymentEvent.SUCCEEDED,
+                 amount='20.00'):
+        return {'id': event_id, 'type': type, 'order_id': order.id,
+                'amount': amount}
+
+    def setUp(self):
+        category = Category.objects.create(name='Tea', slug='tea')
+        self.product = Product.objects.create(category=category,
+                                              name='Sencha', slug='sencha',
+                                              price=Decimal('10.00'))
+
+
+class WebhookTests(PaymentTestMixin, TestCase):
+    """Тесты приема уведомлений о платежах"""
+
+    def post(self, payload, signature=None):
+        body = json.dumps(payload).encode()
+        return self.client.post(
+            reverse('payments:webhook'), body,
+            content_type='application/json',
+            HTTP_X_PAYMENT_SIGNATURE=signature or ingest.sign(body))
+
+    def test_callback_recorded_not_applied(self):
+        """Уведомление сохраняется, заказ пока не оплачен"""
+        order = self.create_order()
+        response = self.post(self.callback('evt_1', order))
+        self.assertEqual(response.status_code, 202)
+        event = PaymentEvent.objects.get()
+        self.assertEqual(event.order_id, order.id)
+        self.assertEqual(event.amount, Decimal('20.00'))
+        self.assertIsNone(event.processed)
+        order.refresh_from_db()
+        self.assertFalse(order.paid)
+
+    def test_duplicate_event_stored_once(self):
+        """Повторная доставка с тем же id не дублируется"""
+        order = self.create_order()
+        self.assertEqual(self.post(self.callback('evt_1', order))
+                         .status_code, 202)
+        self.assertEqual(self.post(self.callback('evt_1', order))
+                         .status_code, 202)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+    def test_bad_signature_rejected(self):
+        """Неподписанное уведомление отклоняется"""
+        order = self.create_order()
+        response = self.post(self.callback('evt_1', order), signature='x')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_malformed_callback_rejected(self):
+        """Некорректное уведомление отклоняется"""
+        self.assertEqual(self.post({'id': 'evt_1'}).status_code, 400)
+        self.assertEqual(self.post({'id': 'evt_1', 'type': 'refund',
+                                    'order_id': 1}).status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+
+class ApplyPaymentsTests(PaymentTestMixin, TestCase):
+    """Тесты пакетного применения платежей"""
+
+    def test_batch_applied_with_bulk_update(self):
+        """Пакет применяется фиксированным числом запросов"""
+        orders = [self.create_order() for _ in range(5)]
+        for i, order in enumerate(orders):
+            ingest.record(self.callback(f'evt_{i}', order))
+        ingest.record(self.callback('evt_retry', orders[0]))
+        before = orders[0].updated
+        # select, order totals, orders UPDATE, one UPDATE per outcome
+        # and the savepoint pair of the test transaction
+        with self.assertNumQueries(6):
+            self.assertEqual(ingest.apply_events(), 6)
+        self.assertEqual(Order.objects.filter(paid=True).count(), 5)
+        orders[0].refresh_from_db()
+        self.assertGreater(orders[0].updated, before)
+        self.assertFalse(PaymentEvent.objects.filter(
+            processed__isnull=True).exists())
+
+    def test_outcomes(self):
+        """Неудачные, чужие и несовпадающие по сумме платежи не применяются"""
+        order = self.create_order()
+        ingest.record(self.callback('evt_failed', order,
+                                    type=PaymentEvent.FAILED))
+        ingest.record(self.callback('evt_short', order, amount='5.00'))
+        ingest.record({'id': 'evt_ghost', 'type': PaymentEvent.SUCCEEDED,
+                       'order_id': order.id + 100})
+        ingest.apply_pending()
+        order.refresh_from_db()
+        self.assertFalse(order.paid)
+        self.assertEqual(
+            dict(PaymentEvent.objects.values_list('event_id', 'outcome')),
+            {'evt_failed': PaymentEvent.IGNORED,
+             'evt_short': PaymentEvent.AMOUNT_MISMATCH,
+             'evt_ghost': PaymentEvent.UNKNOWN_ORDER})
+
+    @override_settings(PAYMENTS_BATCH_SIZE=2)
+    def test_apply_pending_drains_batches(self):
+        """Все пакеты обрабатываются"""
+        for i in range(5):
+            ingest.record(self.callback(f'evt_{i}', self.create_order()))
+        self.assertEqual(ingest.apply_pending(), 5)
+        self.assertEqual(ingest.apply_pending(), 0)
+
+    def test_purge(self):
+        """Старые обработанные события удаляются"""
+        order = self.create_order()
+        ingest.record(self.callback('evt_old', order))
+        ingest.record(self.callback('evt_new', order))
+        ingest.apply_pending()
+        PaymentEvent.objects.filter(event_id='evt_old').update(
+            processed=timezone.now() - timedelta(days=40))
+        self.assertEqual(ingest.purge(), 1)
+        self.assertEqual(PaymentEvent.objects.get().event_id, 'evt_new')
+
+    def test_fake_gateway(self):
+        """Тестовый шлюз с дублями и повторами"""
+        out = StringIO()
+        call_command('fake_gateway', callbacks=50, create_orders=20,
+                     duplicates=0.5, retries=0.5, failures=0, seed=1,
+                     stdout=out)
+        self.assertEqual(PaymentEvent.objects.count(), 50)
+        self.assertEqual(Order.objects.filter(paid=True).count(), 20)
+        self.assertIn('Applied 50 events', out.getvalue())
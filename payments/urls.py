@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'payments'
+
+urlpatterns = [
+    path('webhook/', views.webhook, name='webhook'),
+]
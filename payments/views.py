@@ -0,0 +1,20 @@
+import json
+
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .ingest import InvalidCallback, SIGNATURE_HEADER, record, verify
+
+
+@csrf_exempt
+@require_POST
+def webhook(request):
+    # only records the callback, the apply_payments task does the rest
+    if not verify(request.body, request.headers.get(SIGNATURE_HEADER)):
+        return HttpResponseForbidden('Bad signature')
+    try:
+        record(json.loads(request.body))
+    except (ValueError, InvalidCallback) as exc:
+        return HttpResponseBadRequest(str(exc))
+    return HttpResponse(status=202)
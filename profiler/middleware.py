@@ -0,0 +1,112 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from .store import save_report
+
+# Python 3.12 allows one active profiler per process; requests picked
+# while another one is profiled are served unprofiled
+_profiling = threading.Lock()
+
+
+class SQLCapture:
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'params': repr(params)[:500],
+                'duration_ms': (time.perf_counter() - start) * 1000,
+                'origin': self.origin(),
+            })
+
+    @staticmethod
+    def origin():
+        base_dir = str(settings.BASE_DIR)
+        for frame in reversed(traceback.extract_stack()[:-2]):
+            if (frame.filename.startswith(base_dir)
+                    and 'site-packages' not in frame.filename
+                    and not frame.filename.endswith('profiler/middleware.py')):
+                return f'{frame.filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}'
+        return ''
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a request with cProfile and records its SQL when a staff
+    user asks for it with the X-Profile header or a _profile query
+    parameter, or when the request is picked by PROFILER_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if not settings.PROFILER_ENABLED:
+            return False
+        if ('HTTP_X_PROFILE' in request.META
+                or '_profile' in request.GET):
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return True
+        rate = settings.PROFILER_SAMPLE_RATE
+        return bool(rate) and random.random() < rate
+
+    def __call__(self, request):
+        if (not self.should_profile(request)
+                or not _profiling.acquire(blocking=False)):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _profiling.release()
+
+    def profile(self, request):
+        captures = [SQLCapture(alias) for alias in connections]
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool is active, e.g. coverage
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for capture in captures:
+                    stack.enter_context(
+                        connections[capture.alias].execute_wrapper(capture))
+                response = self.get_response(request)
+        finally:
+            profile.disable()
+        duration = time.perf_counter() - start
+
+        stats = io.StringIO()
+        pstats.Stats(profile, stream=stats).sort_stats(
+            'cumulative').print_stats(settings.PROFILER_TOP_FUNCTIONS)
+        queries = [q for capture in captures for q in capture.queries]
+        save_report({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'started': time.time() - duration,
+            'duration_ms': duration * 1000,
+            'sql_ms': sum(q['duration_ms'] for q in queries),
+            'sql': queries,
+            'profile': stats.getvalue(),
+        })
+        return response
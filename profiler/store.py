@@ -0,0 +1,60 @@
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+REPORT_NAME = re.compile(r'^\d+-[0-9a-f]{8}\.json$')
+
+
+def _directory():
+    directory = Path(settings.PROFILER_STORE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def save_report(report):
+    directory = _directory()
+    name = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}.json'
+    tmp = directory / f'.{name}'
+    tmp.write_text(json.dumps(report))
+    os.replace(tmp, directory / name)
+    rotate(directory)
+    return name
+
+
+def rotate(directory=None):
+    directory = directory or _directory()
+    names = sorted(p.name for p in directory.iterdir()
+                   if REPORT_NAME.match(p.name))
+    for name in names[:-settings.PROFILER_MAX_REPORTS]:
+        (directory / name).unlink(missing_ok=True)
+
+
+def list_reports():
+    reports = []
+    directory = _directory()
+    for path in sorted(directory.iterdir(), reverse=True):
+        if not REPORT_NAME.match(path.name):
+            continue
+        try:
+            report = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        report.pop('profile', None)
+        report['sql_count'] = len(report.pop('sql', []))
+        report['name'] = path.name
+        reports.append(report)
+    return reports
+
+
+def load_report(name):
+    if not REPORT_NAME.match(name):
+        return None
+    try:
+        return json.loads((_directory() / name).read_text())
+    except (OSError, ValueError):
+        return None
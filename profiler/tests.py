@@ -0,0 +1,114 @@
+import tempfile
+import threading
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from shop.models import Product, Category
+from .middleware import ProfilerMiddleware
+from .store import list_reports, save_report
+
+
+class ProfilerTests(TestCase):
+    """Тесты профилировщика запросов"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILER_STORE_DIR=self.tmp.name,
+                                          PROFILER_MAX_REPORTS=3)
+        self.settings.enable()
+        category = Category.objects.create(name='Tea', slug='tea')
+        Product.objects.create(category=category,
+                               name='Green tea',
+                               slug='green-tea',
+                               price=Decimal('10.00'))
+        self.staff = User.objects.create_user('staff', password='pass',
+                                              is_staff=True)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp.cleanup()
+
+    def test_staff_request_is_profiled(self):
+        """Запрос сотрудника с заголовком профилируется"""
+        self.client.login(username='staff', password='pass')
+        self.client.get(reverse('shop:product_list'), HTTP_X_PROFILE='1')
+
+        reports = list_reports()
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0]['path'], '/')
+        self.assertGreater(reports[0]['sql_count'], 0)
+
+        response = self.client.get(
+            reverse('profiler:report_detail', args=[reports[0]['name']]))
+        self.assertContains(response, 'shop/views.py')
+
+    def test_anonymous_flag_is_ignored(self):
+        """Флаг от обычного посетителя игнорируется"""
+        self.client.get(reverse('shop:product_list') + '?_profile=1')
+        self.assertEqual(list_reports(), [])
+
+    def test_flag_is_a_parameter(self):
+        """Флаг — отдельный параметр, а не часть значения"""
+        self.client.login(username='staff', password='pass')
+        self.client.get(reverse('shop:product_list') + '?q=my_profile')
+        self.assertEqual(list_reports(), [])
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_sampling(self):
+        """Профилирование выборки трафика"""
+        self.client.get(reverse('shop:product_list'))
+        self.assertEqual(len(list_reports()), 1)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_concurrent_requests(self):
+        """Параллельный запрос обслуживается без профилирования"""
+        started, release = threading.Event(), threading.Event()
+
+        def get_response(request):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            return HttpResponse('ok')
+        middleware = ProfilerMiddleware(get_response)
+        responses = []
+        first = threading.Thread(target=lambda: responses.append(
+            middleware(RequestFactory().get('/first/'))))
+        first.start()
+        started.wait(5)
+        try:
+            responses.append(middleware(RequestFactory().get('/second/')))
+        finally:
+            release.set()
+            first.join()
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual([r['path'] for r in list_reports()], ['/first/'])
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_other_profiler_active(self):
+        """Запрос без профилирования, если активен другой профилировщик"""
+        with patch('cProfile.Profile.enable', side_effect=ValueError(
+                'Another profiling tool is already active')):
+            response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list_reports(), [])
+
+    def test_rotation(self):
+        """Хранится ограниченное число отчетов"""
+        for i in range(5):
+            save_report({'path': f'/{i}/'})
+        self.assertEqual([r['path'] for r in list_reports()],
+                         ['/4/', '/3/', '/2/'])
+
+    def test_report_views_require_staff(self):
+        """Отчеты доступны только сотрудникам"""
+        response = self.client.get(reverse('profiler:report_list'))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='staff', password='pass')
+        response = self.client.get(reverse('profiler:report_list'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('profiler:report_detail', args=['..etc']))
+        self.assertEqual(response.status_code, 404)
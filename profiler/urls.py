@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'profiler'
+
+urlpatterns = [
+    path('', views.report_list, name='report_list'),
+    path('<str:name>/', views.report_detail, name='report_detail'),
+]
@@ -0,0 +1,21 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.shortcuts import render
+from .store import list_reports, load_report
+
+
+@staff_member_required
+def report_list(request):
+    return render(request,
+                  'profiler/list.html',
+                  {'reports': list_reports()})
+
+
+@staff_member_required
+def report_detail(request, name):
+    report = load_report(name)
+    if report is None:
+        raise Http404('No such report')
+    return render(request,
+                  'profiler/detail.html',
+                  {'name': name, 'report': report})
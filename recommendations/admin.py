@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import Recommendation
+
+@admin.register(Recommendation)
+class RecommendationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'position', 'recommended', 'score']
+    raw_id_fields = ['product', 'recommended']
@@ -0,0 +1,112 @@
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from .models import PairCount, Recommendation, Watermark
+
+
+def count_pairs(rows):
+    # rows are (order_id, product_id) tuples sorted by order_id
+    counts = Counter()
+    for _, items in groupby(rows, key=itemgetter(0)):
+        basket = sorted({product_id for _, product_id in items})
+        counts.update(combinations(basket, 2))
+    return counts
+
+
+def merge_pair_counts(counts):
+    if not counts:
+        return
+    existing = {
+        (pair.product_a_id, pair.product_b_id): pair
+        for pair in PairCount.objects.filter(
+            product_a__in={a for a, _ in counts},
+            product_b__in={b for _, b in counts})
+    }
+    to_update, to_create = [], []
+    for key, count in counts.items():
+        pair = existing.get(key)
+        if pair:
+            pair.count += count
+            to_update.append(pair)
+        else:
+            to_create.append(PairCount(product_a_id=key[0],
+                                       product_b_id=key[1],
+                                       count=count))
+    PairCount.objects.bulk_update(to_update, ['count'], batch_size=500)
+    PairCount.objects.bulk_create(to_create, batch_size=500)
+
+
+def refresh_top_k(product_ids, top_k):
+    if not product_ids:
+        return
+    neighbours = defaultdict(list)
+    pairs = PairCount.objects.filter(
+        Q(product_a__in=product_ids) | Q(product_b__in=product_ids)
+    ).values_list('product_a_id', 'product_b_id', 'count')
+    for a, b, count in pairs.iterator():
+        if a in product_ids:
+            neighbours[a].append((-count, b))
+        if b in product_ids:
+            neighbours[b].append((-count, a))
+    Recommendation.objects.filter(product_id__in=product_ids).delete()
+    recommendations = [
+        Recommendation(product_id=product_id,
+                       recommended_id=other_id,
+                       score=-count,
+                       position=position)
+        for product_id, candidates in neighbours.items()
+        for position, (count, other_id)
+        in enumerate(heapq.nsmallest(top_k, candidates))
+    ]
+    Recommendation.objects.bulk_create(recommendations, batch_size=500)
+
+
+def update_recommendations(batch_size=None, top_k=None, settle_seconds=None):
+    batch_size = batch_size or settings.RECOMMENDATIONS_BATCH_SIZE
+    top_k = top_k or settings.RECOMMENDATIONS_TOP_K
+    if settle_seconds is None:
+        settle_seconds = settings.RECOMMENDATIONS_SETTLE_SECONDS
+    # orders younger than the settle window may still be receiving items
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    Watermark.load()
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark = Watermark.objects.select_for_update().get(pk=1)
+            order_ids = list(
+                Order.objects.filter(id__gt=watermark.last_order_id,
+                                     created__lte=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            rows = OrderItem.objects.filter(
+                order_id__gt=watermark.last_order_id,
+                order_id__lte=order_ids[-1]
+            ).order_by('order_id').values_list('order_id', 'product_id')
+            counts = count_pairs(rows.iterator())
+            merge_pair_counts(counts)
+            refresh_top_k({product_id for pair in counts
+                           for product_id in pair}, top_k)
+            watermark.last_order_id = order_ids[-1]
+            watermark.save()
+        processed += len(order_ids)
+    return processed
+
+
+def rebuild_recommendations(**kwargs):
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        PairCount.objects.all().delete()
+        Watermark.objects.update_or_create(pk=1,
+                                           defaults={'last_order_id': 0})
+    return update_recommendations(**kwargs)
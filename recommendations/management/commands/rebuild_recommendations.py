@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from recommendations.builder import rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product co-occurrence counts and top-K recommendations from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--top-k', type=int, default=None)
+
+    def handle(self, *args, **options):
+        processed = rebuild_recommendations(batch_size=options['batch_size'],
+                                            top_k=options['top_k'],
+                                            settle_seconds=0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} orders'))
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField()),
+                ('position', models.PositiveSmallIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='shop.product')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'ordering': ['product', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+                ('product_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['product', 'position'], name='recommendat_product_38dd67_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='paircount',
+            constraint=models.UniqueConstraint(fields=('product_a', 'product_b'), name='unique_pair'),
+        ),
+    ]
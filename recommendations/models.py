@@ -0,0 +1,51 @@
+from django.db import models
+from shop.models import Product
+
+
+class PairCount(models.Model):
+    product_a = models.ForeignKey(Product,
+                                  related_name='+',
+                                  on_delete=models.CASCADE)
+    product_b = models.ForeignKey(Product,
+                                  related_name='+',
+                                  on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_a', 'product_b'],
+                                    name='unique_pair'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_a_id}+{self.product_b_id}: {self.count}'
+
+
+class Recommendation(models.Model):
+    product = models.ForeignKey(Product,
+                                related_name='recommendations',
+                                on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Product,
+                                    related_name='+',
+                                    on_delete=models.CASCADE)
+    score = models.PositiveIntegerField()
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'position']
+        indexes = [
+            models.Index(fields=['product', 'position']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.recommended_id}'
+
+
+class Watermark(models.Model):
+    last_order_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def load(cls):
+        watermark, _ = cls.objects.get_or_create(pk=1)
+        return watermark
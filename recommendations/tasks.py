@@ -0,0 +1,6 @@
+from celery import shared_task
+from . import builder
+
+@shared_task
+def update_recommendations():
+    return builder.update_recommendations()
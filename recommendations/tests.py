@@ -0,0 +1,96 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from shop.models import Product, Category
+from orders.models import Order, OrderItem
+from .builder import count_pairs, update_recommendations
+from .models import PairCount, Recommendation, Watermark
+
+
+class RecommendationTests(TestCase):
+    """Тесты рекомендаций «часто покупают вместе»"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        self.products = [
+            Product.objects.create(
+                category=self.category,
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                price=Decimal('10.00'),
+                available=True
+            )
+            for i in range(4)
+        ]
+
+    def create_order(self, *products):
+        order = Order.objects.create(
+            first_name='John',
+            last_name='Doe',
+            email='john@example.com',
+            address='123 Main St',
+            postal_code='12345',
+            city='New York'
+        )
+        for product in products:
+            OrderItem.objects.create(order=order,
+                                     product=product,
+                                     price=product.price)
+        return order
+
+    def test_count_pairs(self):
+        """Подсчет пар внутри заказа"""
+        counts = count_pairs([(1, 3), (1, 1), (1, 3), (2, 1), (2, 3),
+                              (2, 2)])
+        self.assertEqual(counts, {(1, 3): 2, (1, 2): 1, (2, 3): 1})
+
+    def test_incremental_update(self):
+        """Инкрементальное обновление по водяному знаку"""
+        p0, p1, p2, p3 = self.products
+        self.create_order(p0, p1)
+        self.create_order(p0, p1, p2)
+        self.assertEqual(update_recommendations(settle_seconds=0), 2)
+        last = self.create_order(p0, p2, p3)
+        self.assertEqual(update_recommendations(settle_seconds=0), 1)
+        self.assertEqual(update_recommendations(settle_seconds=0), 0)
+
+        self.assertEqual(Watermark.load().last_order_id, last.id)
+        pair = PairCount.objects.get(product_a=p0, product_b=p2)
+        self.assertEqual(pair.count, 2)
+        recommended = list(
+            Recommendation.objects.filter(product=p0)
+            .values_list('recommended_id', 'score')
+        )
+        self.assertEqual(recommended[:2], [(p1.id, 2), (p2.id, 2)])
+
+    def test_top_k_limit(self):
+        """Хранятся только K соседей"""
+        self.create_order(*self.products)
+        update_recommendations(top_k=2, settle_seconds=0)
+        self.assertEqual(
+            Recommendation.objects.filter(product=self.products[0]).count(),
+            2
+        )
+
+    def test_rebuild_command(self):
+        """Полная перестройка командой"""
+        self.create_order(*self.products[:2])
+        update_recommendations(settle_seconds=0)
+        PairCount.objects.update(count=100)
+        call_command('rebuild_recommendations', stdout=StringIO())
+        self.assertEqual(PairCount.objects.get().count, 1)
+
+    def test_product_detail_shows_recommendations(self):
+        """Рекомендации на странице товара"""
+        p0, p1 = self.products[:2]
+        self.create_order(p0, p1)
+        update_recommendations(settle_seconds=0)
+        response = self.client.get(
+            reverse('shop:product_detail', args=[p0.id, p0.slug])
+        )
+        self.assertEqual(response.context['recommended_products'], [p1])
@@ -0,0 +1,35 @@
+from django.contrib import admin
+from .models import DailySales, DailyProductSales, DailyCategorySales
+
+
+class RollupAdmin(admin.ModelAdmin):
+    list_filter = ['paid']
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(RollupAdmin):
+    list_display = ['day', 'paid', 'order_count', 'units', 'revenue']
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(RollupAdmin):
+    list_display = ['day', 'product', 'paid', 'order_count', 'units',
+                    'revenue']
+    list_select_related = ['product']
+
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(RollupAdmin):
+    list_display = ['day', 'category', 'paid', 'order_count', 'units',
+                    'revenue']
+    list_select_related = ['category']
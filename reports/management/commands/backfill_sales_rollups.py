@@ -0,0 +1,16 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from reports.rollups import backfill_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily sales rollups from the full order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            default=None,
+                            help='Only rebuild days from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        days = backfill_sales_rollups(since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {days} days'))
@@ -0,0 +1,96 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('paid', models.BooleanField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'daily category sales',
+                'verbose_name_plural': 'daily category sales',
+                'ordering': ['-day'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('paid', models.BooleanField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'daily product sales',
+                'verbose_name_plural': 'daily product sales',
+                'ordering': ['-day'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('paid', models.BooleanField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'daily sales',
+                'verbose_name_plural': 'daily sales',
+                'ordering': ['-day'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_updated', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('day', 'paid'), name='unique_daily_sales'),
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product'),
+        ),
+        migrations.AddField(
+            model_name='dailycategorysales',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('day', 'paid', 'product'), name='unique_daily_product_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('day', 'paid', 'category'), name='unique_daily_category_sales'),
+        ),
+    ]
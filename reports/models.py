@@ -0,0 +1,73 @@
+from django.db import models
+from shop.models import Category, Product
+
+
+class SalesRollup(models.Model):
+    day = models.DateField()
+    paid = models.BooleanField()
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14,
+                                  decimal_places=2,
+                                  default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['-day']
+
+
+class DailySales(SalesRollup):
+
+    class Meta(SalesRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'paid'],
+                                    name='unique_daily_sales'),
+        ]
+        verbose_name = 'daily sales'
+        verbose_name_plural = 'daily sales'
+
+    def __str__(self):
+        return f'{self.day}'
+
+
+class DailyProductSales(SalesRollup):
+    product = models.ForeignKey(Product,
+                                related_name='+',
+                                on_delete=models.CASCADE)
+
+    class Meta(SalesRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'paid', 'product'],
+                                    name='unique_daily_product_sales'),
+        ]
+        verbose_name = 'daily product sales'
+        verbose_name_plural = 'daily product sales'
+
+    def __str__(self):
+        return f'{self.day} {self.product_id}'
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category,
+                                 related_name='+',
+                                 on_delete=models.CASCADE)
+
+    class Meta(SalesRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'paid', 'category'],
+                                    name='unique_daily_category_sales'),
+        ]
+        verbose_name = 'daily category sales'
+        verbose_name_plural = 'daily category sales'
+
+    def __str__(self):
+        return f'{self.day} {self.category_id}'
+
+
+class RollupWatermark(models.Model):
+    last_updated = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def load(cls):
+        watermark, _ = cls.objects.get_or_create(pk=1)
+        return watermark
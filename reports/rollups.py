@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from orders.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from .models import (DailySales, DailyProductSales, DailyCategorySales,
+                     RollupWatermark)
+
+
+def _days_q(days):
+    q = Q()
+    for day in days:
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        q |= Q(order__created__gte=start,
+               order__created__lt=start + timedelta(days=1))
+    return q
+
+
+def _aggregate(items, *fields, **expressions):
+    return items.values(*fields, **expressions).annotate(
+        order_count=Count('order', distinct=True),
+        units=Sum('quantity'),
+        revenue=Sum(F('price') * F('quantity'),
+                    output_field=models.DecimalField(max_digits=14,
+                                                     decimal_places=2)),
+    ).order_by()
+
+
+def rebuild_days(days):
+    days = sorted(set(days))
+    if not days:
+        return
+    dimensions = {'day': TruncDate('order__created'),
+                  'paid': F('order__paid')}
+    rollups = [
+        (DailySales, [], dimensions),
+        (DailyProductSales, ['product_id'], dimensions),
+        (DailyCategorySales, [],
+         dict(dimensions, category_id=F('product__category_id'))),
+    ]
+    with transaction.atomic():
+        for model, fields, expressions in rollups:
+            # an order lives in exactly one of the hot and archive
+            # tables, so their aggregates simply add up
+            rows = {}
+            for item_model in (OrderItem, ArchivedOrderItem):
+                items = item_model.objects.filter(_days_q(days))
+                for row in _aggregate(items, *fields, **expressions):
+                    key = tuple(row[k] for k in [*fields, *expressions])
+                    if key in rows:
+                        for metric in ('order_count', 'units', 'revenue'):
+                            rows[key][metric] += row[metric]
+                    else:
+                        rows[key] = row
+            model.objects.filter(day__in=days).delete()
+            model.objects.bulk_create([model(**row) for row in rows.values()],
+                                      batch_size=500)
+
+
+def update_sales_rollups(settle_seconds=None):
+    if settle_seconds is None:
+        settle_seconds = settings.REPORTS_SETTLE_SECONDS
+    # rows saved just before the cutoff may not be committed yet
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    RollupWatermark.load()
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().get(pk=1)
+        changed = Order.objects.filter(updated__lte=cutoff)
+        if watermark.last_updated:
+            changed = changed.filter(updated__gt=watermark.last_updated)
+        days = set(changed.annotate(day=TruncDate('created'))
+                   .values_list('day', flat=True).order_by())
+        rebuild_days(days)
+        watermark.last_updated = cutoff
+        watermark.save()
+    return len(days)
+
+
+def backfill_sales_rollups(since=None, chunk_days=31):
+    started = timezone.now()
+    days = set()
+    for model in (Order, ArchivedOrder):
+        orders = model.objects.all()
+        if since:
+            orders = orders.filter(created__gte=timezone.make_aware(
+                datetime.combine(since, time.min)))
+        days.update(orders.annotate(day=TruncDate('created'))
+                    .values_list('day', flat=True).order_by())
+    days = sorted(days)
+    for i in range(0, len(days), chunk_days):
+        rebuild_days(days[i:i + chunk_days])
+    RollupWatermark.objects.update_or_create(
+        pk=1, defaults={'last_updated': started})
+    return len(days)
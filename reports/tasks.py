@@ -0,0 +1,6 @@
+from celery import shared_task
+from . import rollups
+
+@shared_task
+def update_sales_rollups():
+    return rollups.update_sales_rollups()
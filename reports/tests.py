@@ -0,0 +1,110 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from shop.models import Product, Category
+from orders.models import Order, OrderItem
+from orders.archive import archive_orders
+from .models import DailySales, DailyProductSales, DailyCategorySales
+from .rollups import update_sales_rollups
+
+
+class SalesRollupTests(TestCase):
+    """Тесты дневных агрегатов продаж"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Test Product',
+            slug='test-product',
+            price=Decimal('100.00'),
+            available=True
+        )
+
+    def create_order(self, quantity=1):
+        order = Order.objects.create(
+            first_name='John',
+            last_name='Doe',
+            email='john@example.com',
+            address='123 Main St',
+            postal_code='12345',
+            city='New York'
+        )
+        OrderItem.objects.create(order=order,
+                                 product=self.product,
+                                 price=Decimal('100.00'),
+                                 quantity=quantity)
+        return order
+
+    def test_update_creates_rollups(self):
+        """Агрегаты по дню, товару и категории"""
+        self.create_order(quantity=2)
+        self.create_order(quantity=1)
+        update_sales_rollups(settle_seconds=0)
+
+        daily = DailySales.objects.get()
+        self.assertFalse(daily.paid)
+        self.assertEqual(daily.order_count, 2)
+        self.assertEqual(daily.units, 3)
+        self.assertEqual(daily.revenue, Decimal('300.00'))
+        self.assertEqual(DailyProductSales.objects.get().units, 3)
+        self.assertEqual(DailyCategorySales.objects.get().order_count, 2)
+
+    def test_paid_status_change(self):
+        """Смена статуса оплаты переносит заказ в другую группу"""
+        order = self.create_order(quantity=2)
+        self.create_order(quantity=1)
+        update_sales_rollups(settle_seconds=0)
+
+        order.paid = True
+        order.save()
+        update_sales_rollups(settle_seconds=0)
+
+        unpaid = DailySales.objects.get(paid=False)
+        paid = DailySales.objects.get(paid=True)
+        self.assertEqual(unpaid.units, 1)
+        self.assertEqual(paid.units, 2)
+        self.assertEqual(paid.revenue, Decimal('200.00'))
+
+    def test_unchanged_orders_are_skipped(self):
+        """Без изменений пересчет не выполняется"""
+        self.create_order()
+        self.assertEqual(update_sales_rollups(settle_seconds=0), 1)
+        self.assertEqual(update_sales_rollups(settle_seconds=0), 0)
+
+    def test_backfill_command(self):
+        """Полный пересчет командой"""
+        order = self.create_order()
+        Order.objects.filter(id=order.id).update(
+            created=timezone.now() - timedelta(days=3))
+        self.create_order()
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(DailySales.objects.count(), 2)
+
+    def test_backfill_includes_archive(self):
+        """Архивные заказы учитываются при пересчете"""
+        order = self.create_order(quantity=2)
+        Order.objects.filter(id=order.id).update(
+            paid=True, created=timezone.now() - timedelta(days=400))
+        archive_orders(older_than_days=365)
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(DailySales.objects.get().units, 2)
+
+    def test_admin_report_page(self):
+        """Страница отчета в админке"""
+        self.create_order()
+        update_sales_rollups(settle_seconds=0)
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(
+            reverse('admin:reports_dailysales_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '100.00')
@@ -0,0 +1,135 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from reports.models import DailyProductSales
+from .catalog import get_catalog_version
+from .models import Category, Product
+
+
+def normalize(text):
+    if text.isascii():
+        return text.lower().strip()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed
+                   if not unicodedata.combining(c)).casefold().strip()
+
+
+class PrefixIndex:
+    """
+    Sorted array of normalized keys searched with bisect. Every word of a
+    name starts a key, so 'hong' finds 'Da Hong Pao'. Prefixes matching
+    more than AUTOCOMPLETE_SCAN_LIMIT keys are ranked once at build time,
+    so a lookup never scans more than that many keys.
+    """
+
+    def __init__(self, entries):
+        # entries are (label, url, kind, popularity) tuples
+        self.entries = [(-popularity, label, url, kind)
+                        for label, url, kind, popularity in entries]
+        pairs = []
+        for i, (_, label, _, _) in enumerate(self.entries):
+            words = normalize(label).split()
+            for start in range(len(words)):
+                pairs.append((' '.join(words[start:]), i))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = [i for _, i in pairs]
+        self.ranked = self._rank_heavy_prefixes()
+
+    def _top(self, positions, limit):
+        return heapq.nsmallest(limit, set(positions),
+                               key=self.entries.__getitem__)
+
+    def _rank_heavy_prefixes(self):
+        ranked = {}
+        self._rank('', 0, len(self.keys), ranked)
+        return ranked
+
+    def _rank(self, prefix, lo, hi, ranked):
+        # returns the top positions of the range of keys starting with
+        # prefix, built from the tops of its child ranges
+        limit = settings.AUTOCOMPLETE_MAX_RESULTS
+        if hi - lo <= settings.AUTOCOMPLETE_SCAN_LIMIT:
+            return self._top(self.positions[lo:hi], limit)
+        depth = len(prefix)
+        candidates = []
+        # keys equal to the prefix sort first, the rest split by their
+        # next character into contiguous child ranges
+        while lo < hi and len(self.keys[lo]) == depth:
+            candidates.append(self.positions[lo])
+            lo += 1
+        while lo < hi:
+            child = self.keys[lo][:depth + 1]
+            end = bisect_left(self.keys, child + '\U0010ffff', lo, hi)
+            candidates.extend(self._rank(child, lo, end, ranked))
+            lo = end
+        top = self._top(candidates, limit)
+        if prefix:
+            ranked[prefix] = top
+        return top
+
+    def lookup(self, query, limit):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = self.ranked.get(prefix)
+        if found is None:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+            found = self._top(self.positions[lo:hi], limit)
+        return [{'label': self.entries[i][1],
+                 'url': self.entries[i][2],
+                 'kind': self.entries[i][3]} for i in found[:limit]]
+
+
+def product_popularity():
+    # orders per product over the last AUTOCOMPLETE_POPULARITY_DAYS, read
+    # from the daily rollups instead of aggregating every order item on
+    # each rebuild
+    since = timezone.now().date() - timedelta(
+        days=settings.AUTOCOMPLETE_POPULARITY_DAYS)
+    return dict(DailyProductSales.objects.filter(day__gte=since)
+                .values_list('product_id')
+                .annotate(orders=Sum('order_count'))
+                .order_by())
+
+
+def build_index():
+    # categories sum the popularity of their products
+    popularity = product_popularity()
+    category_popularity = defaultdict(int)
+    entries = []
+    products = (Product.objects.filter(available=True)
+                .only('id', 'slug', 'name', 'category_id'))
+    for product in products:
+        orders = popularity.get(product.id, 0)
+        category_popularity[product.category_id] += orders
+        entries.append((product.name, product.get_absolute_url(),
+                        'product', orders))
+    for category in Category.objects.all():
+        entries.append((category.name, category.get_absolute_url(),
+                        'category', category_popularity[category.id]))
+    return PrefixIndex(entries)
+
+
+_lock = threading.Lock()
+_index = None
+_version = None
+
+
+def get_index():
+    global _index, _version
+    version = get_catalog_version()
+    if version != _version:
+        with _lock:
+            if version != _version:
+                _index = build_index()
+                _version = version
+    return _index
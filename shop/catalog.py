@@ -0,0 +1,78 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from config.cache import TieredCache
+from recommendations.models import Recommendation
+from .models import Category, Product
+
+VERSION_KEY = 'catalog_version'
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        version = bump_catalog_version()
+    return version
+
+
+def bump_catalog_version():
+    version = time.time_ns()
+    _cache().set(VERSION_KEY, version, timeout=None)
+    return version
+
+
+# catalog reads shared by every worker; keys carry the catalog version,
+# so a change is seen as soon as the version is
+catalog_cache = TieredCache('catalog', settings.CATALOG_PAGE_CACHE_TIMEOUT,
+                            alias=settings.CATALOG_CACHE_ALIAS)
+
+
+def _cached(key, compute):
+    return catalog_cache.get_or_compute(f'{get_catalog_version()}:{key}',
+                                        compute)
+
+
+def catalog_categories():
+    return _cached('categories', lambda: list(Category.objects.all()))
+
+
+# product_list orderings, each served by a partial index
+SORTS = {
+    'name': ('name',),
+    'popular': ('-popularity', 'name'),
+}
+
+
+def available_products(category_id=None, sort='name'):
+    products = Product.objects.filter(available=True).order_by(*SORTS[sort])
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    return _cached(f'products:{category_id or ""}:{sort}',
+                   lambda: list(products))
+
+
+def bestseller_ids():
+    """Ids of the PRODUCT_BESTSELLERS most popular available products."""
+    return _cached('bestsellers', lambda: frozenset(
+        Product.objects.filter(available=True, popularity__gt=0)
+        .order_by(*SORTS['popular'])
+        .values_list('id', flat=True)[:settings.PRODUCT_BESTSELLERS]))
+
+
+def get_product(product_id):
+    """The available product with the id, or None."""
+    return _cached(f'product:{product_id}', lambda: Product.objects.filter(
+        id=product_id, available=True).first())
+
+
+def recommended_products(product_id):
+    return _cached(f'recommended:{product_id}', lambda: [
+        r.recommended for r in Recommendation.objects.filter(
+            product_id=product_id,
+            recommended__available=True
+        ).select_related('recommended')
+    ])
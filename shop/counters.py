@@ -0,0 +1,144 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, ExpressionWrapper, F, When
+from prometheus_client import Counter
+from .models import Product, ProductCounterDelta
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_EVENTS = Counter('tea_shop_product_events_total',
+                         'Product views and cart adds counted',
+                         ['event'])
+FIELDS = ('views', 'cart_adds')
+
+
+class CounterBuffer:
+    """
+    Per-process counts of product events. Recording is an increment
+    under a lock; the counts are written to ProductCounterDelta, one row
+    per product, at most PRODUCT_COUNTERS_SPILL_SECONDS after the first
+    of them or once PRODUCT_COUNTERS_SPILL_EVENTS have piled up, and
+    when the process exits. A killed process loses at most that much.
+    The exit hook is only registered by the first event, so processes
+    that never count anything, like Celery workers and commands, leave
+    the database alone at exit.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(lambda: [0, 0])
+        self.events = 0
+        self.timer = None
+        self.at_exit = False
+
+    def add(self, product_id, field):
+        with self.lock:
+            if not self.at_exit and settings.PRODUCT_COUNTERS_SPILL_AT_EXIT:
+                atexit.register(self.spill)
+                self.at_exit = True
+            self.counts[product_id][FIELDS.index(field)] += 1
+            self.events += 1
+            full = self.events >= settings.PRODUCT_COUNTERS_SPILL_EVENTS
+            delay = settings.PRODUCT_COUNTERS_SPILL_SECONDS
+            if not full and self.timer is None and delay is not None:
+                self.timer = threading.Timer(delay, self._spill_in_thread)
+                self.timer.daemon = True
+                self.timer.start()
+        PRODUCT_EVENTS.labels(field).inc()
+        if full:
+            self.spill()
+
+    def take(self):
+        with self.lock:
+            counts, self.counts = self.counts, defaultdict(lambda: [0, 0])
+            self.events = 0
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        return counts
+
+    def spill(self):
+        counts = self.take()
+        if not counts:
+            return 0
+        try:
+            # named database, a spill during a request is not the client's
+            # write and must not pin it to the primary
+            ProductCounterDelta.objects.using('default').bulk_create([
+                ProductCounterDelta(product_id=product_id, views=views,
+                                    cart_adds=cart_adds)
+                for product_id, (views, cart_adds) in counts.items()])
+        except Exception:
+            # keep them for the next spill rather than drop them
+            logger.exception('Could not spill product counters')
+            with self.lock:
+                for product_id, pair in counts.items():
+                    self.counts[product_id][0] += pair[0]
+                    self.counts[product_id][1] += pair[1]
+            return 0
+        return len(counts)
+
+    def _spill_in_thread(self):
+        try:
+            self.spill()
+        finally:
+            connection.close()
+
+
+buffer = CounterBuffer()
+
+
+def record_view(product_id):
+    buffer.add(product_id, 'views')
+
+
+def record_cart_add(product_id):
+    buffer.add(product_id, 'cart_adds')
+
+
+def flush(batch_size=None):
+    """
+    Folds pending deltas into Product, one UPDATE per batch of deltas,
+    and deletes them in the same transaction. Returns the number of
+    products updated.
+    """
+    batch_size = batch_size or settings.PRODUCT_COUNTERS_FLUSH_BATCH_SIZE
+    weight = settings.PRODUCT_POPULARITY_CART_ADD_WEIGHT
+    updated = 0
+    while True:
+        with transaction.atomic():
+            # concurrent flushes take disjoint deltas, as relay() does
+            deltas = list(ProductCounterDelta.objects
+                          .select_for_update(skip_locked=True)
+                          .order_by('id')
+                          .values_list('id', 'product_id', 'views',
+                                       'cart_adds')[:batch_size])
+            if not deltas:
+                return updated
+            totals = defaultdict(lambda: [0, 0])
+            for _, product_id, views, cart_adds in deltas:
+                totals[product_id][0] += views
+                totals[product_id][1] += cart_adds
+
+            def increment(field, amount):
+                output_field = Product._meta.get_field(field)
+                return Case(*[When(id=product_id, then=ExpressionWrapper(
+                                  F(field) + amount(pair),
+                                  output_field=output_field))
+                              for product_id, pair in totals.items()],
+                            default=F(field), output_field=output_field)
+
+            updated += Product.objects.filter(id__in=totals).update(
+                views=increment('views', lambda pair: pair[0]),
+                cart_adds=increment('cart_adds', lambda pair: pair[1]),
+                popularity=increment(
+                    'popularity', lambda pair: pair[0] + weight * pair[1]))
+            ProductCounterDelta.objects.filter(
+                id__in=[delta[0] for delta in deltas]).delete()
+        if len(deltas) < batch_size:
+            return updated
@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from .catalog import get_catalog_version
+from .models import Category, Product
+
+CURRENT = 'CURRENT'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def feeds_dir():
+    return Path(settings.FEEDS_DIR)
+
+
+def absolute(url):
+    return settings.SITE_URL.rstrip('/') + url
+
+
+class SitemapWriter:
+    """Splits the URL set over sitemap-<n>.xml files of at most limit URLs."""
+
+    def __init__(self, directory, limit):
+        self.directory = directory
+        self.limit = limit
+        self.pages = 0
+        self.count = 0
+        self.file = None
+
+    def add(self, url, lastmod=None):
+        if self.file is None or self.count == self.limit:
+            self._next_page()
+        entry = f'<url><loc>{escape(absolute(url))}</loc>'
+        if lastmod is not None:
+            entry += f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+        self.file.write(entry + '</url>\n')
+        self.count += 1
+
+    def _next_page(self):
+        self._close_page()
+        self.pages += 1
+        self.count = 0
+        self.file = open(self.directory / f'sitemap-{self.pages}.xml', 'w',
+                         encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        f'<urlset xmlns="{SITEMAP_NS}">\n')
+
+    def _close_page(self):
+        if self.file is not None:
+            self.file.write('</urlset>\n')
+            self.file.close()
+
+    def close(self):
+        self._close_page()
+        with open(self.directory / 'sitemap.xml', 'w',
+                  encoding='utf-8') as index:
+            index.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        f'<sitemapindex xmlns="{SITEMAP_NS}">\n')
+            for page in range(1, self.pages + 1):
+                url = absolute(reverse('shop:sitemap_page', args=[page]))
+                index.write(f'<sitemap><loc>{escape(url)}</loc></sitemap>\n')
+            index.write('</sitemapindex>\n')
+
+
+def product_entry(product):
+    return {
+        'id': product.id,
+        'title': product.name,
+        'link': absolute(product.get_absolute_url()),
+        'image_link': (absolute(product.image.url)
+                       if product.image else ''),
+        'price': str(product.price),
+        'category': product.category.name,
+        'updated': product.updated.isoformat(),
+    }
+
+
+def write_feeds(directory):
+    sitemap = SitemapWriter(directory, settings.SITEMAP_URLS_PER_FILE)
+    sitemap.add(reverse('shop:product_list'))
+    for category in Category.objects.iterator():
+        sitemap.add(category.get_absolute_url())
+
+    products = (Product.objects.filter(available=True)
+                .select_related('category')
+                .only('id', 'slug', 'name', 'image', 'price', 'updated',
+                      'category__name')
+                .order_by('id'))
+    with open(directory / 'products.xml', 'w', encoding='utf-8') as xml, \
+            open(directory / 'products.json', 'w', encoding='utf-8') as js:
+        xml.write('<?xml version="1.0" encoding="UTF-8"?>\n<products>\n')
+        js.write('{"products": [')
+        separator = '\n'
+        for product in products.iterator(
+                chunk_size=settings.FEEDS_BATCH_SIZE):
+            entry = product_entry(product)
+            sitemap.add(product.get_absolute_url(), product.updated)
+            xml.write('<product>' + ''.join(
+                f'<{key}>{escape(str(value))}</{key}>'
+                for key, value in entry.items()) + '</product>\n')
+            js.write(separator + json.dumps(entry))
+            separator = ',\n'
+        xml.write('</products>\n')
+        js.write('\n]}\n')
+    sitemap.close()
+
+
+def current_version():
+    try:
+        return (feeds_dir() / CURRENT).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def build_feeds():
+    """
+    Renders the sitemap and product feeds of the current catalog version
+    into their own directory and then points CURRENT at it, so readers
+    never see a half written set of files.
+    """
+    version = str(get_catalog_version())
+    root = feeds_dir()
+    target = root / version
+    if not target.exists():
+        root.mkdir(parents=True, exist_ok=True)
+        building = root / f'.{version}.{os.getpid()}'
+        building.mkdir()
+        try:
+            write_feeds(building)
+            building.rename(target)
+        except OSError:
+            # another process finished the same version first
+            if not target.exists():
+                raise
+        finally:
+            shutil.rmtree(building, ignore_errors=True)
+    current = current_version()
+    if current is None or int(current) < int(version):
+        pointer = root / f'.{CURRENT}.{os.getpid()}'
+        pointer.write_text(version)
+        os.replace(pointer, root / CURRENT)
+        _prune(root, keep={version, current})
+    return version
+
+
+def _prune(root, keep):
+    # the previous version stays for responses still streaming from it
+    for path in root.iterdir():
+        if path.is_dir() and not path.name.startswith('.') \
+                and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def feed_path(name):
+    """Returns the file of the current feeds, or None before the first build."""
+    version = current_version()
+    if version is None:
+        return None
+    if version != str(get_catalog_version()):
+        request_refresh()
+    return feeds_dir() / version / name
+
+
+def request_refresh():
+    from .tasks import refresh_feeds
+    version = get_catalog_version()
+    # one build per catalog version, whichever web process asks first
+    if caches[settings.SHARED_CACHE_ALIAS].add(
+            f'feeds-refresh:{version}', True,
+            timeout=settings.FEEDS_REFRESH_SECONDS):
+        refresh_feeds.delay()
@@ -0,0 +1,356 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from orders import checkout_queue
+from .models import Category, Product
+
+FLOWS = ('browse', 'detail', 'cart', 'checkout')
+CSRF_COOKIE = 'csrftoken'
+
+Response = namedtuple('Response', 'status location body')
+
+
+def parse_mix(value):
+    """Parses 'browse=50,detail=30,...' into flow weights."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise ValueError(f'Unknown flow {name!r}, expected one of '
+                             f'{", ".join(FLOWS)}')
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise ValueError('The mix needs a flow with a positive weight')
+    return mix
+
+
+class LocalTransport:
+    """
+    Requests through the test client in this process, one client and
+    so one cookie jar per virtual user. CSRF is checked as in production.
+    """
+
+    def __init__(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def request(self, method, path, data=None, headers=None):
+        response = getattr(self.client, method.lower())(
+            path, data, **{'HTTP_' + name.upper().replace('-', '_'): value
+                           for name, value in (headers or {}).items()})
+        return Response(response.status_code, response.get('Location'),
+                        response.content)
+
+    def cookie(self, name):
+        morsel = self.client.cookies.get(name)
+        return morsel.value if morsel is not None else None
+
+    def close(self):
+        # every thread has its own database connections
+        connections.close_all()
+
+
+class HttpTransport:
+    """Requests over HTTP to a running instance, one session per user."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None, headers=None):
+        headers = {'Referer': self.base_url + path, **(headers or {})}
+        response = self.session.request(method, self.base_url + path,
+                                        data=data, headers=headers,
+                                        allow_redirects=False)
+        # reading the body is part of the latency
+        return Response(response.status_code,
+                        response.headers.get('Location'), response.content)
+
+    def cookie(self, name):
+        return self.session.cookies.get(name)
+
+    def close(self):
+        self.session.close()
+
+
+class Pacer:
+    """Hands out request start times at a fixed rate to all users."""
+
+    def __init__(self, rps):
+        self.interval = 1 / rps
+        self.next = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.perf_counter()
+            # a user that fell behind does not earn a burst to catch up
+            self.next = max(self.next + self.interval, now)
+            start = self.next
+        delay = start - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.flows = defaultdict(int)
+        # measured across several requests, like order_placed
+        self.outcomes = set()
+
+    def start_flow(self, flow):
+        with self.lock:
+            self.flows[flow] += 1
+
+    def record(self, endpoint, seconds, status, ok, request=True):
+        with self.lock:
+            if not request:
+                self.outcomes.add(endpoint)
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed):
+        """Per endpoint: throughput, latency percentiles (ms), errors."""
+        rows = []
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            count = len(latencies)
+            rows.append({
+                'endpoint': endpoint,
+                'request': endpoint not in self.outcomes,
+                'requests': count,
+                'rps': count / elapsed,
+                'p50': percentile(latencies, 50) * 1000,
+                'p90': percentile(latencies, 90) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': latencies[-1] * 1000,
+                'errors': self.errors[endpoint] / count,
+                'statuses': dict(self.statuses[endpoint]),
+            })
+        return rows
+
+
+def percentile(ordered, p):
+    # nearest rank
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class VirtualUser:
+    """
+    A visitor walking through one flow after another. Throttled (429)
+    responses count as errors, they are what a real visitor would see.
+    """
+
+    def __init__(self, transport, catalog, pacer, stats, rng,
+                 process_checkouts=None):
+        self.transport = transport
+        self.categories, self.products = catalog
+        self.pacer = pacer
+        self.stats = stats
+        self.rng = rng
+        # drains the checkout queue before each status poll, for
+        # in-process runs without worker threads
+        self.process_checkouts = process_checkouts
+        self.response = None
+        self.until = None
+
+    def request(self, endpoint, method, path, data=None, expect=(200,)):
+        self.pacer.wait()
+        headers = {}
+        token = self.transport.cookie(CSRF_COOKIE)
+        if method == 'POST' and token:
+            headers['X-CSRFToken'] = token
+        started = time.perf_counter()
+        try:
+            self.response = self.transport.request(method, path, data,
+                                                   headers)
+            status = self.response.status
+        except Exception as exc:
+            # e.g. database is locked, reported by the exception's name
+            self.response = None
+            status = type(exc).__name__
+        self.stats.record(endpoint, time.perf_counter() - started, status,
+                          status in expect)
+        return status in expect
+
+    def browse(self):
+        self.request('product_list', 'GET', reverse('shop:product_list'))
+        if self.categories:
+            self.request('category', 'GET',
+                         self.rng.choice(self.categories))
+
+    def detail(self):
+        return self.request('product_detail', 'GET',
+                            self.rng.choice(self.products)[1])
+
+    def cart(self):
+        if not self.detail():
+            return False
+        # the cached catalog pages set no cookies, the badge hands out
+        # the CSRF token the way the page script fetches it
+        if self.transport.cookie(CSRF_COOKIE) is None:
+            self.request('cart_badge', 'GET', reverse('cart:cart_badge'))
+        product_id = self.rng.choice(self.products)[0]
+        return self.request('cart_add', 'POST',
+                            reverse('cart:cart_add', args=[product_id]),
+                            {'quantity': self.rng.randint(1, 3),
+                             'override': ''},
+                            expect=(302,))
+
+    def checkout(self):
+        if not self.cart():
+            return
+        path = reverse('orders:order_create')
+        if not self.request('order_form', 'GET', path):
+            return
+        started = time.perf_counter()
+        # 302 to the processing page when the checkout queue is on
+        placed = self.request('order_create', 'POST', path, {
+            'first_name': 'Load', 'last_name': 'Test',
+            'email': f'loadtest-{self.rng.randrange(10 ** 6)}'
+                     '@example.com',
+            'address': '1 Test Street', 'postal_code': '00000',
+            'city': 'Testville'}, expect=(200, 302))
+        status = self.response.status if self.response else 'error'
+        location = placed and self.response.location
+        if location:
+            status = self.wait_for_order(location)
+            placed = status == 'done'
+        # from submitting the form to an order in the database
+        self.stats.record('order_placed', time.perf_counter() - started,
+                          status, placed, request=False)
+        if location and placed:
+            # the processing page reloads into the confirmation, which
+            # empties the cart
+            self.request('order_checkout', 'GET', location)
+
+    def wait_for_order(self, location):
+        # polls as the processing page does, without its one second pause
+        path = location + 'status/'
+        while True:
+            if self.process_checkouts is not None:
+                self.process_checkouts()
+            if not self.request('checkout_status', 'GET', path):
+                return 'error'
+            status = json.loads(self.response.body)['status']
+            if status != 'pending':
+                return status
+            if time.perf_counter() >= self.until:
+                return 'timeout'
+
+    def run(self, mix, until):
+        self.until = until
+        flows, weights = zip(*mix.items())
+        while time.perf_counter() < until:
+            flow = self.rng.choices(flows, weights)[0]
+            self.stats.start_flow(flow)
+            getattr(self, flow)()
+
+
+def load_catalog():
+    categories = [category.get_absolute_url()
+                  for category in Category.objects.all()]
+    products = [(product.id, product.get_absolute_url())
+                for product in Product.objects.filter(available=True)
+                .only('id', 'slug')]
+    return categories, products
+
+
+def checkout_workers():
+    """
+    Threads doing the checkout worker's job for in-process runs, as many
+    as CHECKOUT_QUEUE_CONCURRENCY where the database can hand them
+    disjoint batches. Returns the stop function.
+    """
+    stop = threading.Event()
+
+    def work():
+        try:
+            while not stop.is_set():
+                try:
+                    handled = checkout_queue.process()
+                except Exception:
+                    # the batch rolled back, a Celery worker would retry
+                    handled = 0
+                if not handled:
+                    stop.wait(0.02)
+        finally:
+            connections.close_all()
+    count = settings.CHECKOUT_QUEUE_CONCURRENCY \
+        if connection.features.has_select_for_update_skip_locked else 1
+    threads = [threading.Thread(target=work) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+
+    def stop_workers():
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return stop_workers
+
+
+def run(mix, users, rps, duration, url=None, seed=None,
+        queued_checkout=False, inline_checkouts=False):
+    """
+    Runs the mix with users threads for duration seconds at no more than
+    rps requests per second, against url or, without one, in process.
+    queued_checkout turns the checkout queue on for in-process runs;
+    with inline_checkouts the users place the queued orders themselves
+    instead of worker threads, so one user runs on one thread.
+    Returns (Stats, elapsed seconds).
+    """
+    if users < 1 or rps <= 0:
+        raise ValueError('--users and --rps must be positive')
+    catalog = load_catalog()
+    if not catalog[1]:
+        raise ValueError('The catalog has no available products')
+    if queued_checkout and url:
+        raise ValueError('A running instance has the checkout queue on '
+                         'when started with CHECKOUT_QUEUE=1')
+    pacer = Pacer(rps)
+    stats = Stats()
+    seeds = random.Random(seed)
+    started = time.perf_counter()
+    until = started + duration
+
+    inline = checkout_queue.process if inline_checkouts else None
+
+    def user(user_seed):
+        transport = HttpTransport(url) if url else LocalTransport()
+        try:
+            VirtualUser(transport, catalog, pacer, stats,
+                        random.Random(user_seed), inline).run(mix, until)
+        finally:
+            transport.close()
+
+    with override_settings(CHECKOUT_QUEUE_ENABLED=True) if queued_checkout \
+            else nullcontext():
+        stop_workers = checkout_workers() \
+            if queued_checkout and not inline_checkouts else None
+        try:
+            with ThreadPoolExecutor(max_workers=users) as pool:
+                for future in [pool.submit(user, seeds.random())
+                               for _ in range(users)]:
+                    future.result()
+        finally:
+            if stop_workers:
+                stop_workers()
+    return stats, time.perf_counter() - started
@@ -0,0 +1,79 @@
+import argparse
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from shop import loadtest
+
+
+def positive(type_):
+    def parse(value):
+        number = type_(value)
+        if number <= 0:
+            raise argparse.ArgumentTypeError(f'{value} is not positive')
+        return number
+    # argparse names the type in 'invalid int value'
+    parse.__name__ = type_.__name__
+    return parse
+
+
+class Command(BaseCommand):
+    help = ('Drive the shop with a mix of browse, detail, cart and checkout '
+            'flows at a target rate and report throughput, latency '
+            'percentiles and error rates per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running instance, e.g. '
+                                 'http://127.0.0.1:8000; without it the '
+                                 'requests go through the test client in '
+                                 'this process')
+        parser.add_argument('--users', type=positive(int), default=20,
+                            help='Virtual users, each a thread with its own '
+                                 'session')
+        parser.add_argument('--rps', type=positive(float), default=50,
+                            help='Target requests per second, all users')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run')
+        parser.add_argument('--mix', default='browse=50,detail=30,cart=15,'
+                                             'checkout=5',
+                            help='Relative weights of the flows')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--checkout-queue', action='store_true',
+                            help='In process, place orders through the '
+                                 'checkout queue with '
+                                 'CHECKOUT_QUEUE_CONCURRENCY worker threads')
+
+    def handle(self, *args, **options):
+        if not options['url']:
+            # in process, the span log of every request would bury the
+            # report; spans are still built, so tracing costs the same
+            logging.getLogger('tea_shop.spans').setLevel(logging.WARNING)
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            stats, elapsed = loadtest.run(
+                mix, options['users'], options['rps'], options['duration'],
+                url=options['url'], seed=options['seed'],
+                queued_checkout=options['checkout_queue'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        rows = stats.summary(elapsed)
+        requests = [row for row in rows if row['request']]
+        total = sum(row['requests'] for row in requests)
+        errors = sum(row['errors'] * row['requests'] for row in requests)
+        self.stdout.write(f'{"endpoint":16} {"requests":>8} {"rps":>7} '
+                          f'{"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} '
+                          f'{"max ms":>8} {"errors":>7}  statuses')
+        for row in rows:
+            self.stdout.write(
+                f'{row["endpoint"]:16} {row["requests"]:8d} '
+                f'{row["rps"]:7.1f} {row["p50"]:8.1f} {row["p90"]:8.1f} '
+                f'{row["p99"]:8.1f} {row["max"]:8.1f} '
+                f'{row["errors"]:7.1%}  {row["statuses"]}')
+        flows = ', '.join(f'{flow} {count}'
+                          for flow, count in sorted(stats.flows.items()))
+        summary = (f'{total} requests in {elapsed:.1f}s '
+                   f'({total / elapsed:.1f}/s of {options["rps"]:g} '
+                   f'targeted), {errors / max(total, 1):.1%} errors; '
+                   f'flows: {flows}')
+        style = self.style.SUCCESS if not errors else self.style.WARNING
+        self.stdout.write(style(summary))
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'name'], name='product_cat_available_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['name'], name='product_available_name_idx'),
+        ),
+    ]
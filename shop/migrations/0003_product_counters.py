@@ -0,0 +1,51 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_product_cat_available_name_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCounterDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('cart_adds', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='cart_adds',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='views',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', '-popularity', 'name'], name='product_cat_available_pop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['-popularity', 'name'], name='product_available_pop_idx'),
+        ),
+        migrations.AddField(
+            model_name='productcounterdelta',
+            name='product',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shop.product'),
+        ),
+    ]
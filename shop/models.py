@@ -36,6 +36,10 @@ class Product(models.Model):
     available = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # incremented in bulk by shop.counters.flush
+    views = models.PositiveBigIntegerField(default=0, editable=False)
+    cart_adds = models.PositiveBigIntegerField(default=0, editable=False)
+    popularity = models.PositiveBigIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['name']
@@ -43,6 +47,22 @@ class Product(models.Model):
             models.Index(fields=['id', 'slug']),
             models.Index(fields=['name']),
             models.Index(fields=['-created']),
+            # product_list: filter(available=True[, category]).order_by('name');
+            # partial rather than led by available, since the ORM renders
+            # the filter as a bare boolean term, not an equality
+            models.Index(fields=['category', 'name'],
+                         condition=models.Q(available=True),
+                         name='product_cat_available_name_idx'),
+            models.Index(fields=['name'],
+                         condition=models.Q(available=True),
+                         name='product_available_name_idx'),
+            # product_list?sort=popular
+            models.Index(fields=['category', '-popularity', 'name'],
+                         condition=models.Q(available=True),
+                         name='product_cat_available_pop_idx'),
+            models.Index(fields=['-popularity', 'name'],
+                         condition=models.Q(available=True),
+                         name='product_available_pop_idx'),
         ]
 
     def __str__(self):
@@ -51,3 +71,18 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('shop:product_detail',
                        args=[self.id, self.slug])
+
+
+class ProductCounterDelta(models.Model):
+    """
+    Views and cart adds a web process counted since its last spill,
+    waiting to be folded into Product by shop.counters.flush.
+    """
+    # no constraint, a product may be deleted while its counts wait
+    product = models.ForeignKey(Product,
+                                related_name='+',
+                                on_delete=models.DO_NOTHING,
+                                db_constraint=False)
+    views = models.PositiveIntegerField(default=0)
+    cart_adds = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
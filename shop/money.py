@@ -0,0 +1,101 @@
+from decimal import ROUND_HALF_UP, Decimal
+from functools import total_ordering
+
+_ONE = Decimal(1)
+# '.00' to '.99', formatting is on every rendered price
+_FRACTIONS = ['.%02d' % cents for cents in range(100)]
+
+
+def format_cents(cents):
+    """str(Money(cents)) without building a Money, for per-line prices."""
+    if cents < 0:
+        return '-' + str(-cents // 100) + _FRACTIONS[-cents % 100]
+    return str(cents // 100) + _FRACTIONS[cents % 100]
+
+
+@total_ordering
+class Money:
+    """
+    An amount in integer cents. Sums and multiples by quantities are
+    plain int arithmetic, so a cart total costs no Decimal parsing or
+    context lookups; Decimal is only used to cross the model boundary.
+
+    Converting from a Decimal rounds half up to whole cents; everything
+    else is exact.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = cents
+
+    @classmethod
+    def from_decimal(cls, value):
+        cents = value.scaleb(2)
+        if cents != cents.to_integral_value():
+            cents = cents.quantize(_ONE, rounding=ROUND_HALF_UP)
+        return cls(int(cents))
+
+    @classmethod
+    def parse(cls, value):
+        """Reads the str() of a Decimal or Money, like '12.50'."""
+        units, _, fraction = value.partition('.')
+        try:
+            if len(fraction) > 2 or not fraction.isdigit():
+                raise ValueError(value)
+            cents = abs(int(units or '0')) * 100 + int(fraction.ljust(2, '0'))
+        except ValueError:
+            # exponents, sub-cent digits, no fraction
+            return cls.from_decimal(Decimal(value))
+        return cls(-cents if units.startswith('-') else cents)
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __str__(self):
+        return format_cents(self.cents)
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # sum() starts from 0
+        if other == 0 and isinstance(other, int):
+            return self
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, quantity):
+        if isinstance(quantity, int):
+            return Money(self.cents * quantity)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
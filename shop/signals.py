@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalog import bump_catalog_version
+from .models import Category, Product
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
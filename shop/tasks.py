@@ -0,0 +1,12 @@
+from celery import shared_task
+from . import counters, feeds
+
+
+@shared_task
+def refresh_feeds():
+    return feeds.build_feeds()
+
+
+@shared_task
+def flush_product_counters():
+    return counters.flush()
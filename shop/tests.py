@@ -1,7 +1,29 @@
-from decimal import Decimal
-from django.test import TestCase
+import json
+import multiprocessing
+import random
+import shutil
+import tempfile
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from unittest.mock import patch
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends import locmem
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.db import connection
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Category, Product
+from config.testing import ExplainMixin
+from orders.models import Order, QueuedCheckout
+from reports.rollups import rebuild_days
+from . import catalog, counters, feeds, loadtest, views
+from .catalog import bump_catalog_version
+from .models import Category, Product, ProductCounterDelta
+from .money import Money
 
 
 class ShopModelTests(TestCase):
@@ -82,3 +104,559 @@ class ShopViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'shop/product/detail.html')
         self.assertEqual(response.context['product'], self.product)
+
+
+class CatalogPageCacheTests(TestCase):
+    """Тесты кеширования страниц каталога"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Electronics',
+            slug='electronics'
+        )
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Smartphone',
+            slug='smartphone',
+            price=Decimal('699.99'),
+            available=True
+        )
+
+    def test_cached_list_skips_view(self):
+        """Повторный запрос отдается из кеша без view и шаблонов"""
+        url = reverse('shop:product_list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.templates, [])
+        self.assertContains(response, 'Smartphone')
+
+    def test_page_not_user_specific(self):
+        """Страница не зависит от cookie пользователя"""
+        self.client.post(
+            reverse('cart:cart_add', args=[self.product.id]),
+            data={'quantity': '1', 'override': False}
+        )
+        response = self.client.get(
+            reverse('shop:product_detail',
+                    args=[self.product.id, self.product.slug]))
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertNotContains(response, 'Your cart:')
+
+    def test_catalog_reads_cached_apart_from_pages(self):
+        """Страница рендерится без запросов к базе по кешу каталога"""
+        request = RequestFactory().get('/')
+        # below the view counter and the page cache
+        product_detail = views.product_detail.__wrapped__.__wrapped__
+        views.product_list.__wrapped__(request)
+        product_detail(request, self.product.id, self.product.slug)
+        with self.assertNumQueries(0):
+            response = views.product_list.__wrapped__(request)
+            self.assertContains(response, 'Smartphone')
+            response = product_detail(
+                request, self.product.id, self.product.slug)
+            self.assertContains(response, 'Smartphone')
+            with self.assertRaises(Http404):
+                views.product_list.__wrapped__(request, 'missing')
+
+    def test_product_change_invalidates(self):
+        """Изменение товара сбрасывает кеш страниц"""
+        url = reverse('shop:product_list')
+        self.client.get(url)
+        self.product.name = 'Feature phone'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Feature phone')
+
+
+
+class CatalogIndexTests(ExplainMixin, TestCase):
+    """Проверка использования индексов горячими запросами каталога"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Electronics',
+            slug='electronics'
+        )
+
+    def test_product_list_uses_partial_index(self):
+        """Список доступных товаров"""
+        self.assertQueriesUseIndex(
+            'product_available_name_idx',
+            self.client.get, reverse('shop:product_list'))
+
+    def test_category_list_uses_composite_index(self):
+        """Список доступных товаров категории"""
+        self.assertQueriesUseIndex(
+            'product_cat_available_name_idx',
+            self.client.get, self.category.get_absolute_url())
+
+    def test_popular_list_uses_partial_index(self):
+        """Список доступных товаров по популярности"""
+        # through the helper, the view's bestseller query alone would use
+        # product_available_pop_idx
+        self.assertQueriesUseIndex(
+            'product_available_pop_idx',
+            catalog.available_products, None, 'popular')
+        self.assertQueriesUseIndex(
+            'product_cat_available_pop_idx',
+            self.client.get, self.category.get_absolute_url(),
+            {'sort': 'popular'})
+
+
+class ProductCounterTests(TestCase):
+    """Тесты счетчиков просмотров и добавлений в корзину"""
+
+    def setUp(self):
+        counters.buffer.take()
+        self.addCleanup(counters.buffer.take)
+        self.category = Category.objects.create(name='Tea', slug='tea')
+        self.green = Product.objects.create(
+            category=self.category, name='Green', slug='green',
+            price=Decimal('5.00'))
+        self.black = Product.objects.create(
+            category=self.category, name='Black', slug='black',
+            price=Decimal('4.00'))
+
+    def counts(self, product):
+        return dict(counters.buffer.counts).get(product.id)
+
+    def test_cached_views_counted(self):
+        """Просмотры из кеша страниц учитываются, 404 нет"""
+        url = self.green.get_absolute_url()
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(reverse('shop:product_detail',
+                                args=[self.green.id, 'wrong']))
+        self.assertEqual(self.counts(self.green), [2, 0])
+
+    def test_cart_add_counted(self):
+        """Добавление в корзину учитывается без записи в базу"""
+        url = reverse('cart:cart_add', args=[self.black.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {'quantity': 1, 'override': ''})
+        self.assertFalse([q for q in queries
+                          if 'shop_product' in q['sql']
+                          and not q['sql'].startswith('SELECT')])
+        self.client.post(reverse('cart:cart_add_json', args=[self.black.id]),
+                         {'quantity': 2, 'override': ''})
+        self.assertEqual(self.counts(self.black), [0, 2])
+
+    def test_flush_one_update(self):
+        """Дельты всех процессов сводятся одним UPDATE"""
+        for _ in range(3):
+            counters.record_view(self.green.id)
+        counters.record_cart_add(self.black.id)
+        self.assertEqual(counters.buffer.spill(), 2)
+        # another process
+        counters.record_view(self.black.id)
+        counters.buffer.spill()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counters.flush(), 2)
+        self.assertEqual(
+            len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        self.green.refresh_from_db()
+        self.black.refresh_from_db()
+        self.assertEqual((self.green.views, self.green.cart_adds,
+                          self.green.popularity), (3, 0, 3))
+        self.assertEqual((self.black.views, self.black.cart_adds,
+                          self.black.popularity), (1, 1, 11))
+        self.assertFalse(ProductCounterDelta.objects.exists())
+        self.assertEqual(counters.flush(), 0)
+
+    def test_flush_in_batches(self):
+        """Большой хвост дельт сводится пачками"""
+        for _ in range(5):
+            counters.record_view(self.green.id)
+            counters.buffer.spill()
+        counters.flush(batch_size=2)
+        self.green.refresh_from_db()
+        self.assertEqual(self.green.views, 5)
+        self.assertFalse(ProductCounterDelta.objects.exists())
+
+    @override_settings(PRODUCT_COUNTERS_SPILL_EVENTS=3)
+    def test_spill_when_full(self):
+        """Накопленные события сбрасываются в базу по порогу"""
+        counters.record_view(self.green.id)
+        counters.record_view(self.green.id)
+        self.assertFalse(ProductCounterDelta.objects.exists())
+        counters.record_cart_add(self.green.id)
+        delta = ProductCounterDelta.objects.get()
+        self.assertEqual((delta.views, delta.cart_adds), (2, 1))
+        self.assertEqual(counters.buffer.events, 0)
+
+    def test_spill_at_exit_registered_by_first_event(self):
+        """Сброс при выходе регистрируется только после первого события"""
+        buffer = counters.CounterBuffer()
+        with patch('shop.counters.atexit.register') as register:
+            buffer.spill()
+            register.assert_not_called()
+            with self.settings(PRODUCT_COUNTERS_SPILL_AT_EXIT=True):
+                buffer.add(self.green.id, 'views')
+                buffer.add(self.green.id, 'views')
+        register.assert_called_once_with(buffer.spill)
+        with patch('shop.counters.atexit.register') as register:
+            counters.CounterBuffer().add(self.green.id, 'views')
+        register.assert_not_called()
+
+    def test_failed_spill_keeps_counts(self):
+        """Неудачный сброс не теряет счетчики"""
+        counters.record_view(self.green.id)
+        with patch('django.db.models.query.QuerySet.bulk_create',
+                          side_effect=RuntimeError('database is down')), \
+                self.assertLogs('shop.counters', 'ERROR'):
+            self.assertEqual(counters.buffer.spill(), 0)
+        counters.record_view(self.green.id)
+        counters.buffer.spill()
+        self.assertEqual(ProductCounterDelta.objects.get().views, 2)
+
+    def test_popular_sort_and_badge(self):
+        """Сортировка по популярности и отметка бестселлера"""
+        counters.record_cart_add(self.black.id)
+        counters.buffer.spill()
+        counters.flush()
+        bump_catalog_version()
+        response = self.client.get(reverse('shop:product_list'),
+                                   {'sort': 'popular'})
+        self.assertEqual(list(response.context['products']),
+                         [self.black, self.green])
+        self.assertEqual(response.context['bestsellers'],
+                         {self.black.id})
+        self.assertContains(response, 'Bestseller', count=1)
+        response = self.client.get(reverse('shop:product_list'),
+                                   {'sort': 'bogus'})
+        self.assertEqual(list(response.context['products']),
+                         [self.black, self.green])
+        self.assertEqual(response.context['sort'], 'name')
+
+
+class AutocompleteTests(TestCase):
+    """Тесты подсказок при поиске"""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Oolong',
+            slug='oolong'
+        )
+        for name, slug in [('Da Hong Pao', 'da-hong-pao'),
+                           ('Dong Ding', 'dong-ding'),
+                           ('Tè Verde', 'te-verde')]:
+            Product.objects.create(
+                category=self.category,
+                name=name,
+                slug=slug,
+                price=Decimal('10.00'),
+                available=True
+            )
+
+    def lookup(self, query, **params):
+        response = self.client.get(reverse('shop:autocomplete'),
+                                   {'q': query, **params})
+        return [r['label'] for r in response.json()['results']]
+
+    def test_prefix_of_any_word(self):
+        """Поиск по началу любого слова"""
+        self.assertEqual(self.lookup('hong'), ['Da Hong Pao'])
+        self.assertEqual(self.lookup('d'), ['Da Hong Pao', 'Dong Ding'])
+
+    def test_case_and_diacritics_insensitive(self):
+        """Регистр и диакритика не важны"""
+        self.assertEqual(self.lookup('TE V'), ['Tè Verde'])
+        self.assertEqual(self.lookup('tè'), ['Tè Verde'])
+
+    def test_categories_included(self):
+        """В подсказки попадают категории"""
+        self.assertEqual(self.lookup('oolo'), ['Oolong'])
+
+    @override_settings(AUTOCOMPLETE_SCAN_LIMIT=1)
+    def test_ranked_by_popularity(self):
+        """Популярные товары выше"""
+        from orders.models import Order, OrderItem
+        order = Order.objects.create(first_name='John', last_name='Doe',
+                                     email='john@example.com',
+                                     address='123 Main St',
+                                     postal_code='12345', city='New York')
+        product = Product.objects.get(slug='dong-ding')
+        OrderItem.objects.create(order=order, product=product,
+                                 price=product.price)
+        rebuild_days([order.created.date()])
+        bump_catalog_version()
+        self.assertEqual(self.lookup('d'), ['Dong Ding', 'Da Hong Pao'])
+        self.assertEqual(self.lookup('d', limit=1), ['Dong Ding'])
+
+    def test_rebuild_does_not_scan_order_items(self):
+        """Перестройка индекса не агрегирует позиции заказов"""
+        bump_catalog_version()
+        with CaptureQueriesContext(connection) as queries:
+            self.lookup('d')
+        self.assertFalse(any('orders_orderitem' in q['sql']
+                             for q in queries))
+
+    def test_category_slug_not_shadowed(self):
+        """Категория со slug autocomplete доступна"""
+        category = Category.objects.create(name='Autocomplete',
+                                           slug='autocomplete')
+        response = self.client.get(category.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['category'], category)
+
+    def test_index_rebuilt_on_catalog_change(self):
+        """Индекс перестраивается при изменении каталога"""
+        self.assertEqual(self.lookup('sencha'), [])
+        Product.objects.create(category=self.category, name='Sencha',
+                               slug='sencha', price=Decimal('5.00'))
+        self.assertEqual(self.lookup('sencha'), ['Sencha'])
+
+
+
+@override_settings(SITE_URL='https://tea.example', SITEMAP_URLS_PER_FILE=2)
+class FeedTests(TestCase):
+    """Тесты карты сайта и фида товаров"""
+
+    def setUp(self):
+        feeds_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, feeds_dir)
+        setting = override_settings(FEEDS_DIR=feeds_dir)
+        setting.enable()
+        self.addCleanup(setting.disable)
+        caches[settings.SHARED_CACHE_ALIAS].clear()
+        self.category = Category.objects.create(name='Green', slug='green')
+        for name, available in [('Sencha', True), ('Gyokuro', True),
+                                ('Bancha', False)]:
+            Product.objects.create(category=self.category, name=name,
+                                   slug=name.lower(), price=Decimal('7.50'),
+                                   available=available)
+
+    def fetch(self, name, *args):
+        response = self.client.get(reverse(f'shop:{name}', args=args))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def locs(self, content):
+        return [el.text for el in ElementTree.fromstring(content).iter()
+                if el.tag.endswith('loc')]
+
+    def test_sitemap_index_and_pages(self):
+        """Индекс ссылается на страницы, в них доступные товары"""
+        pages = self.locs(self.fetch('sitemap'))
+        self.assertEqual(pages, [
+            'https://tea.example/sitemap-1.xml',
+            'https://tea.example/sitemap-2.xml',
+        ])
+        urls = [url for page in (1, 2)
+                for url in self.locs(self.fetch('sitemap_page', page))]
+        self.assertEqual(len(urls), 4)
+        self.assertIn('https://tea.example/green/', urls)
+        self.assertFalse(any('bancha' in url for url in urls))
+
+    def test_product_feeds(self):
+        """Фид товаров в XML и JSON"""
+        products = json.loads(self.fetch('product_feed_json'))['products']
+        self.assertEqual([p['title'] for p in products],
+                         ['Sencha', 'Gyokuro'])
+        self.assertEqual(products[0]['price'], '7.50')
+        self.assertTrue(products[0]['link'].startswith('https://tea.example/'))
+        root = ElementTree.fromstring(self.fetch('product_feed_xml'))
+        self.assertEqual([el.text for el in root.iter('title')],
+                         ['Sencha', 'Gyokuro'])
+
+    def test_served_without_queries(self):
+        """Готовые файлы отдаются без запросов к базе"""
+        feeds.build_feeds()
+        with self.assertNumQueries(0):
+            self.fetch('sitemap')
+            self.fetch('product_feed_json')
+
+    def test_rebuilt_on_catalog_change(self):
+        """После изменения каталога фид перестраивается"""
+        self.fetch('product_feed_json')
+        Product.objects.create(category=self.category, name='Matcha',
+                               slug='matcha', price=Decimal('20.00'))
+        self.fetch('product_feed_json')
+        products = json.loads(self.fetch('product_feed_json'))['products']
+        self.assertIn('Matcha', [p['title'] for p in products])
+
+    def test_pending_first_build(self):
+        """До первой сборки возвращается 503"""
+        with patch('shop.tasks.refresh_feeds.delay') as delay:
+            response = self.client.get(reverse('shop:sitemap'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        delay.assert_called_once()
+
+    def test_built_by_another_process(self):
+        """Фид, собранный другим процессом, отдается без пересборки"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        # the catalog cache on a directory both processes see, as on the
+        # volume web and celery-batch share
+        shared = override_settings(CACHES={
+            **settings.CACHES,
+            settings.CATALOG_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': cache_dir,
+            },
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        bump_catalog_version()
+
+        def build_in_worker():
+            # nothing of this process's memory but the database
+            for entries in (*locmem._caches.values(),
+                            *locmem._expire_info.values()):
+                entries.clear()
+            catalog.catalog_cache.local.clear()
+            feeds.build_feeds()
+
+        worker = multiprocessing.get_context('fork').Process(
+            target=build_in_worker)
+        worker.start()
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        with patch('shop.tasks.refresh_feeds.delay') as delay:
+            self.fetch('sitemap')
+        delay.assert_not_called()
+
+    def test_missing_page(self):
+        """Несуществующая страница карты сайта"""
+        feeds.build_feeds()
+        response = self.client.get(reverse('shop:sitemap_page', args=[9]))
+        self.assertEqual(response.status_code, 404)
+
+
+class MoneyTests(SimpleTestCase):
+    """Тесты денежного типа: результаты совпадают с Decimal"""
+
+    CASES = 2000
+
+    def setUp(self):
+        self.random = random.Random(45)
+
+    def price(self):
+        # DecimalField(max_digits=6, decimal_places=2)
+        return Decimal(self.random.randint(0, 999_999)).scaleb(-2)
+
+    def test_round_trip(self):
+        """Цена переживает преобразования без потерь"""
+        for _ in range(self.CASES):
+            price = self.price()
+            money = Money.from_decimal(price)
+            self.assertEqual(str(money), str(price))
+            self.assertEqual(Money.parse(str(price)), money)
+            self.assertEqual(str(money.to_decimal()), str(price))
+
+    def test_cart_totals_match_decimal(self):
+        """Суммы строк и корзины совпадают с расчетом в Decimal"""
+        for _ in range(self.CASES // 10):
+            lines = [(self.price(), self.random.randint(1, 20))
+                     for _ in range(self.random.randint(1, 50))]
+            expected = sum(price * quantity for price, quantity in lines)
+            total = sum((Money.from_decimal(price) * quantity
+                         for price, quantity in lines), Money())
+            self.assertEqual(str(total), str(expected))
+            self.assertEqual(total.to_decimal(), expected)
+            for price, quantity in lines:
+                self.assertEqual(str(Money.from_decimal(price) * quantity),
+                                 str(price * quantity))
+
+    def test_rounding_is_half_up(self):
+        """Доли цента округляются половиной вверх"""
+        for _ in range(self.CASES):
+            value = Decimal(self.random.randint(-10 ** 7, 10 ** 7)).scaleb(
+                -self.random.randint(0, 5))
+            expected = value.quantize(Decimal('0.01'),
+                                      rounding=ROUND_HALF_UP)
+            self.assertEqual(str(Money.from_decimal(value)), str(expected))
+            self.assertEqual(Money.parse(str(value)),
+                             Money.from_decimal(value))
+
+    def test_arithmetic(self):
+        """Арифметика и сравнения"""
+        a, b = Money.parse('12.50'), Money.parse('0.75')
+        self.assertEqual(a + b, Money(1325))
+        self.assertEqual(b - a, Money.parse('-11.75'))
+        self.assertEqual(str(b - a), '-11.75')
+        self.assertEqual(3 * b, b * 3)
+        self.assertLess(b, a)
+        self.assertFalse(Money())
+        with self.assertRaises(TypeError):
+            a * Decimal('1.5')
+        with self.assertRaises(TypeError):
+            a + Decimal('1.00')
+
+
+class LoadTestTests(TransactionTestCase):
+    """Тесты генератора нагрузки"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Tea', slug='tea')
+        for i in range(3):
+            Product.objects.create(category=category, name=f'Tea {i}',
+                                   slug=f'tea-{i}', price=Decimal('5.00'))
+
+    def test_flows_in_process(self):
+        """Все сценарии проходят без ошибок"""
+        mix = loadtest.parse_mix('browse=1,detail=1,cart=1,checkout=1')
+        stats, elapsed = loadtest.run(mix, users=2, rps=40, duration=1,
+                                      seed=1)
+        rows = {row['endpoint']: row for row in stats.summary(elapsed)}
+        self.assertEqual(sum(row['errors'] for row in rows.values()), 0,
+                         rows)
+        self.assertIn('cart_add', rows)
+        self.assertLessEqual(sum(row['requests'] for row in rows.values()
+                                 if row['request']),
+                             40 * elapsed + 1)
+        self.assertEqual(Order.objects.count(),
+                         rows.get('order_create', {}).get('requests', 0))
+
+    def test_queued_checkout_in_process(self):
+        """Заказы через очередь оформления размещаются до конца прогона"""
+        mix = loadtest.parse_mix('checkout=1')
+        # one thread that places the queued orders itself
+        stats, elapsed = loadtest.run(mix, users=1, rps=60, duration=1,
+                                      seed=2, queued_checkout=True,
+                                      inline_checkouts=True)
+        rows = {row['endpoint']: row for row in stats.summary(elapsed)}
+        self.assertEqual(sum(row['errors'] for row in rows.values()), 0,
+                         rows)
+        checkouts = rows['order_create']['requests']
+        self.assertGreater(checkouts, 0)
+        self.assertEqual(rows['order_create']['statuses'], {302: checkouts})
+        self.assertFalse(rows['order_placed']['request'])
+        self.assertEqual(rows['order_placed']['statuses'],
+                         {'done': checkouts})
+        self.assertEqual(rows['order_checkout']['requests'], checkouts)
+        self.assertEqual(Order.objects.count(), checkouts)
+        self.assertFalse(QueuedCheckout.objects.exclude(
+            status=QueuedCheckout.DONE).exists())
+        with self.assertRaises(ValueError):
+            loadtest.run(mix, users=1, rps=1, duration=0,
+                         url='http://127.0.0.1:1', queued_checkout=True)
+
+    def test_command_report(self):
+        """Команда печатает задержки по каждому адресу"""
+        out = StringIO()
+        call_command('loadtest', duration=0.5, rps=20, users=1,
+                     mix='detail=1', stdout=out)
+        self.assertIn('product_detail', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('loadtest', mix='search=1', stdout=out)
+
+    def test_command_needs_positive_rate_and_users(self):
+        """Нулевые --rps и --users отклоняются"""
+        for args in (['--rps', '0'], ['--users', '0'], ['--rps', '-1']):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command('loadtest', *args, duration=0.1)
+        for options in ({'rps': 0}, {'users': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('loadtest', duration=0.1, **options)
+
+    def test_percentile(self):
+        """Перцентиль по ближайшему рангу"""
+        ordered = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(ordered, 50), 50)
+        self.assertEqual(loadtest.percentile(ordered, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 90), 7)
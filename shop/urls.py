@@ -5,6 +5,14 @@ app_name = 'shop'
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
+    # two segments, so no category slug is shadowed
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('sitemap.xml', views.sitemap, name='sitemap'),
+    path('sitemap-<int:page>.xml', views.sitemap_page, name='sitemap_page'),
+    path('feeds/products.xml', views.product_feed_xml,
+         name='product_feed_xml'),
+    path('feeds/products.json', views.product_feed_json,
+         name='product_feed_json'),
     path('<slug:category_slug>/', views.product_list,
          name='product_list_by_category'),
     path('<int:id>/<slug:slug>/', views.product_detail,
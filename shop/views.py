@@ -1,32 +1,119 @@
-from zoneinfo import available_timezones
+from functools import lru_cache, wraps
 
-from django.shortcuts import render, get_object_or_404
-from .models import Category, Product
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.views.decorators.cache import cache_page
+from . import counters, feeds
+from .autocomplete import get_index
+from .catalog import (SORTS, available_products, bestseller_ids,
+                      catalog_categories, get_catalog_version, get_product,
+                      recommended_products)
 from cart.forms import CartAddProductForm
 
 
+def cache_catalog_page(view):
+    # the catalog version is part of the key, so a change to any product
+    # or category makes every cached page unreachable at once
+    @lru_cache(maxsize=4)
+    def cached_view(version):
+        return cache_page(settings.CATALOG_PAGE_CACHE_TIMEOUT,
+                          cache=settings.CATALOG_CACHE_ALIAS,
+                          key_prefix=f'catalog.{version}')(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        return cached_view(get_catalog_version())(request, *args, **kwargs)
+    return wrapped
+
+
+def count_product_views(view):
+    # outside the page cache, pages served from it are views too
+    @wraps(view)
+    def wrapped(request, id, slug):
+        response = view(request, id, slug)
+        if request.method == 'GET' and response.status_code == 200:
+            counters.record_view(id)
+        return response
+    return wrapped
+
+
+@cache_catalog_page
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
+    categories = catalog_categories()
     if category_slug:
-        category = get_object_or_404(Category,
-                                     slug=category_slug)
-        products = products.filter(category=category)
+        category = next((c for c in categories if c.slug == category_slug),
+                        None)
+        if category is None:
+            raise Http404
+    sort = request.GET.get('sort')
+    if sort not in SORTS:
+        sort = 'name'
+    products = available_products(category.id if category else None, sort)
     return render(request,
                   'shop/product/list.html',
                   {'category': category,
                    'categories': categories,
-                   'products': products})
+                   'products': products,
+                   'sort': sort,
+                   'bestsellers': bestseller_ids()})
 
 
+@count_product_views
+@cache_catalog_page
 def product_detail(request, id, slug):
-    product = get_object_or_404(Product,
-                                id=id,
-                                slug=slug,
-                                available=True)
+    product = get_product(id)
+    if product is None or product.slug != slug:
+        raise Http404
     cart_product_form = CartAddProductForm()
     return render(request,
                   'shop/product/detail.html',
                   {'product': product,
-                   'cart_product_form': cart_product_form})
+                   'is_bestseller': product.id in bestseller_ids(),
+                   'cart_product_form': cart_product_form,
+                   'recommended_products': recommended_products(product.id)})
+
+
+
+def autocomplete(request):
+    try:
+        limit = max(1, min(int(request.GET.get('limit', '')),
+                           settings.AUTOCOMPLETE_MAX_RESULTS))
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_MAX_RESULTS
+    results = get_index().lookup(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': results})
+
+
+
+def serve_feed(name, content_type):
+    # files pre-rendered by feeds.build_feeds, no queries or templates here
+    path = feeds.feed_path(name)
+    if path is None:
+        feeds.request_refresh()
+        path = feeds.feed_path(name)
+    if path is None:
+        response = HttpResponse('The feed is being generated.', status=503)
+        response['Retry-After'] = '30'
+        return response
+    try:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+    except FileNotFoundError:
+        raise Http404
+
+
+def sitemap(request):
+    return serve_feed('sitemap.xml', 'application/xml')
+
+
+def sitemap_page(request, page):
+    return serve_feed(f'sitemap-{page}.xml', 'application/xml')
+
+
+def product_feed_xml(request):
+    return serve_feed('products.xml', 'application/xml')
+
+
+def product_feed_json(request):
+    return serve_feed('products.json', 'application/json')